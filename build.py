@@ -2,12 +2,17 @@
 
 import os
 import shutil
+import sys
 from pathlib import Path
 from setuptools import Extension
 from setuptools.command.build_ext import build_ext as _build_ext
 from Cython.Build import cythonize
 import numpy as np
 
+# prange in the gps kernels runs in parallel where OpenMP is available
+# (the default compilers on macOS and Windows need extra setup for it).
+OPENMP_FLAGS = ["-fopenmp"] if sys.platform.startswith("linux") else []
+
 
 class build_ext(_build_ext):
     """Custom build_ext to handle build directory and file placement."""
@@ -41,7 +46,14 @@ def build(setup_kwargs):
             include_dirs=[np.get_include()],
             language="c++",
             extra_compile_args=["-std=c++11"],
-        )
+        ),
+        Extension(
+            "libxrk.gps_kernels",
+            sources=["src/libxrk/gps_kernels.pyx"],
+            include_dirs=[np.get_include()],
+            extra_compile_args=OPENMP_FLAGS,
+            extra_link_args=OPENMP_FLAGS,
+        ),
     ]
 
     ext_modules = cythonize(
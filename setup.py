@@ -1,9 +1,14 @@
 """Setup script for compiling Cython extensions."""
 
+import sys
 from setuptools import setup, Extension
 from Cython.Build import cythonize
 import numpy as np
 
+# prange in the gps kernels runs in parallel where OpenMP is available
+# (the default compilers on macOS and Windows need extra setup for it).
+OPENMP_FLAGS = ["-fopenmp"] if sys.platform.startswith("linux") else []
+
 extensions = [
     Extension(
         "libxrk.aim_xrk",
@@ -11,7 +16,14 @@ extensions = [
         include_dirs=[np.get_include()],
         language="c++",
         extra_compile_args=["-std=c++11"],
-    )
+    ),
+    Extension(
+        "libxrk.gps_kernels",
+        sources=["src/libxrk/gps_kernels.pyx"],
+        include_dirs=[np.get_include()],
+        extra_compile_args=OPENMP_FLAGS,
+        extra_link_args=OPENMP_FLAGS,
+    ),
 ]
 
 setup(
@@ -2,6 +2,41 @@
 
 """libxrk - Library for reading AIM XRK and XRZ files."""
 
-from .aim_xrk import aim_xrk, aim_track_dbg
+# Kept free of heavy imports (even typing): see __init__.pyi for the types.
+import importlib
+import sys
+import types
 
 __all__ = ["aim_xrk", "aim_track_dbg"]
+
+# Public name -> submodule defining it.  The compiled reader (and numpy
+# behind it) is only loaded on first use, so "import libxrk" stays cheap.
+_LAZY = {
+    "aim_xrk": ".aim_xrk",
+    "aim_track_dbg": ".aim_xrk",
+}
+
+
+def __getattr__(name: str) -> object:
+    if name in _LAZY:
+        value = getattr(importlib.import_module(_LAZY[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+def __dir__() -> list:
+    return sorted(set(globals()) | set(_LAZY))
+
+
+class _Package(types.ModuleType):
+    def __setattr__(self, name: str, value: object) -> None:
+        # Importing a submodule binds it on the package, which would shadow
+        # the function of the same name (libxrk.aim_xrk); keep the function,
+        # as the eager "from .aim_xrk import aim_xrk" used to.
+        if name in _LAZY and isinstance(value, types.ModuleType):
+            value = getattr(value, name)
+        super().__setattr__(name, value)
+
+
+sys.modules[__name__].__class__ = _Package
@@ -0,0 +1,6 @@
+# Copyright 2024, Scott Smith.  MIT License (see LICENSE).
+"""Type stubs for the libxrk package (whose attributes are loaded lazily)."""
+
+from .aim_xrk import aim_xrk as aim_xrk, aim_track_dbg as aim_track_dbg
+
+__all__ = ["aim_xrk", "aim_track_dbg"]
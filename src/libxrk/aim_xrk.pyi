@@ -1,16 +1,51 @@
 # Copyright 2024, Scott Smith.  MIT License (see LICENSE).
 """Type stubs for aim_xrk Cython extension module."""
 
-from typing import Any, Callable, Optional
+from typing import Any, Callable, Iterable, Optional
 from libxrk.base import LogFile
+from libxrk.tracks import TrackDatabase
 
-def aim_xrk(fname: str, progress: Optional[Callable[[int, int], None]]) -> LogFile:
+OPTIONAL_GPS_CHANNELS: tuple[str, ...]
+
+def aim_xrk(
+    fname: str,
+    progress: Optional[Callable[[int, int], None]] = None,
+    gps_channels: Iterable[str] = (),
+    tracks: Optional[TrackDatabase] = None,
+    memory_budget: Optional[int] = None,
+    spill_dir: Optional[str] = None,
+    compact: bool = False,
+) -> LogFile:
     """
     Read and parse an AIM XRK file.
 
     Args:
         fname: Path to the XRK file to read
         progress: Optional progress callback function that receives (current, total) positions
+        gps_channels: Extra GPS channels to add, from OPTIONAL_GPS_CHANNELS.
+            'GPS X' and 'GPS Y' are meters east and north of the start/finish
+            point of the track (only added if the file has one).  The
+            others come straight from the GPS records: iTOW, week, position
+            and speed accuracy, satellite count, raw ECEF position and
+            velocity, and 'GPS UTC Time' (timestamp) derived from week/iTOW.
+        tracks: Optional track database.  If the file's TRK message is
+            missing or names a track the GPS fixes aren't at, the track is
+            looked up from the first fixes; its start/finish is then used
+            for laps (and GPS X/Y) and its name as the 'Venue'.  Without a
+            start/finish, laps come from the logger's LAP messages.
+        memory_budget: Optional limit (bytes) on the sample data held in
+            memory while decoding.  Once exceeded, it is moved to temporary
+            files, and the channels' arrays are memory mapped from
+            temporary files rather than allocated, so that long files can
+            be decoded with bounded memory.  The files are deleted when
+            the last array using them is.
+        spill_dir: Directory for those temporary files (default: the
+            system temporary directory)
+        compact: Keep values as they are stored in the file (float16,
+            and int16/uint16 millivolts with a 'scale' of 0.001 in the
+            field metadata) rather than widening them as they are
+            decoded.  Use base.channel_values() or expand_channel() to get
+            the values; LogFile's methods do.
 
     Returns:
         LogFile object containing channels, laps, and metadata
@@ -2,7 +2,6 @@
 # Copyright 2024, Scott Smith.  MIT License (see LICENSE).
 
 from array import array
-import concurrent.futures
 import ctypes
 from dataclasses import dataclass, field
 import math
@@ -12,18 +11,22 @@ import os
 from pprint import pprint # pylint: disable=unused-import
 import struct
 import sys
+import tempfile
 import time
 import traceback # pylint: disable=unused-import
 from typing import Dict, List, Optional
+import warnings
+
+from . import decoders
 
 import cython
 from cython.operator cimport dereference
+from libc.string cimport memchr
 from libcpp.vector cimport vector
 
-import pyarrow as pa
-
-from . import gps
-from . import base
+# pyarrow, gps (and its kernels), base and concurrent.futures are imported
+# by the functions that use them, so importing this module stays cheap for
+# callers that never decode a file.
 
 # 1,2,5,10,20,25,50 Hz
 # units
@@ -57,6 +60,8 @@ class Channel:
     group: Optional[GroupRef] = None
     timecodes: object = field(default=None, repr=False)
     sampledata: object = field(default=None, repr=False)
+    scale: float = 1.0 # of sampledata, kept compact (see base.channel_values)
+    timebase: object = field(default=None, repr=False) # of timecodes, if decoded as runs
 
 @dataclass(**dc_slots)
 class Message:
@@ -68,54 +73,15 @@ class Message:
 class DataStream:
     channels: Dict[str, Channel]
     messages: Dict[str, List[Message]]
-    laps: pa.Table
+    laps: object # pa.Table
     time_offset: int
-
-@dataclass(**dc_slots)
-class Decoder:
-    stype: str
-    interpolate: bool = False
-    fixup: object = None
+    track: object = None # tracks.Track found in the track database, if any
 
 def _nullterm_string(s):
     zero = s.find(0)
     if zero >= 0: s = s[:zero]
     return s.decode('ascii')
 
-_manual_decoders = {
-    'Calculated_Gear': Decoder('Q', fixup=lambda a: array('I', [0 if int(x) & 0x80000 else
-                                                                (int(x) >> 16) & 7 for x in a])),
-    'PreCalcGear':     Decoder('Q', fixup=lambda a: array('I', [0 if int(x) & 0x80000 else
-                                                                (int(x) >> 16) & 7 for x in a])),
-}
-
-_gear_table = np.arange(65536, dtype=np.uint16)
-_gear_table[ord('N')] = 0
-_gear_table[ord('1')] = 1
-_gear_table[ord('2')] = 2
-_gear_table[ord('3')] = 3
-_gear_table[ord('4')] = 4
-_gear_table[ord('5')] = 5
-_gear_table[ord('6')] = 6
-
-_decoders = {
-    0:  Decoder('i'), # Master Clock on M4GT4?
-    1:  Decoder('H', interpolate=True,
-                fixup=lambda a: np.ndarray(buffer=a, shape=(len(a),),
-                                           dtype=np.float16).astype(np.float32).data),
-    3:  Decoder('i'), # Master Clock on ScottE46?
-    4:  Decoder('h'),
-    6:  Decoder('f', interpolate=True),
-    11: Decoder('h'),
-    12: Decoder('i'), # Predictive Time?
-    13: Decoder('B'), # status field?
-    15: Decoder('H', fixup=lambda a: _gear_table[a]), # ?? NdscSwitch on M4GT4.  Also actual size is 8 bytes
-    20: Decoder('H', interpolate=True,
-                fixup=lambda a: np.ndarray(buffer=a, shape=(len(a),),
-                                           dtype=np.float16).astype(np.float32).data),
-    24: Decoder('i'), # Best Run Diff?
-}
-
 _unit_map = {
     1:  ('%', 2),
     3:  ('G', 2),
@@ -218,6 +184,116 @@ cdef _resize_vaccum(vaccum & v, int idx):
             v[i].add_helper = 1
             v[i].Mms = 0
 
+class _Spill:
+    """
+    Temporary files for a decode over its memory budget.  The accumulated
+    sample bytes of each group/channel are appended to one spill file,
+    recording the extent (offset, length) each write went to (see
+    _spill_accums), then mapped back in for decoding, and the decoded
+    arrays are written to files too, so they can be paged out rather than
+    counting against the process's memory.  The files are unlinked when
+    created: they go away with the last array mapping them.  Only the
+    spill file is open while scanning, however many channels there are.
+    """
+    def __init__(self, dir=None):
+        self.dir = dir
+        self.file = None
+        self.extents = {}
+        self.maps = {}
+
+    def write(self, key, data):
+        if self.file is None:
+            self.file = tempfile.TemporaryFile(dir=self.dir)
+        data = memoryview(data).cast('B')
+        offset = self.file.tell()
+        self.file.write(data)
+        # keep extents 8 byte aligned, for the views of them in finish()
+        self.file.write(bytes(-len(data) % 8))
+        self.extents.setdefault(key, []).append((offset, len(data)))
+
+    def finish(self):
+        # map everything written, read only; done with the file itself
+        if self.file is None:
+            return
+        size = self.file.tell()
+        self.file.flush()
+        whole = np.frombuffer(
+            mmap.mmap(self.file.fileno(), size, access=mmap.ACCESS_READ), dtype=np.uint8)
+        self.file.close()
+        self.file = None
+        for key, extents in self.extents.items():
+            if len(extents) == 1:
+                offset, length = extents[0]
+                self.maps[key] = whole[offset:offset + length]
+            else:
+                # written over several spills: gather into one array
+                out = self.empty((sum(length for _, length in extents),), np.uint8)
+                pos = 0
+                for offset, length in extents:
+                    out[pos:pos + length] = whole[offset:offset + length]
+                    pos += length
+                self.maps[key] = out
+        self.extents = {}
+
+    def get(self, key):
+        """Everything written to key, as a uint8 array (empty if nothing was)."""
+        return self.maps.get(key, np.empty(0, dtype=np.uint8))
+
+    def empty(self, shape, dtype):
+        """A new array backed by a temporary file."""
+        dtype = np.dtype(dtype)
+        size = int(np.prod(shape)) * dtype.itemsize
+        if not size:
+            return np.empty(shape, dtype=dtype)
+        with tempfile.TemporaryFile(dir=self.dir) as f:
+            f.truncate(size)
+            m = mmap.mmap(f.fileno(), size)
+        return np.frombuffer(m, dtype=dtype).reshape(shape)
+
+    def copy(self, a):
+        out = self.empty(a.shape, a.dtype)
+        out[...] = a
+        return out
+
+cdef _spill_accums(vaccum * gc_data, vector[cython.uchar] & gpsmsg, spill):
+    # Move the accumulated bytes (and M message runs) to spill and
+    # release the memory they held.
+    cdef accum * data_p
+    for cat in range(4):
+        for idx in range(gc_data[cat].size()):
+            data_p = &gc_data[cat][idx]
+            if data_p.data.size():
+                spill.write((cat, idx), <cython.uchar[:data_p.data.size()]> &data_p.data[0])
+                data_p.data.clear()
+                data_p.data.shrink_to_fit()
+            if data_p.timecodes.size():
+                spill.write((cat, idx, 'tc'),
+                            <cython.int[:data_p.timecodes.size()]> &data_p.timecodes[0])
+                data_p.timecodes.clear()
+                data_p.timecodes.shrink_to_fit()
+    if gpsmsg.size():
+        spill.write('gps', <cython.uchar[:gpsmsg.size()]> &gpsmsg[0])
+        gpsmsg.clear()
+        gpsmsg.shrink_to_fit()
+
+cdef _accum_bytes(vaccum * gc_data, spill, int cat, int idx):
+    # Everything accumulated for gc_data[cat][idx], as a uint8 array: a view
+    # of the vector (TREAD LIGHTLY - raw pointers) or of the spill file.
+    if spill is not None:
+        return spill.get((cat, idx))
+    cdef accum * data_p = &gc_data[cat][idx]
+    if not data_p.data.size():
+        return np.empty(0, dtype=np.uint8)
+    return np.asarray(<cython.uchar[:data_p.data.size()]> &data_p.data[0])
+
+cdef _accum_timecodes(vaccum * gc_data, spill, int cat, int idx):
+    if spill is not None:
+        return spill.get((cat, idx, 'tc')).view(np.int32)
+    cdef accum * data_p = &gc_data[cat][idx]
+    if not data_p.timecodes.size():
+        return np.empty(0, dtype=np.int32)
+    return np.asarray(<cython.int[:data_p.timecodes.size()]> &data_p.timecodes[0])
+
 cdef _Mms_lookup(int k):
     # Not sure how to represent 500 Hz
     if k == 8:  return 5  # 200 Hz
@@ -228,20 +304,88 @@ cdef _Mms_lookup(int k):
     # I guess 10Hz, 5Hz, 2Hz, and 1Hz don't use M messages
     return 0
 
+# Default window of a file mapped at once by _FileWindow, and how close to
+# its end a message must start to be retried in the next window: the
+# largest S/G/c/M record (an M message of 65535 255 byte samples).
+_WINDOW = 1 << 28
+_WINDOW_MARGIN = 1 << 25
+
+class _Remap(Exception):
+    # a message at the current position needs size bytes beyond the window
+    def __init__(self, size):
+        super().__init__(size)
+        self.size = size
+
+class _FileWindow:
+    """
+    Maps an open file a window at a time, so decoding a file of any size
+    maps (and keeps resident) a bounded part of it.  _decode_sequence
+    moves the window along as it goes.
+    """
+    def __init__(self, f, size=_WINDOW, margin=_WINDOW_MARGIN):
+        assert mmap.ALLOCATIONGRANULARITY < margin and margin * 2 <= size
+        self.fileno = f.fileno()
+        self.length = os.fstat(self.fileno).st_size
+        self.size = size
+        self.margin = margin
+        self.offset = 0
+        self.final = True
+
+    def map(self, offset, need=0):
+        """
+        Map from offset (rounded down to the allocation granularity) for
+        size bytes, or at least need bytes past offset, or to the end of the
+        file.  Sets .offset to the start of the mapping and .final to
+        whether it reaches the end of the file.
+        """
+        start = offset - offset % mmap.ALLOCATIONGRANULARITY
+        end = min(self.length, max(start + self.size, offset + need))
+        self.offset = start
+        self.final = end == self.length
+        if end == start:
+            return b''
+        m = mmap.mmap(self.fileno, end - start, access=mmap.ACCESS_READ, offset=start)
+        if hasattr(m, 'madvise'):
+            m.madvise(mmap.MADV_SEQUENTIAL)
+        return m
+
+cdef Py_ssize_t _resync(const cython.uchar[::1] sv, Py_ssize_t pos):
+    # first position from pos on that could start a message ('(' or '<'),
+    # or the end of sv
+    cdef const cython.uchar * start = &sv[0]
+    cdef size_t n = sv.shape[0] - pos
+    cdef const void * p = memchr(start + pos, ord('('), n)
+    if p != NULL:
+        n = <const cython.uchar *>p - (start + pos)
+    cdef const void * q = memchr(start + pos, ord('<'), n)
+    if q != NULL:
+        p = q
+    return <const cython.uchar *>p - start if p != NULL else sv.shape[0]
+
 @cython.wraparound(False)
-def _decode_sequence(s, progress=None):
+def _decode_sequence(s, progress=None, gps_channels=(), tracks=None, memory_budget=None,
+                     spill_dir=None, compact=False):
+    # s is the data, or a _FileWindow onto it.  Positions are 64 bit: pos
+    # is within the current window, which starts base bytes into the data.
+    window = None
+    if isinstance(s, _FileWindow):
+        window = s
+        s = window.map(0)
     cdef const cython.uchar[::1] sv = s
+    base: cython.Py_ssize_t = 0
+    final: cython.bint = window is None or window.final
+    data_len: cython.Py_ssize_t = window.length if window is not None else len(s)
     groups = []
     channels = []
     messages = {}
     tok_GPS: cython.uint = _tokdec('GPS')
     tok_GPS1: cython.uint = _tokdec('GPS1')
-    progress_interval: cython.uint = 8_000_000
-    next_progress: cython.uint = progress_interval
-    pos: cython.uint = 0
-    oldpos: cython.uint = pos
-    badbytes: cython.uint = 0
-    badpos: cython.uint = 0
+    progress_interval: cython.Py_ssize_t = 8_000_000
+    next_progress: cython.Py_ssize_t = progress_interval
+    pos: cython.Py_ssize_t = 0
+    oldpos: cython.Py_ssize_t = pos
+    badbytes: cython.Py_ssize_t = 0
+    badpos: cython.Py_ssize_t = 0 # from the start of the data, not the window
     ord_op: cython.int = ord('(')
     ord_cp: cython.int = ord(')')
     ord_op_G : cython.int = ord_op + 256 * ord('G')
@@ -251,7 +395,7 @@ def _decode_sequence(s, progress=None):
     ord_lt: cython.int = ord('<')
     ord_lt_h : cython.int = ord_lt + 256 * ord('h')
     ord_gt: cython.int = ord('>')
-    len_s = len(s)
+    len_s: cython.Py_ssize_t = len(s)
     cdef vaccum[4] gc_data # [0]: G messages (groups) [1]: S messages (samples?) [2]: c messages (channels from expansion) [3]: M messages
     time_offset = None
     last_time = None
@@ -259,11 +403,23 @@ def _decode_sequence(s, progress=None):
     cdef vaccum * data_cat
     cdef accum * data_p
     gpsmsg: vector[cython.uchar]
+    # bytes held in gc_data/gpsmsg, which go to spill once over budget
+    buffered: cython.Py_ssize_t = 0
+    budget: cython.Py_ssize_t = memory_budget if memory_budget is not None else sys.maxsize
+    spill = None
     show_all: cython.int = 0
     show_bad: cython.int = 0
-    while pos < len_s:
+    while base + pos < data_len:
+        if buffered > budget:
+            # here, not in the try below: failing to spill isn't bad data
+            if spill is None:
+                spill = _Spill(spill_dir)
+            _spill_accums(gc_data, gpsmsg, spill)
+            buffered = 0
         try:
             while True:
+                if buffered > budget:
+                    break # to spill
                 oldpos = pos
                 if pos + 10 >= len_s: # smallest message is 3 (frame) + 4 (tc) + 2 (idx) + 1 (data)
                     raise IndexError
@@ -284,6 +440,7 @@ def _decode_sequence(s, progress=None):
                         data_p.last_timecode = msg.s.timecode
                         data_p.data.insert(data_p.data.end(),
                                            <const cython.uchar *>&msg.s.timecode, last)
+                        buffered += data_p.add_helper
                 elif typ == ord_op_M:
                     data_p = &gc_data[3][msg.s.index]
                     if data_p >= &dereference(gc_data[3].end()):
@@ -299,11 +456,13 @@ def _decode_sequence(s, progress=None):
                               (msg.s.timecode, msg.s.index, msg.s.count, data_p.Mms))
                     if msg.s.timecode > data_p.last_timecode:
                         data_p.last_timecode = msg.s.timecode + (msg.s.count-1) * data_p.Mms
-                        m_tc : cython.int
-                        for m_tc in range(msg.s.count):
-                            data_p.timecodes.push_back(msg.s.timecode + m_tc * data_p.Mms)
+                        # samples are at a fixed rate: keep (timecode, count)
+                        # per message, for a Timebase later
+                        data_p.timecodes.push_back(msg.s.timecode)
+                        data_p.timecodes.push_back(msg.s.count)
                         data_p.data.insert(data_p.data.end(),
                                            &sv[oldpos+10], &sv[pos])
+                        buffered += pos - oldpos + 8
                     pos += 1
                 elif typ == ord_op_c:
                     assert msg.c.unk1 == 0, '%x' % msg.c.unk1
@@ -324,15 +483,18 @@ def _decode_sequence(s, progress=None):
                         data_p.last_timecode = msg.c.timecode
                         data_p.data.insert(data_p.data.end(),
                                            <const cython.uchar *>&msg.c.timecode, last)
+                        buffered += data_p.add_helper
                 elif typ == ord_lt_h:
-                    if pos > next_progress:
+                    if base + pos > next_progress:
                         next_progress += progress_interval
                         if progress:
-                            progress(pos, len(s))
+                            progress(base + pos, data_len)
                     tok: cython.uint = msg.h.tok
-                    hlen: cython.uint = msg.h.hlen
-                    if hlen >= len_s:
+                    hlen: cython.Py_ssize_t = msg.h.hlen
+                    if hlen < 0 or base + pos + hlen >= data_len:
                         raise IndexError
+                    if pos + 20 + hlen > len_s and not final:
+                        raise _Remap(20 + hlen)
                     ver = msg.h.ver
                     assert msg.h.cl == ord_gt, "%c at %x" % (msg.h.cl, pos+11)
                     pos += 12
@@ -357,6 +519,7 @@ def _decode_sequence(s, progress=None):
                     if tok == tok_GPS or tok == tok_GPS1:
                         # fast path common case
                         gpsmsg.insert(gpsmsg.end(), &sv[oldpos+12], &sv[pos-8])
+                        buffered += hlen
                     else:
                         data = s[oldpos + 12 : pos - 8]
                         if tok == _tokdec('CNF'):
@@ -460,28 +623,38 @@ def _decode_sequence(s, progress=None):
                 else:
                     assert False, "%02x%02x at %x" % (s[pos], s[pos+1], pos)
         except Exception as _err: # pylint: disable=broad-exception-caught
-            if oldpos != badpos + badbytes and badbytes:
+            if not final and (isinstance(_err, _Remap) or len_s - oldpos < window.margin):
+                # may just run past the window: retry in the next one
+                s = window.map(base + oldpos, _err.size if isinstance(_err, _Remap) else 0)
+                sv = s
+                pos = base + oldpos - window.offset
+                base = window.offset
+                final = window.final
+                len_s = len(s)
+                continue
+            if base + oldpos != badpos + badbytes and badbytes:
                 if show_bad:
-                    print('Bad bytes(%d at %x):' % (badbytes, badpos),
-                          ', '.join('%02x' % c for c in s[badpos:badpos + badbytes])
-                          )
+                    warnings.warn('Bad bytes(%d at %x)' % (badbytes, badpos))
                 badbytes = 0
             if not badbytes:
                 if show_bad:
                     sys.stdout.flush()
                     traceback.print_exc()
-                badpos = oldpos # pylint: disable=unused-variable
+                badpos = base + oldpos # pylint: disable=unused-variable
             if oldpos < len_s:
-                badbytes += 1
-                pos = oldpos + 1
+                # nothing before the next '(' or '<' can start a message
+                pos = _resync(sv, oldpos + 1)
+                badbytes += pos - oldpos
     t2 = time.perf_counter()
     if badbytes:
         if show_bad:
-            print('Bad bytes(%d at %x):' % (badbytes, badpos),
-                  ', '.join('%02x' % c for c in s[badpos:badpos + badbytes])
-                  )
+            warnings.warn('Bad bytes(%d at %x)' % (badbytes, badpos))
         badbytes = 0
-    assert pos == len(s)
+    assert base + pos == data_len
+    sv = s = None # unmap the (last) window
+    if spill is not None:
+        _spill_accums(gc_data, gpsmsg, spill)
+        spill.finish()
     # quick scan through all the groups/channels for the first used timecode
     if channels:
         # int(min(time_offset, time_offset,
@@ -497,87 +670,126 @@ def _decode_sequence(s, progress=None):
             #XXX*[s2mv[l[l.size()-1]] for l in ch_indices if l.size()],
             + [c.timecodes[len(c.timecodes)-1] for c in channels if c and len(c.timecodes)],
             default=0))
+    from .timebase import Timebase
+
+    # Over budget, the decoded arrays go to spill files too (copy/offset
+    # write there instead of allocating).
+    def copy(a):
+        return spill.copy(a) if spill is not None else a.copy()
+
+    def offset(tc):
+        if spill is None:
+            return tc - time_offset
+        out = spill.empty(tc.shape, np.int64)
+        np.subtract(tc, time_offset, out=out)
+        return out
+
     def process_group(g):
         g.samples = np.array([], dtype=np.int32)
         g.timecodes = g.samples.data
         if g.index < gc_data[0].size():
-            data_p = &gc_data[0][g.index]
-            if data_p.data.size():
-                g.samples = np.asarray(<cython.uchar[:data_p.data.size()]> &data_p.data[0])
-                rows = len(g.samples) // (data_p.add_helper - 3)
-                g.timecodes = np.ndarray(buffer=g.samples, dtype=np.int32,
-                                         shape=(rows,),
-                                         strides=(data_p.add_helper-3,)) - time_offset
+            stride = gc_data[0][g.index].add_helper - 3
+            samples = _accum_bytes(gc_data, spill, 0, g.index)
+            if len(samples):
+                g.samples = samples
+                g.timecodes = offset(np.ndarray(buffer=g.samples, dtype=np.int32,
+                                                shape=(len(g.samples) // stride,),
+                                                strides=(stride,)))
         for ch in g.channels:
             process_channel(channels[ch])
 
     def process_channel(c):
-        if c.long_name in _manual_decoders:
-            d = _manual_decoders[c.long_name]
-        elif c.unknown[20] in _decoders:
-            d = _decoders[c.unknown[20]]
-        else:
+        d = decoders.lookup(c.long_name, c.unknown[20])
+        if d is None:
             return
 
         c.interpolate = d.interpolate
         if c.group:
             grp = c.group.group
             c.timecodes = grp.timecodes
-            c.sampledata = np.ndarray(buffer=grp.samples[c.group.offset:], dtype=d.stype,
-                                      shape=grp.timecodes.shape,
-                                      strides=(gc_data[0][grp.index].add_helper-3,)).copy()
+            c.sampledata = copy(np.ndarray(buffer=grp.samples[c.group.offset:], dtype=d.stype,
+                                           shape=grp.timecodes.shape,
+                                           strides=(gc_data[0][grp.index].add_helper-3,)))
         else:
             # check for S messages
             view_offset = 6
             stride_offset = 3
-            data_p = &gc_data[1][c.index]
-            if not data_p.data.size():
+            cat = 1
+            view = _accum_bytes(gc_data, spill, cat, c.index)
+            if not len(view):
                 # No? maybe c messages
                 view_offset = 4
                 stride_offset = 8
-                data_p = &gc_data[2][c.index]
-            if data_p.data.size():
-                assert len(c.timecodes) == 0, "Can't have both S/c and M records for channel %s (index=%d, %d vs %d)" % (c.long_name, c.index, len(c.timecodes), data_p.data.size())
+                cat = 2
+                view = _accum_bytes(gc_data, spill, cat, c.index)
+            if len(view):
+                assert len(c.timecodes) == 0, "Can't have both S/c and M records for channel %s (index=%d, %d vs %d)" % (c.long_name, c.index, len(c.timecodes), len(view))
 
-                # TREAD LIGHTLY - raw pointers here
-                view = np.asarray(<cython.uchar[:data_p.data.size()]> &data_p.data[0])
-                rows = len(view) // (data_p.add_helper - stride_offset)
+                stride = gc_data[cat][c.index].add_helper - stride_offset
+                rows = len(view) // stride
 
                 tc = np.ndarray(buffer=view, dtype=np.int32,
-                                shape=(rows,), strides=(data_p.add_helper-stride_offset,)).copy()
-                samp = np.ndarray(buffer=view[view_offset:], dtype=d.stype,
-                                  shape=(rows,), strides=(data_p.add_helper-stride_offset,)).copy()
+                                shape=(rows,), strides=(stride,))
+                samp = copy(np.ndarray(buffer=view[view_offset:], dtype=d.stype,
+                                       shape=(rows,), strides=(stride,)))
+                c.timecodes = offset(tc).data
             else:
-                data_p = &gc_data[3][c.index] # M messages
-                if data_p.timecodes.size():
-                    tc = np.asarray(<cython.int[:data_p.timecodes.size()]>
-                                    &data_p.timecodes[0]).copy()
-                    samp = np.ndarray(buffer=np.asarray(<cython.uchar[:data_p.data.size()]>
-                                                        &data_p.data[0]),
-                                      dtype=d.stype, shape=tc.shape).copy()
+                # M messages: (timecode, count) runs at the channel's period
+                runs = _accum_timecodes(gc_data, spill, 3, c.index).reshape(-1, 2)
+                if len(runs):
+                    timebase = Timebase.from_runs(runs[:, 0].astype(np.int64) - time_offset,
+                                                  runs[:, 1],
+                                                  gc_data[3][c.index].Mms)
+                    c.timebase = timebase
+                    c.timecodes = timebase.materialize(
+                        spill.empty((len(timebase),), np.int64)
+                        if spill is not None else None).data
+                    samp = copy(np.ndarray(buffer=_accum_bytes(gc_data, spill, 3, c.index),
+                                           dtype=d.stype, shape=(len(timebase),)))
                 else:
-                    tc = _ndarray_from_mv(c.timecodes)
+                    c.timecodes = offset(_ndarray_from_mv(c.timecodes)).data
                     samp = _ndarray_from_mv(memoryview(c.sampledata).cast(d.stype))
-            c.timecodes = (tc - time_offset).data
             c.sampledata = samp.data
 
-        if d.fixup:
-            c.sampledata = memoryview(d.fixup(c.sampledata))
+        # compact: the values stay as stored, to be widened (and scaled)
+        # when used rather than here
+        computed = False
+        if d.fixup and compact and d.raw is not None:
+            c.sampledata = np.asarray(c.sampledata).view(d.raw).data
+        elif d.fixup:
+            c.sampledata = memoryview(np.ascontiguousarray(d.fixup(np.asarray(c.sampledata))))
+            computed = True
         if c.units == 'V': # most are really encoded as mV, but one or two aren't....
-            c.sampledata = np.divide(c.sampledata, 1000).data
+            if compact:
+                c.scale = 0.001
+            else:
+                c.sampledata = np.divide(c.sampledata, 1000).data
+                computed = True
+        if spill is not None and computed:
+            # those are computed in memory, a channel at a time
+            c.sampledata = spill.copy(np.asarray(c.sampledata)).data
+
+    def gps_bytes():
+        if spill is not None:
+            return memoryview(spill.get('gps'))
+        if not gpsmsg.size():
+            return b''
+        return <cython.uchar[:gpsmsg.size()]> &gpsmsg[0]
 
     laps = None
+    track = None
     if not channels:
         t4 = time.perf_counter()
         pass # nothing to do
     elif progress:
+        import concurrent.futures
         with concurrent.futures.ThreadPoolExecutor(max_workers=min(2, os.cpu_count())) as worker:
-            bg_work = worker.submit(_bg_gps_laps, <cython.uchar[:gpsmsg.size()]> &gpsmsg[0],
-                                    messages, time_offset, last_time)
+            bg_work = worker.submit(_bg_gps_laps, gps_bytes(),
+                                    messages, time_offset, last_time, gps_channels, tracks)
             group_work = worker.map(process_group, [x for x in groups if x])
             channel_work = worker.map(process_channel,
                                       [x for x in channels if x and not x.group])
-            gps_ch, laps = bg_work.result()
+            gps_ch, laps, track = bg_work.result()
             t4 = time.perf_counter()
             for i in group_work:
                 pass
@@ -590,8 +802,9 @@ def _decode_sequence(s, progress=None):
         for c in channels:
             if c and not c.group: process_channel(c)
         t4 = time.perf_counter()
-        gps_ch, laps = _bg_gps_laps(<cython.uchar[:gpsmsg.size()]> &gpsmsg[0],
-                                    messages, time_offset, last_time)
+        gps_ch, laps, track = _bg_gps_laps(gps_bytes(),
+                                           messages, time_offset, last_time, gps_channels,
+                                           tracks)
         channels.extend(gps_ch)
 
     t3 = time.perf_counter()
@@ -604,7 +817,8 @@ def _decode_sequence(s, progress=None):
                   and ch.long_name not in ('StrtRec', 'Master Clk')},
         messages=messages,
         laps=laps,
-        time_offset=time_offset)
+        time_offset=time_offset,
+        track=track)
 
 def _get_metadata(msg_by_type):
     ret = {}
@@ -629,21 +843,83 @@ def _get_metadata(msg_by_type):
                                                           stats['time'] % 60)
     return ret
 
-def _bg_gps_laps(gpsmsg, msg_by_type, time_offset, last_time):
-    channels = _decode_gps(gpsmsg, time_offset)
-    lat_ch = None
-    lon_ch = None
-    for ch in channels:
-        if ch.long_name == 'GPS Latitude': lat_ch = ch
-        if ch.long_name == 'GPS Longitude': lon_ch = ch
-    laps = _get_laps(lat_ch, lon_ch, msg_by_type, time_offset, last_time)
-    return channels, laps
+def _bg_gps_laps(gpsmsg, msg_by_type, time_offset, last_time, gps_channels=(), tracks=None):
+    channels, XYZ = _decode_gps(gpsmsg, time_offset, gps_channels)
+    timecodes = None
+    by_name = {ch.long_name: ch for ch in channels}
+    if 'GPS Latitude' in by_name: timecodes = by_name['GPS Latitude'].timecodes
+
+    # start/finish from the TRK message, unless the track database knows
+    # better (TRK missing, or naming a track the fixes aren't at)
+    trk = msg_by_type[_tokdec('TRK')][-1].content if _tokdec('TRK') in msg_by_type else None
+    sf = (trk['sf_lat'], trk['sf_long']) if trk else None
+    track = None
+    if tracks is not None and XYZ is not None:
+        track = tracks.resolve(trk['name'] if trk else None,
+                               np.asarray(by_name['GPS Latitude'].sampledata),
+                               np.asarray(by_name['GPS Longitude'].sampledata))
+        if track is not None:
+            sf = track.start_finish
+
+    laps = _get_laps(None if timecodes is None else np.asarray(timecodes),
+                     XYZ, sf, msg_by_type, time_offset, last_time)
+    if XYZ is not None and sf is not None:
+        channels += _enu_channels(XYZ, timecodes, sf, gps_channels)
+    return channels, laps, track
+
+def _enu_channels(XYZ, timecodes, sf, gps_channels):
+    # Planar meters east (GPS X) and north (GPS Y) of the start/finish
+    # point, from the altitude 0 fixes.  The basis is cached per track.
+    wanted = [name for name in ('GPS X', 'GPS Y') if name in gps_channels]
+    if not wanted:
+        return []
+    from . import gps
+    east, north, _ = gps.ecef2enu(XYZ[0], XYZ[1], XYZ[2], sf[0], sf[1])
+    values = {'GPS X': east, 'GPS Y': north}
+    return [Channel(long_name=name, units='m', dec_pts=1, interpolate=True,
+                    timecodes=timecodes, sampledata=memoryview(values[name]))
+            for name in wanted]
+
+# Layout of the 56 byte records in GPS/GPS1 messages
+_GPS_RECORD = np.dtype({
+    'names':   ['timecode', 'itow', 'week', 'x', 'y', 'z', 'pos_acc',
+                'vx', 'vy', 'vz', 'vel_acc', 'nsat'],
+    'formats': ['<i4', '<u4', '<u2', '<i4', '<i4', '<i4', '<i4',
+                '<i4', '<i4', '<i4', '<i4', 'u1'],
+    'offsets': [0, 4, 12, 16, 20, 24, 28, 32, 36, 40, 44, 51],
+    'itemsize': 56,
+})
+
+# Optional channels straight from a record field:
+# name: (field, divisor, units, dec_pts, interpolate)
+_GPS_RECORD_CHANNELS = {
+    'GPS iTOW': ('itow', 1, 'ms', 0, True),
+    'GPS Week': ('week', 1, '', 0, False),
+    'GPS Position Accuracy': ('pos_acc', 100, 'm', 2, True),
+    'GPS Speed Accuracy': ('vel_acc', 100, 'm/s', 2, True),
+    'GPS Satellites': ('nsat', 1, '', 0, False),
+    'GPS ECEF X': ('x', 100, 'm', 2, True),
+    'GPS ECEF Y': ('y', 100, 'm', 2, True),
+    'GPS ECEF Z': ('z', 100, 'm', 2, True),
+    'GPS ECEF VX': ('vx', 100, 'm/s', 2, True),
+    'GPS ECEF VY': ('vy', 100, 'm/s', 2, True),
+    'GPS ECEF VZ': ('vz', 100, 'm/s', 2, True),
+}
 
-def _decode_gps(gpsmsg, time_offset):
-    if not gpsmsg: return []
+# Channels aim_xrk() only adds when asked for with gps_channels=
+OPTIONAL_GPS_CHANNELS = ('GPS X', 'GPS Y', 'GPS UTC Time') + tuple(_GPS_RECORD_CHANNELS)
+
+def _decode_gps(gpsmsg, time_offset, gps_channels=()):
+    # Returns the GPS channels and the fixes projected to altitude 0 in
+    # ECEF (for lap detection), or ([], None) if there is no GPS.
+    if not gpsmsg: return [], None
+    from . import gps
     alldata = memoryview(gpsmsg)
     assert len(alldata) % 56 == 0
-    timecodes = np.asarray(alldata[0:].cast('i')[::56//4])
+    # zero copy view of every field.  The buffer doesn't outlive the
+    # decode, so anything kept in a channel must be a new array.
+    records = np.frombuffer(alldata, dtype=_GPS_RECORD)
+    timecodes = records['timecode']
     # certain old MXP firmware (and maybe others) would periodically
     # butcher the upper 16-bits of the timecode field.  If necessary,
     # reconstruct it using only the bottom 16-bits and assuming time
@@ -651,33 +927,26 @@ def _decode_gps(gpsmsg, time_offset):
     if np.any(timecodes[1:] < timecodes[:-1]):
         timecodes = (timecodes & 65535) + (timecodes[0] - (timecodes[0] & 65535))
         timecodes += 65536 * np.cumsum(np.concatenate(([0], timecodes[1:] < timecodes[:-1])))
-    #itow_ms = alldata[4:].cast('I')[::56//4]
-    #weekN = alldata[12:].cast('H')[::56//2]
-    ecefX_cm = alldata[16:].cast('i')[::56//4]
-    ecefY_cm = alldata[20:].cast('i')[::56//4]
-    ecefZ_cm = alldata[24:].cast('i')[::56//4]
-    #posacc_cm = alldata[28:].cast('i')[::56//4]
-    ecefdX_cms = alldata[32:].cast('i')[::56//4]
-    ecefdY_cms = alldata[36:].cast('i')[::56//4]
-    ecefdZ_cms = alldata[40:].cast('i')[::56//4]
-    #velacc_cms = alldata[44:].cast('i')[::56//4]
-    #nsat = alldata[51::56]
 
     timecodes = memoryview(timecodes - time_offset)
 
-    gpsconv = gps.ecef2lla(np.divide(ecefX_cm, 100),
-                           np.divide(ecefY_cm, 100),
-                           np.divide(ecefZ_cm, 100))
+    # The altitude 0 projection comes out of the same conversion pass
+    # rather than converting lat/long back with lla2ecef.
+    XYZ = np.empty((3, len(timecodes)))
+    gpsconv = gps.ecef2lla(np.divide(records['x'], 100),
+                           np.divide(records['y'], 100),
+                           np.divide(records['z'], 100),
+                           ground_out=XYZ)
 
-    return [Channel(
+    channels = [Channel(
         long_name='GPS Speed',
         units='m/s',
         dec_pts=1,
         interpolate=True,
         timecodes=timecodes,
-        sampledata=memoryview(np.sqrt(np.square(ecefdX_cms) +
-                                      np.square(ecefdY_cms) +
-                                      np.square(ecefdZ_cms)) / 100.)),
+        sampledata=memoryview(np.sqrt(np.square(records['vx']) +
+                                      np.square(records['vy']) +
+                                      np.square(records['vz'])) / 100.)),
             Channel(long_name='GPS Latitude',  units='deg', dec_pts=4, interpolate=True,
                     timecodes=timecodes, sampledata=memoryview(gpsconv.lat)),
             Channel(long_name='GPS Longitude', units='deg', dec_pts=4, interpolate=True,
@@ -685,20 +954,32 @@ def _decode_gps(gpsmsg, time_offset):
             Channel(long_name='GPS Altitude', units='m', dec_pts=1, interpolate=True,
                     timecodes=timecodes, sampledata=memoryview(gpsconv.alt))]
 
-def _get_laps(lat_ch, lon_ch, msg_by_type, time_offset, last_time):
+    # optional channels are only built when asked for
+    for name, (fieldname, divisor, units, dec_pts, interpolate) in _GPS_RECORD_CHANNELS.items():
+        if name in gps_channels:
+            values = records[fieldname]
+            values = np.divide(values, divisor) if divisor != 1 else values.copy()
+            channels.append(Channel(long_name=name, units=units, dec_pts=dec_pts,
+                                    interpolate=interpolate, timecodes=timecodes,
+                                    sampledata=values))
+    if 'GPS UTC Time' in gps_channels:
+        channels.append(Channel(long_name='GPS UTC Time', units='', dec_pts=0,
+                                interpolate=False, timecodes=timecodes,
+                                sampledata=gps.gps_to_utc(records['week'], records['itow'])))
+    return channels, XYZ
+
+def _get_laps(gps_timecodes, XYZ, sf, msg_by_type, time_offset, last_time):
+    import pyarrow as pa
+    from . import gps
+
     lap_nums = []
     start_times = []
     end_times = []
     
-    if lat_ch and lon_ch:
-        # If we have GPS, do gps lap insert.
+    if XYZ is not None and sf is not None:
+        # If we have GPS and know where start/finish is, do gps lap insert.
 
-        track = msg_by_type[_tokdec('TRK')][-1].content
-        XYZ = np.column_stack(gps.lla2ecef(np.array(lat_ch.sampledata),
-                                           np.array(lon_ch.sampledata), 0))
-        lap_markers = gps.find_laps(XYZ,
-                                    np.array(lat_ch.timecodes),
-                                    (track['sf_lat'], track['sf_long']))
+        lap_markers = gps.find_laps(XYZ.T, gps_timecodes, sf)
 
         lap_markers = [0] + lap_markers + [last_time - time_offset]
 
@@ -740,20 +1021,22 @@ def _get_laps(lat_ch, lon_ch, msg_by_type, time_offset, last_time):
     })
 
 
-def _channel_to_table(ch):
-    """Convert a Channel object to a PyArrow table with metadata."""
+def _channel_to_table(ch, timecodes=None):
+    """
+    Convert a Channel object to a PyArrow table with metadata.  timecodes
+    is ch.timecodes as an int64 Arrow array, if already made.
+    """
+    import pyarrow as pa
+    from . import base
+
     # Create metadata dict for the channel data field (without name, as it's the column name)
-    metadata = {
-        b'units': (ch.units if ch.size != 1 else '').encode('utf-8'),
-        b'dec_pts': str(ch.dec_pts).encode('utf-8'),
-        b'interpolate': str(ch.interpolate).encode('utf-8')
-    }
+    metadata = base.channel_metadata(ch.units if ch.size != 1 else '', ch.dec_pts, ch.interpolate,
+                                     ch.scale)
     
-    # Determine the appropriate type for values based on the data
-    if isinstance(ch.sampledata, memoryview):
-        values_array = np.array(ch.sampledata)
-    else:
-        values_array = ch.sampledata
+    # Determine the appropriate type for values based on the data.  No
+    # copies: int64 timecodes and the values are used as they are (which
+    # for a memory budgeted decode means backed by its spill files).
+    values_array = np.asarray(ch.sampledata)
     
     # Create the schema with metadata on the channel data field
     # Use the actual channel name as the column name
@@ -765,27 +1048,59 @@ def _channel_to_table(ch):
     
     # Create the table with the channel name as the column name
     return pa.table({
-        'timecodes': pa.array(ch.timecodes, type=pa.int64()),
+        'timecodes': (timecodes if timecodes is not None
+                      else pa.array(np.asarray(ch.timecodes), type=pa.int64())),
         ch.long_name: pa.array(values_array)
     }, schema=schema)
 
 
-def aim_xrk(fname, progress=None):
+def _channel_tables(channels):
+    import pyarrow as pa
+
+    # The channels of a group (and the GPS channels) share their timecodes:
+    # convert them once, for all their tables (see LogFile.channel_groups).
+    timecodes = {}
+    tables = {}
+    for ch in channels:
+        key = id(ch.timecodes)
+        if key not in timecodes:
+            timecodes[key] = pa.array(np.asarray(ch.timecodes), type=pa.int64())
+        tables[ch.long_name] = _channel_to_table(ch, timecodes[key])
+    return tables
+
+
+def aim_xrk(fname, progress=None, gps_channels=(), tracks=None, memory_budget=None,
+            spill_dir=None, compact=False):
+    from . import base
+
+    gps_channels = set(gps_channels)
+    unknown = gps_channels - set(OPTIONAL_GPS_CHANNELS)
+    if unknown:
+        raise ValueError('Unknown GPS channels: %s' % ', '.join(sorted(unknown)))
     with open(fname, 'rb') as f:
-        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
-            data = _decode_sequence(m, progress)
+        data = _decode_sequence(_FileWindow(f), progress, gps_channels, tracks, memory_budget,
+                                spill_dir, compact)
     #pprint({k: len(v) for k, v in self.msg_by_type.items()})
 
-    return base.LogFile(
-        {ch.long_name: _channel_to_table(ch) for ch in data.channels.values()},
+    metadata = _get_metadata(data.messages)
+    if data.track is not None:
+        metadata['Venue'] = data.track.name
+
+    log = base.LogFile(
+        _channel_tables(data.channels.values()),
         data.laps,
-        _get_metadata(data.messages),
+        metadata,
         fname)
+    # the runs M message channels were decoded from, rather than finding
+    # them again in the timecodes
+    for ch in data.channels.values():
+        if ch.timebase is not None:
+            log.add_timebase(ch.long_name, ch.timebase)
+    return log
 
 def aim_track_dbg(fname):
     with open(fname, 'rb') as f:
-        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
-            data = _decode_sequence(m, None)
+        data = _decode_sequence(_FileWindow(f), None)
     return {_tokenc(k): v for k, v in data.messages.items()}
 
 #def _help_decode_channels(self, chmap):
@@ -1,12 +1,14 @@
 # Copyright 2024, Scott Smith.  MIT License (see LICENSE).
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import sys
 import typing
 import pyarrow as pa
 import pyarrow.compute as pc
 import numpy as np
 
+from .timebase import Timebase
+
 # We use array and memoryview for efficient operations, but that
 # assumes the sizes we expect match the file format.  Lets assert a
 # few of those assumptions here.  Our use of struct is safe since it
@@ -14,6 +16,125 @@ import numpy as np
 assert sys.byteorder == "little"
 
 
+def channel_metadata(
+    units: str = "", dec_pts: int = 0, interpolate: bool = False, scale: float = 1.0
+) -> typing.Dict[bytes, bytes]:
+    """
+    Build the field metadata dict used for channel value columns.  A scale
+    (other than 1) is recorded for compact channels, see channel_values().
+    """
+    metadata = {
+        b"units": units.encode("utf-8"),
+        b"dec_pts": str(dec_pts).encode("utf-8"),
+        b"interpolate": str(interpolate).encode("utf-8"),
+    }
+    if scale != 1.0:
+        metadata[b"scale"] = repr(scale).encode("utf-8")
+    return metadata
+
+
+def _is_compact(table: pa.Table) -> bool:
+    field = table.schema.field(1)
+    return field.type == pa.float16() or b"scale" in (field.metadata or {})
+
+
+def channel_values(table: pa.Table) -> np.ndarray:
+    """
+    The values of a channel table (its second column) as numpy.
+
+    Compact channels (aim_xrk(..., compact=True)) keep their values as
+    stored in the file: float16 values are widened to float32, and values
+    with a scale in their metadata are multiplied by it, here.
+    """
+    field = table.schema.field(1)
+    values: np.ndarray = table.column(1).to_numpy(zero_copy_only=False)
+    if values.dtype == np.float16:
+        values = values.astype(np.float32)
+    scale = (field.metadata or {}).get(b"scale")
+    if scale is not None:
+        # by the reciprocal: exactly as decoding without compact does (/ 1000)
+        values = values / (1 / float(scale))
+    return values
+
+
+def expand_channel(table: pa.Table) -> pa.Table:
+    """
+    A compact channel table with its values as channel_values() gives them
+    (and no scale).  Other tables are returned as they are.
+    """
+    if not _is_compact(table):
+        return table
+    field = table.schema.field(1)
+    metadata = {k: v for k, v in (field.metadata or {}).items() if k != b"scale"}
+    values = pa.array(channel_values(table))
+    return pa.Table.from_arrays(
+        [table.column(0), values],
+        schema=pa.schema(
+            [table.schema.field(0), pa.field(field.name, values.type, metadata=metadata)]
+        ),
+    )
+
+
+def resample_channel(
+    table: pa.Table, timecodes: np.ndarray, timebase: typing.Optional[Timebase] = None
+) -> np.ndarray:
+    """
+    Sample a channel table at arbitrary timecodes.
+
+    Channels with interpolate="True" metadata are linearly interpolated,
+    all others hold the previous sample (the first sample is used for
+    timecodes before the start of the channel), matching the fill rules of
+    LogFile.get_channels_as_table().
+
+    Args:
+        table: Channel table with a 'timecodes' column and one value column
+        timecodes: Timecodes (ms) to sample at
+        timebase: The table's timecodes as a Timebase (LogFile.timebase()),
+            if known: samples are then found by arithmetic rather than a
+            binary search
+
+    Returns:
+        Numpy array of values, one per requested timecode.
+    """
+    metadata = table.schema.field(1).metadata
+    tc = table.column(0).to_numpy()
+    values = channel_values(table)
+    timecodes = np.asarray(timecodes)
+    if not len(tc):
+        return np.full(len(timecodes), np.nan)
+    interpolate = (metadata or {}).get(b"interpolate", b"") == b"True"
+    result: np.ndarray
+    if interpolate:
+        if timebase is not None:
+            result = timebase.interp(timecodes, values)
+        else:
+            result = np.interp(timecodes, tc, values)
+    else:
+        if timebase is not None:
+            idx = timebase.searchsorted(timecodes, side="right") - 1
+        else:
+            idx = np.searchsorted(tc, timecodes, side="right") - 1
+        result = values[np.maximum(idx, 0)]
+    return result
+
+
+def _is_numeric(table: pa.Table) -> bool:
+    # whether a channel's values are numbers (not e.g. timestamps)
+    value_type = table.schema.field(1).type
+    return bool(pa.types.is_integer(value_type) or pa.types.is_floating(value_type))
+
+
+def _timecodes_key(table: pa.Table) -> typing.Hashable:
+    # the timecodes' memory (buffer, offset, length): equal for channel
+    # tables built on one shared timecodes array
+    column = table.column(0)
+    if column.num_chunks == 1 and column.null_count == 0:
+        chunk = column.chunk(0)
+        data = chunk.buffers()[1]
+        return (data.address if data is not None else 0, chunk.offset, len(chunk))
+    return id(table)
+
+
 @dataclass(eq=False)
 class LogFile:
     channels: typing.Dict[
@@ -24,6 +145,176 @@ class LogFile:
     laps: pa.Table  # PyArrow table with columns: num (int), start_time (int), end_time (int)
     metadata: typing.Dict[str, str]
     file_name: str  # move to metadata?
+    # timebase() results by timecodes key, with the table the key was taken
+    # from: kept alive, its buffer address (or id) can't be reused
+    _timebases: typing.Dict[typing.Hashable, typing.Tuple[pa.Table, typing.Optional[Timebase]]] = (
+        field(default_factory=dict, init=False, repr=False)
+    )
+
+    def timebase(self, name: str) -> typing.Optional[Timebase]:
+        """
+        A channel's timecodes as a Timebase: runs at a fixed period, for
+        lookups without searching every timecode.
+
+        Channels decoded from M messages have the decoder's (see
+        add_timebase()); for others it is found on first use, once for all
+        the channels sharing the timecodes (see channel_groups()).  The
+        timecodes are still materialized in the channel's table (channels
+        are Arrow tables), so a Timebase speeds up lookups but doesn't save
+        their memory.
+
+        Returns:
+            The Timebase, or None if the channel isn't (mostly) sampled at
+            a fixed rate.
+        """
+        table = self.channels[name]
+        key = _timecodes_key(table)
+        entry = self._timebases.get(key)
+        if entry is None:
+            entry = (table, Timebase.from_timecodes(table.column(0).to_numpy()))
+            self._timebases[key] = entry
+        return entry[1]
+
+    def add_timebase(self, name: str, timebase: Timebase) -> None:
+        """Record timebase as channel name's timecodes, for timebase() to return."""
+        table = self.channels[name]
+        self._timebases[_timecodes_key(table)] = (table, timebase)
+
+    def lap_stats(
+        self,
+        channels: typing.Optional[typing.Iterable[str]] = None,
+        percentiles: typing.Sequence[float] = (5, 50, 95),
+    ) -> pa.Table:
+        """
+        Compute per lap summary statistics for channels.
+
+        Lap boundaries are located once per channel on its own timecodes
+        (arithmetically for fixed rate channels, see timebase()), so
+        channels with different sample rates are handled independently.
+        Statistics are computed with segmented reductions over all laps at
+        once rather than by slicing each lap.  A sample belongs to a lap if
+        start_time <= timecode < end_time.
+
+        Args:
+            channels: Channel names to summarize (default: all numeric
+                channels)
+            percentiles: Percentiles (0-100) to compute, linearly interpolated
+
+        Returns:
+            A PyArrow table with one row per lap per channel and columns
+            'num', 'channel', 'count', 'min', 'max', 'mean', 'std' and one
+            'p<percentile>' column per requested percentile.  Statistics are
+            null for laps with no samples.
+
+        Raises:
+            TypeError: if a channel asked for isn't numeric (e.g. 'GPS UTC Time')
+        """
+        if channels is None:
+            names = sorted(n for n, t in self.channels.items() if _is_numeric(t))
+        else:
+            names = list(channels)
+            for name in names:
+                if not _is_numeric(self.channels[name]):
+                    raise TypeError(
+                        "Channel %r is not numeric (%s)"
+                        % (name, self.channels[name].schema.field(1).type)
+                    )
+        nums = self.laps.column("num").to_numpy()
+        start = self.laps.column("start_time").to_numpy()
+        end = self.laps.column("end_time").to_numpy()
+        nlaps = len(nums)
+        pnames = ["p%g" % p for p in percentiles]
+
+        columns: typing.Dict[str, typing.List[np.ndarray]] = {
+            name: [] for name in ["count", "min", "max", "mean", "std"] + pnames
+        }
+        for name in names:
+            table = self.channels[name]
+            tc = table.column("timecodes").to_numpy()
+            values = channel_values(table).astype(np.float64)
+
+            timebase = self.timebase(name)
+            search = timebase.searchsorted if timebase is not None else tc.searchsorted
+            lo = search(start, side="left")
+            hi = np.maximum(search(end, side="left"), lo)
+            count = hi - lo
+
+            # reduceat over interleaved (lo, hi) bounds; every other result
+            # is a lap.  A sentinel sample keeps hi == len(values) in range.
+            # Values are shifted by their mean to keep sum of squares accurate.
+            shift = np.mean(values) if len(values) else 0.0
+            ext = np.append(values - shift, 0.0)
+            bounds = np.column_stack([lo, hi]).ravel()
+
+            def _reduce(ufunc: np.ufunc, a: np.ndarray) -> np.ndarray:
+                return ufunc.reduceat(a, bounds)[::2] if nlaps else np.zeros(0)
+
+            total = _reduce(np.add, ext)
+            totalsq = _reduce(np.add, ext * ext)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                mean = total / count
+                var = np.maximum(totalsq / count - mean * mean, 0)
+            columns["count"].append(count)
+            columns["min"].append(_reduce(np.minimum, ext) + shift)
+            columns["max"].append(_reduce(np.maximum, ext) + shift)
+            columns["mean"].append(mean + shift)
+            columns["std"].append(np.sqrt(var))
+
+            # percentiles: sort every lap's samples in one lexsort, then index
+            seg = np.repeat(np.arange(nlaps), count)
+            offsets = np.cumsum(count) - count
+            idx = np.arange(len(seg)) - np.repeat(offsets, count) + np.repeat(lo, count)
+            lap_values = values[idx]
+            ordered = lap_values[np.lexsort((lap_values, seg))]
+            ordered = np.append(ordered, 0.0)
+            for pname, p in zip(pnames, percentiles):
+                pos = offsets + (p / 100) * np.maximum(count - 1, 0)
+                below = np.floor(pos).astype(np.int64)
+                frac = pos - below
+                above = np.minimum(below + 1, offsets + np.maximum(count - 1, 0))
+                columns[pname].append(ordered[below] * (1 - frac) + ordered[above] * frac)
+
+        def _stack(arrays: typing.List[np.ndarray]) -> np.ndarray:
+            return np.concatenate(arrays) if arrays else np.zeros(0)
+
+        count = _stack(columns["count"]).astype(np.int64)
+        result = {
+            "num": pa.array(np.tile(nums, len(names)), type=pa.int32()),
+            "channel": pa.array(np.repeat(np.array(names, dtype=object), nlaps), type=pa.string()),
+            "count": pa.array(count, type=pa.int64()),
+        }
+        for key in ["min", "max", "mean", "std"] + pnames:
+            result[key] = pa.array(_stack(columns[key]), type=pa.float64(), mask=count == 0)
+        return pa.table(result)
+
+    def channel_groups(self) -> typing.List[typing.List[str]]:
+        """
+        Channels that share one timecodes array, in channel order.
+
+        aim_xrk builds the tables of the channels of a group (GRP), and of
+        the GPS channels, on a single timecodes array, so each group's
+        timecodes are stored once.  Channels tables built independently
+        are groups of their own, even if their timecodes are equal.
+        """
+        groups: typing.Dict[typing.Hashable, typing.List[str]] = {}
+        for name, table in self.channels.items():
+            groups.setdefault(_timecodes_key(table), []).append(name)
+        return list(groups.values())
+
+    def group_table(self, names: typing.Sequence[str]) -> pa.Table:
+        """
+        Channels sharing timecodes (see channel_groups()) as one table, with
+        a 'timecodes' column and one column (with its metadata) per channel.
+        No data is copied.
+        """
+        tables = [self.channels[name] for name in names]
+        keys = {_timecodes_key(t) for t in tables}
+        if len(keys) > 1:
+            raise ValueError("Channels %s don't share timecodes" % ", ".join(names))
+        return pa.Table.from_arrays(
+            [tables[0].column(0)] + [t.column(1) for t in tables],
+            schema=pa.schema([tables[0].schema.field(0)] + [t.schema.field(1) for t in tables]),
+        )
 
     def get_channels_as_table(self) -> pa.Table:
         """
@@ -42,6 +333,12 @@ class LogFile:
         if not self.channels:
             # Return an empty table with just timecodes column if no channels
             return pa.table({"timecodes": pa.array([], type=pa.int64())})
+        if any(_is_compact(t) for t in self.channels.values()):
+            # merged on their values (expanded tables keep their timecodes)
+            channels = {name: expand_channel(t) for name, t in self.channels.items()}
+            return LogFile(
+                channels, self.laps, self.metadata, self.file_name
+            ).get_channels_as_table()
 
         # Collect metadata from all channels before joining
         # PyArrow join() doesn't preserve field metadata, so we need to save and restore it
@@ -51,21 +348,24 @@ class LogFile:
             if field.metadata:
                 channel_metadata[channel_name] = field.metadata
 
-        # Start with the first channel
+        # Channels sharing timecodes are already aligned: join a table per
+        # group rather than per channel
         channel_names = sorted(self.channels.keys())
-        result = self.channels[channel_names[0]]
-
-        # Perform full outer joins with remaining channels
-        for channel_name in channel_names[1:]:
-            channel_table = self.channels[channel_name]
+        groups = sorted(sorted(names) for names in self.channel_groups())
+        result = self.group_table(groups[0])
 
-            # Perform full outer join on timecodes
+        # Perform full outer joins with remaining groups
+        for names in groups[1:]:
             result = result.join(
-                channel_table, keys="timecodes", right_keys="timecodes", join_type="full outer"
+                self.group_table(names),
+                keys="timecodes",
+                right_keys="timecodes",
+                join_type="full outer",
             )
 
-        # Sort by timecodes to maintain temporal order
+        # Sort by timecodes to maintain temporal order, channels by name
         result = result.sort_by([("timecodes", "ascending")])
+        result = result.select(["timecodes"] + channel_names)
 
         # Restore column metadata that was lost during join operations
         if channel_metadata:
@@ -0,0 +1,388 @@
+# Copyright 2024, Scott Smith.  MIT License (see LICENSE).
+
+"""
+Benchmarks for GPS conversion, lap detection and import time.
+
+Every benchmark returns BenchResult records (throughput, peak memory and
+error against a known answer) so results can be compared across releases.
+
+Example:
+    python -m libxrk.bench --sizes 100000 1000000 --dtypes float64 float32
+    python -m libxrk.bench --json > bench.json
+"""
+
+import argparse
+from dataclasses import asdict, dataclass, field
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+import typing
+import numpy as np
+
+from . import gps
+
+# Where the synthetic circuit is laid out (Fuji Speedway)
+TRACK_LAT = 35.3700
+TRACK_LON = 138.9270
+
+
+@dataclass(eq=False)
+class BenchResult:
+    """Timing, memory and accuracy of one benchmark case."""
+
+    name: str  # function benchmarked
+    variant: str  # algorithm or code path
+    dtype: str
+    size: int  # items processed per call (points or markers)
+    seconds: float  # best of the repeats
+    peak_memory: int  # bytes allocated at peak during one call
+    max_error: typing.Dict[str, float] = field(default_factory=dict)
+    avg_error: typing.Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def throughput(self) -> float:
+        """Items per second."""
+        return self.size / self.seconds if self.seconds > 0 else float("inf")
+
+    def to_dict(self) -> typing.Dict[str, typing.Any]:
+        ret = asdict(self)
+        ret["throughput"] = self.throughput
+        return ret
+
+
+def _measure(
+    fn: typing.Callable[[], typing.Any], repeat: int
+) -> typing.Tuple[float, int, typing.Any]:
+    # best wall time of repeat calls, then the peak traced allocation of one
+    # more call (tracing slows numpy down, so it isn't timed)
+    best = float("inf")
+    result = None
+    for _ in range(max(repeat, 1)):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    base, _ = tracemalloc.get_traced_memory()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    if not was_tracing:
+        tracemalloc.stop()
+    return best, peak - base, result
+
+
+def _errors(**diffs: np.ndarray) -> typing.Tuple[typing.Dict[str, float], typing.Dict[str, float]]:
+    # max and mean absolute error of each named difference
+    absdiff = {k: np.abs(np.asarray(v, dtype=np.float64)) for k, v in diffs.items()}
+    return (
+        {k: float(np.max(v)) for k, v in absdiff.items()},
+        {k: float(np.mean(v)) for k, v in absdiff.items()},
+    )
+
+
+def random_points(size: int, seed: int = 0) -> typing.Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Points uniformly spread over lat/long, from about the bottom of the
+    Mariana trench to the top of Everest.
+
+    Returns:
+        (lat, long, alt) arrays, degrees and meters
+    """
+    rng = np.random.default_rng(seed)
+    lat = rng.uniform(-90.0, 90.0, size)
+    long = rng.uniform(-180.0, 180.0, size)
+    alt = rng.uniform(-11e3, 9e3, size)
+    return lat, long, alt
+
+
+def circuit(
+    lap_times: typing.Sequence[float],
+    period: int = 100,
+    radius: float = 400.0,
+    noise: float = 0.5,
+    seed: int = 0,
+) -> typing.Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    A car lapping a lobed circuit (tight and fast corners) at TRACK_LAT/LON.
+
+    The start/finish line is at angle 0; each lap is driven at a constant
+    angular rate, sampled every period ms with noise meters of GPS noise.
+
+    Returns:
+        (timecodes ms, XYZ (N, 3) ECEF meters, lap markers ms including 0)
+    """
+    lap_markers = np.concatenate(([0.0], np.cumsum(lap_times)))
+    timecodes = np.arange(0, lap_markers[-1] + 1, period, dtype=np.int64)
+    lap = np.minimum(np.searchsorted(lap_markers, timecodes, side="right") - 1, len(lap_times) - 1)
+    theta = 2 * np.pi * (lap + (timecodes - lap_markers[lap]) / np.asarray(lap_times)[lap])
+    east, north = circuit_point(theta, radius)
+    ENU = np.column_stack([east, north, np.zeros_like(east)])
+    ENU += np.random.default_rng(seed).normal(0, noise, ENU.shape)
+    origin, R = gps.enu_basis(TRACK_LAT, TRACK_LON)
+    return timecodes, origin + ENU @ R, lap_markers
+
+
+def circuit_point(theta: np.ndarray, radius: float = 400.0) -> typing.Tuple[np.ndarray, np.ndarray]:
+    """East, north meters of the circuit() centre line at angle theta."""
+    r = radius * (1 + 0.3 * np.cos(3 * theta))
+    return r * np.cos(theta), r * np.sin(theta)
+
+
+def _lla(east: np.ndarray, north: np.ndarray) -> np.ndarray:
+    # (N, 2) lat, long of local east/north points
+    origin, R = gps.enu_basis(TRACK_LAT, TRACK_LON)
+    XYZ = origin + np.column_stack([east, north, np.zeros_like(east)]) @ R
+    lla = gps.ecef2lla(XYZ[:, 0], XYZ[:, 1], XYZ[:, 2])
+    return np.column_stack([lla.lat, lla.long])
+
+
+def bench_ecef2lla(
+    sizes: typing.Iterable[int] = (1_000_000,),
+    dtypes: typing.Iterable[str] = ("float64", "float32"),
+    algorithms: typing.Iterable[str] = tuple(gps.ECEF2LLA_ALGORITHMS),
+    repeat: int = 3,
+) -> typing.List[BenchResult]:
+    """
+    gps.ecef2lla() on random_points() for each size, output dtype and
+    algorithm.  Errors are against the generating lat (deg), long (deg)
+    and alt (m).
+    """
+    results = []
+    for size in sizes:
+        lat, long, alt = random_points(size)
+        x, y, z = gps.lla2ecef_numpy(lat, long, alt)
+        for dtype in dtypes:
+            for algorithm in algorithms:
+                seconds, peak, out = _measure(
+                    lambda: gps.ecef2lla(x, y, z, algorithm=algorithm, dtype=np.dtype(dtype)),
+                    repeat,
+                )
+                max_error, avg_error = _errors(
+                    lat=out.lat - lat, long=out.long - long, alt=out.alt - alt
+                )
+                results.append(
+                    BenchResult(
+                        "ecef2lla", algorithm, dtype, size, seconds, peak, max_error, avg_error
+                    )
+                )
+    return results
+
+
+def bench_lla2ecef(
+    sizes: typing.Iterable[int] = (1_000_000,),
+    dtypes: typing.Iterable[str] = ("float64", "float32"),
+    repeat: int = 3,
+) -> typing.List[BenchResult]:
+    """
+    gps.lla2ecef() on random_points() for each size and output dtype.
+    The error (m) is the distance from the float64 numpy version.
+    """
+    results = []
+    for size in sizes:
+        lat, long, alt = random_points(size)
+        ref = gps.lla2ecef_numpy(lat, long, alt)
+        for dtype in dtypes:
+            seconds, peak, out = _measure(
+                lambda: gps.lla2ecef(lat, long, alt, dtype=np.dtype(dtype)), repeat
+            )
+            dist = np.sqrt(
+                sum(np.square(np.subtract(o, r, dtype=np.float64)) for o, r in zip(out, ref))
+            )
+            max_error, avg_error = _errors(xyz=dist)
+            results.append(
+                BenchResult("lla2ecef", "", dtype, size, seconds, peak, max_error, avg_error)
+            )
+    return results
+
+
+def bench_find_laps(
+    laps: typing.Iterable[int] = (10, 100),
+    period: int = 100,
+    repeat: int = 3,
+) -> typing.List[BenchResult]:
+    """
+    gps.find_laps() on circuit() sessions of the given number of laps
+    (about 100s each).  The error (ms) is against the true line crossings.
+    """
+    results = []
+    for count in laps:
+        lap_times = np.random.default_rng(count).uniform(95000, 105000, count).round().tolist()
+        timecodes, XYZ, lap_markers = circuit(lap_times, period)
+        marker = tuple(_lla(*circuit_point(np.zeros(1)))[0])
+        seconds, peak, found = _measure(lambda: gps.find_laps(XYZ, timecodes, marker), repeat)
+        if len(found) == len(lap_markers) - 2:
+            max_error, avg_error = _errors(ms=np.subtract(found, lap_markers[1:-1]))
+        else:  # missed or extra laps
+            max_error = avg_error = {"ms": float("inf"), "laps": float(len(found))}
+        results.append(
+            BenchResult(
+                "find_laps", "", "float64", len(timecodes), seconds, peak, max_error, avg_error
+            )
+        )
+    return results
+
+
+def bench_find_crossing_idx(
+    markers: typing.Iterable[int] = (10, 1000),
+    period: int = 100,
+    repeat: int = 3,
+) -> typing.List[BenchResult]:
+    """
+    gps.find_crossing_idx() of markers spread around one circuit() lap,
+    with the dense and indexed code paths.  The error is in samples
+    against the true crossing.
+    """
+    lap_time = 100000
+    timecodes, XYZ, _ = circuit([lap_time], period)
+    samples = lap_time / period
+    results = []
+    for count in markers:
+        theta = 2 * np.pi * (np.arange(count) + 0.5) / count
+        marker = _lla(*circuit_point(theta))
+        for variant, indexed in (("dense", False), ("indexed", True)):
+            seconds, peak, found = _measure(
+                lambda: gps.find_crossing_idx(XYZ, marker, indexed=indexed), repeat
+            )
+            max_error, avg_error = _errors(idx=found[:, 0] - theta / (2 * np.pi) * samples)
+            results.append(
+                BenchResult(
+                    "find_crossing_idx",
+                    variant,
+                    "float64",
+                    count,
+                    seconds,
+                    peak,
+                    max_error,
+                    avg_error,
+                )
+            )
+    return results
+
+
+_IMPORT_SCRIPT = """
+import sys, time, tracemalloc
+if sys.argv[2] == "trace":
+    tracemalloc.start()
+start = time.perf_counter()
+__import__(sys.argv[1])
+seconds = time.perf_counter() - start
+print(seconds, tracemalloc.get_traced_memory()[1])
+"""
+
+
+def bench_import(
+    modules: typing.Iterable[str] = ("libxrk", "libxrk.aim_xrk"),
+    repeat: int = 3,
+) -> typing.List[BenchResult]:
+    """
+    Time to import each module in a fresh interpreter (best of repeat),
+    and the memory allocated by the import.
+    """
+    env = dict(os.environ)
+    src = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [src, env.get("PYTHONPATH")]))
+
+    def _run(module: str, mode: str) -> typing.Tuple[float, int]:
+        out = subprocess.run(
+            [sys.executable, "-c", _IMPORT_SCRIPT, module, mode],
+            env=env,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout.split()
+        return float(out[0]), int(out[1])
+
+    results = []
+    for module in modules:
+        seconds = min(_run(module, "time")[0] for _ in range(max(repeat, 1)))
+        results.append(BenchResult("import", module, "", 1, seconds, _run(module, "trace")[1]))
+    return results
+
+
+def run(
+    sizes: typing.Iterable[int] = (1_000_000,),
+    dtypes: typing.Iterable[str] = ("float64", "float32"),
+    algorithms: typing.Iterable[str] = tuple(gps.ECEF2LLA_ALGORITHMS),
+    laps: typing.Iterable[int] = (10, 100),
+    markers: typing.Iterable[int] = (10, 1000),
+    repeat: int = 3,
+    imports: typing.Iterable[str] = ("libxrk", "libxrk.aim_xrk"),
+) -> typing.List[BenchResult]:
+    """Run every benchmark."""
+    sizes, dtypes = list(sizes), list(dtypes)
+    return (
+        bench_import(imports, repeat)
+        + bench_ecef2lla(sizes, dtypes, algorithms, repeat)
+        + bench_lla2ecef(sizes, dtypes, repeat)
+        + bench_find_laps(laps, repeat=repeat)
+        + bench_find_crossing_idx(markers, repeat=repeat)
+    )
+
+
+def format_results(results: typing.Iterable[BenchResult]) -> str:
+    """Results as a text table."""
+    lines = [
+        "%-18s %-14s %-8s %10s %10s %12s %10s  %s"
+        % ("name", "variant", "dtype", "size", "ms", "items/s", "peak MB", "max / avg error")
+    ]
+    for r in results:
+        errors = ", ".join(
+            "%s %.3g / %.3g" % (k, r.max_error[k], r.avg_error.get(k, float("nan")))
+            for k in r.max_error
+        )
+        lines.append(
+            "%-18s %-14s %-8s %10d %10.2f %12.4g %10.2f  %s"
+            % (
+                r.name,
+                r.variant,
+                r.dtype,
+                r.size,
+                r.seconds * 1000,
+                r.throughput,
+                r.peak_memory / 1e6,
+                errors,
+            )
+        )
+    return "\n".join(lines)
+
+
+def main(argv: typing.Optional[typing.Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000_000])
+    parser.add_argument("--dtypes", nargs="+", default=["float64", "float32"])
+    parser.add_argument(
+        "--algorithms",
+        nargs="+",
+        default=list(gps.ECEF2LLA_ALGORITHMS),
+        choices=list(gps.ECEF2LLA_ALGORITHMS),
+    )
+    parser.add_argument("--laps", type=int, nargs="+", default=[10, 100])
+    parser.add_argument("--markers", type=int, nargs="+", default=[10, 1000])
+    parser.add_argument("--imports", nargs="*", default=["libxrk", "libxrk.aim_xrk"])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args(argv)
+
+    results = run(
+        args.sizes,
+        args.dtypes,
+        args.algorithms,
+        args.laps,
+        args.markers,
+        args.repeat,
+        args.imports,
+    )
+    if args.json:
+        json.dump([r.to_dict() for r in results], sys.stdout, indent=1)
+        print()
+    else:
+        print(format_results(results))
+
+
+if __name__ == "__main__":
+    main()
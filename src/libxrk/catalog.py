@@ -0,0 +1,379 @@
+# Copyright 2024, Scott Smith.  MIT License (see LICENSE).
+
+"""
+SQLite catalogue of XRK sessions: metadata, channels and laps of every
+file in a folder, queryable without opening the files again.
+
+Example:
+    with Catalog("sessions.db") as catalog:
+        catalog.update("logs/")
+        catalog.best_laps(venue="Fuji GP Sh", vehicle="SFJ", limit=1)
+"""
+
+import concurrent.futures
+from dataclasses import dataclass
+import json
+import os
+import sqlite3
+import typing
+import pyarrow as pa
+
+from . import files
+from .base import LogFile
+from .delta import best_lap
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    sha256 TEXT NOT NULL UNIQUE,
+    venue TEXT,
+    vehicle TEXT,
+    driver TEXT,
+    series TEXT,
+    session TEXT,
+    log_date TEXT,  -- ISO date
+    log_time TEXT,
+    metadata TEXT NOT NULL,  -- JSON of all LogFile.metadata
+    lap_count INTEGER NOT NULL,
+    best_lap INTEGER,  -- lap number
+    best_lap_time INTEGER  -- ms
+);
+CREATE INDEX IF NOT EXISTS sessions_venue ON sessions (venue, vehicle, best_lap_time);
+CREATE INDEX IF NOT EXISTS sessions_vehicle ON sessions (vehicle, best_lap_time);
+CREATE INDEX IF NOT EXISTS sessions_date ON sessions (log_date);
+
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,  -- relative to the indexed folder
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    session_id INTEGER NOT NULL REFERENCES sessions (id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS files_session ON files (session_id);
+
+CREATE TABLE IF NOT EXISTS channels (
+    session_id INTEGER NOT NULL REFERENCES sessions (id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    units TEXT NOT NULL,
+    dec_pts INTEGER NOT NULL,
+    interpolate INTEGER NOT NULL,
+    samples INTEGER NOT NULL,
+    PRIMARY KEY (session_id, name)
+);
+CREATE INDEX IF NOT EXISTS channels_name ON channels (name);
+
+CREATE TABLE IF NOT EXISTS laps (
+    session_id INTEGER NOT NULL REFERENCES sessions (id) ON DELETE CASCADE,
+    num INTEGER NOT NULL,
+    start_time INTEGER NOT NULL,
+    end_time INTEGER NOT NULL,
+    lap_time INTEGER NOT NULL,
+    timed INTEGER NOT NULL,  -- 0 for out and in laps, as in delta.best_lap()
+    PRIMARY KEY (session_id, num)
+);
+CREATE INDEX IF NOT EXISTS laps_time ON laps (timed, lap_time);
+"""
+
+# query filters: name -> sessions column
+_FILTERS = {
+    "venue": "venue",
+    "vehicle": "vehicle",
+    "driver": "driver",
+    "series": "series",
+    "session": "session",
+}
+
+
+@dataclass(eq=False)
+class UpdateStats:
+    """What Catalog.update() did."""
+
+    added: int = 0  # sessions decoded and added
+    moved: int = 0  # files matched to an existing session by hash (moved, copied, touched)
+    unchanged: int = 0
+    removed: int = 0  # files no longer in the folder
+    failed: int = 0
+
+
+def summarize(log: LogFile, sha256: str) -> typing.Dict[str, typing.Any]:
+    """
+    Everything the catalogue stores about a log (whose file has the given
+    sha256) as plain, picklable data.
+    """
+    start = log.laps.column("start_time").to_pylist()
+    end = log.laps.column("end_time").to_pylist()
+    nums = log.laps.column("num").to_pylist()
+    timed = [len(nums) < 3 or 0 < i < len(nums) - 1 for i in range(len(nums))]
+    best = best_lap(log) if nums else None
+    channels = []
+    for name, table in sorted(log.channels.items()):
+        meta = table.schema.field(name).metadata or {}
+        channels.append(
+            (
+                name,
+                meta.get(b"units", b"").decode("utf-8"),
+                int(meta.get(b"dec_pts", b"0")),
+                meta.get(b"interpolate", b"") == b"True",
+                table.num_rows,
+            )
+        )
+    date = log.metadata.get("Log Date")
+    return {
+        "sha256": sha256,
+        "venue": log.metadata.get("Venue"),
+        "vehicle": log.metadata.get("Vehicle"),
+        "driver": log.metadata.get("Driver"),
+        "series": log.metadata.get("Series"),
+        "session": log.metadata.get("Session"),
+        "log_date": files.log_date(date) if isinstance(date, str) else None,
+        "log_time": log.metadata.get("Log Time"),
+        "metadata": json.dumps(log.metadata, default=str),
+        "laps": [(n, s, e, e - s, t) for n, s, e, t in zip(nums, start, end, timed)],
+        "best_lap": best,
+        "best_lap_time": None if best is None else end[nums.index(best)] - start[nums.index(best)],
+        "channels": channels,
+    }
+
+
+def _read(path: str) -> LogFile:
+    from .aim_xrk import aim_xrk
+
+    return aim_xrk(path)
+
+
+def _summarize(args: typing.Tuple[str, str]) -> typing.Dict[str, typing.Any]:
+    # worker entry point; errors are returned rather than raised so one bad
+    # file doesn't abort the batch
+    path, sha256 = args
+    try:
+        return summarize(_read(path), sha256)
+    except Exception as e:
+        return {"error": "%s: %s" % (type(e).__name__, e)}
+
+
+class Catalog:
+    """
+    A catalogue database.  Files are tracked by path, size and mtime;
+    sessions by the sha256 of their file, so a file that is moved, copied
+    or touched is not decoded again.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA foreign_keys = ON")
+        self.db.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self.db.close()
+
+    def __enter__(self) -> "Catalog":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def update(
+        self,
+        root: str,
+        jobs: int = 1,
+        progress: typing.Optional[typing.Callable[[str], None]] = None,
+    ) -> UpdateStats:
+        """
+        Bring the catalogue up to date with the XRK files under root.
+
+        Files whose size and mtime are unchanged are skipped.  Others are
+        hashed, and only decoded if no session has that hash.  Files no
+        longer present are dropped, along with sessions left without files.
+
+        Args:
+            root: Folder to index (paths are stored relative to it)
+            jobs: Worker processes for decoding
+            progress: Called with each relative path decoded or failed
+
+        Returns:
+            UpdateStats counts.
+
+        Raises:
+            NotADirectoryError: if root isn't a directory (paths relative
+                to a single file's directory would drop every other file)
+        """
+        if not os.path.isdir(root):
+            raise NotADirectoryError("%s is not a directory" % root)
+        stats = UpdateStats()
+        known = {
+            path: (size, mtime_ns)
+            for path, size, mtime_ns in self.db.execute("SELECT path, size, mtime_ns FROM files")
+        }
+        sources = files.find_sources(root)
+        # new contents: sha256 -> [(source, path)], decoded once per hash
+        todo: typing.Dict[str, typing.List[typing.Tuple[str, str]]] = {}
+        with self.db:
+            for source in sources:
+                path = os.path.join(root, source)
+                st = os.stat(path)
+                if known.get(source) == (st.st_size, st.st_mtime_ns):
+                    stats.unchanged += 1
+                    continue
+                sha256 = files.file_digest(path)
+                row = self.db.execute(
+                    "SELECT id FROM sessions WHERE sha256 = ?", (sha256,)
+                ).fetchone()
+                if row is not None:
+                    self._set_file(source, st, row[0])
+                    stats.moved += 1
+                else:
+                    todo.setdefault(sha256, []).append((source, path))
+
+            gone = set(known) - set(sources)
+            self.db.executemany("DELETE FROM files WHERE path = ?", [(p,) for p in gone])
+            stats.removed = len(gone)
+
+        if todo:
+            args = [(paths[0][1], sha256) for sha256, paths in todo.items()]
+            if jobs > 1:
+                pool = concurrent.futures.ProcessPoolExecutor(max_workers=min(jobs, len(todo)))
+                results: typing.Iterable[typing.Dict[str, typing.Any]] = pool.map(_summarize, args)
+            else:
+                pool = None
+                results = map(_summarize, args)
+            try:
+                for paths, summary in zip(todo.values(), results):
+                    if "error" in summary:
+                        stats.failed += len(paths)
+                    else:
+                        with self.db:
+                            session_id = self._add_session(summary)
+                            for source, path in paths:
+                                self._set_file(source, os.stat(path), session_id)
+                        stats.added += 1
+                        stats.moved += len(paths) - 1
+                    if progress:
+                        for source, _ in paths:
+                            progress(source)
+            finally:
+                if pool is not None:
+                    pool.shutdown()
+
+        with self.db:
+            self.db.execute("DELETE FROM sessions WHERE id NOT IN (SELECT session_id FROM files)")
+        return stats
+
+    def _set_file(self, source: str, st: os.stat_result, session_id: int) -> None:
+        self.db.execute(
+            "INSERT OR REPLACE INTO files (path, size, mtime_ns, session_id) VALUES (?, ?, ?, ?)",
+            (source, st.st_size, st.st_mtime_ns, session_id),
+        )
+
+    def _add_session(self, s: typing.Dict[str, typing.Any]) -> int:
+        cur = self.db.execute(
+            "INSERT INTO sessions (sha256, venue, vehicle, driver, series, session, log_date,"
+            " log_time, metadata, lap_count, best_lap, best_lap_time)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                s["sha256"],
+                s["venue"],
+                s["vehicle"],
+                s["driver"],
+                s["series"],
+                s["session"],
+                s["log_date"],
+                s["log_time"],
+                s["metadata"],
+                len(s["laps"]),
+                s["best_lap"],
+                s["best_lap_time"],
+            ),
+        )
+        session_id = typing.cast(int, cur.lastrowid)
+        self.db.executemany(
+            "INSERT INTO laps (session_id, num, start_time, end_time, lap_time, timed)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            [(session_id,) + tuple(lap) for lap in s["laps"]],
+        )
+        self.db.executemany(
+            "INSERT INTO channels (session_id, name, units, dec_pts, interpolate, samples)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            [(session_id,) + tuple(ch) for ch in s["channels"]],
+        )
+        return session_id
+
+    def _query(self, sql: str, params: typing.Sequence[typing.Any] = ()) -> pa.Table:
+        cur = self.db.execute(sql, params)
+        names = [d[0] for d in cur.description]
+        rows = cur.fetchall()
+        return pa.table({name: [row[i] for row in rows] for i, name in enumerate(names)})
+
+    @staticmethod
+    def _where(filters: typing.Dict[str, typing.Any]) -> typing.Tuple[str, typing.List[typing.Any]]:
+        # values containing % are LIKE patterns (e.g. venue="Fuji%")
+        clauses, params = [], []
+        for key, value in filters.items():
+            if key == "since":
+                clauses.append("s.log_date >= ?")
+            elif key == "until":
+                clauses.append("s.log_date <= ?")
+            elif key in _FILTERS:
+                op = "LIKE" if "%" in str(value) else "="
+                clauses.append("s.%s %s ?" % (_FILTERS[key], op))
+            else:
+                raise TypeError("Unknown filter %r" % key)
+            params.append(value)
+        return (" AND ".join(clauses) or "1"), params
+
+    def sessions(self, **filters: typing.Any) -> pa.Table:
+        """
+        Sessions matching filters (venue, vehicle, driver, series, session,
+        since / until as ISO dates), newest first, one row per session with
+        the path of one of its files.
+        """
+        where, params = self._where({k: v for k, v in filters.items() if v is not None})
+        return self._query(
+            "SELECT s.id, (SELECT MIN(path) FROM files f WHERE f.session_id = s.id) AS path,"
+            " s.venue, s.vehicle, s.driver, s.series, s.session, s.log_date, s.log_time,"
+            " s.lap_count, s.best_lap, s.best_lap_time"
+            " FROM sessions s WHERE %s ORDER BY s.log_date DESC, s.log_time DESC" % where,
+            params,
+        )
+
+    def best_laps(self, limit: typing.Optional[int] = 10, **filters: typing.Any) -> pa.Table:
+        """
+        Fastest timed laps (not out or in laps) across all sessions
+        matching filters (as for sessions()), fastest first.
+
+        Example:
+            catalog.best_laps(venue="Fuji GP Sh", vehicle="SFJ", limit=1)
+        """
+        where, params = self._where({k: v for k, v in filters.items() if v is not None})
+        sql = (
+            "SELECT s.id, (SELECT MIN(path) FROM files f WHERE f.session_id = s.id) AS path,"
+            " s.venue, s.vehicle, s.driver, s.log_date, l.num, l.lap_time"
+            " FROM laps l JOIN sessions s ON s.id = l.session_id"
+            " WHERE l.timed AND %s ORDER BY l.lap_time, s.id, l.num" % where
+        )
+        if limit is not None:
+            sql += " LIMIT %d" % int(limit)
+        return self._query(sql, params)
+
+    def laps(self, session_id: int) -> pa.Table:
+        """The lap table of a session, as LogFile.laps plus lap_time and timed."""
+        return self._query(
+            "SELECT num, start_time, end_time, lap_time, timed FROM laps"
+            " WHERE session_id = ? ORDER BY num",
+            (session_id,),
+        )
+
+    def channels(self, session_id: int) -> pa.Table:
+        """Channel names, units, dec_pts, interpolate and sample counts of a session."""
+        return self._query(
+            "SELECT name, units, dec_pts, interpolate, samples FROM channels"
+            " WHERE session_id = ? ORDER BY name",
+            (session_id,),
+        )
+
+    def metadata(self, session_id: int) -> typing.Dict[str, typing.Any]:
+        """The full metadata of a session, as LogFile.metadata."""
+        row = self.db.execute(
+            "SELECT metadata FROM sessions WHERE id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(session_id)
+        return typing.cast(typing.Dict[str, typing.Any], json.loads(row[0]))
@@ -0,0 +1,327 @@
+# Copyright 2024, Scott Smith.  MIT License (see LICENSE).
+
+"""
+Command line tools.
+
+    libxrk convert SRC DEST [--format parquet|arrow] [--jobs N] [--hash]
+
+converts every XRK file under SRC to a hive partitioned tree under DEST
+(see files.write_log), in parallel worker processes, skipping files whose
+outputs are already up to date.
+
+    libxrk catalog DB SRC [--jobs N]
+    libxrk best DB [--venue V] [--vehicle V] [-n N]
+
+index XRK files into a SQLite catalogue (see catalog.Catalog) and list the
+fastest laps in it.
+
+    libxrk serve ROOT [--host HOST] [--port PORT] [--cache-size N] [--compact]
+
+serves the XRK files under ROOT over Arrow Flight (see flight.SessionServer).
+"""
+
+import argparse
+import concurrent.futures
+import functools
+import os
+import sys
+import time
+import typing
+
+from . import files
+
+
+@functools.lru_cache(maxsize=None)
+def _track_database(path: typing.Optional[str]):
+    # loaded once per worker process
+    if path is None:
+        return None
+    from .tracks import TrackDatabase
+
+    return TrackDatabase.load(path)
+
+
+def _name(source: str) -> str:
+    # output file name: the source's path, so files with the same name in
+    # different directories don't collide within a partition
+    return os.path.splitext(source)[0].replace(os.sep, "__")
+
+
+def convert_file(
+    path: str,
+    source: str,
+    dest: str,
+    format: str = "parquet",
+    gps_channels: typing.Sequence[str] = (),
+    tracks: typing.Optional[str] = None,
+    use_hash: bool = False,
+    memory_budget: typing.Optional[int] = None,
+) -> typing.Tuple[typing.List[str], typing.Optional[str], int]:
+    """
+    Convert one file (runs in a worker process).
+
+    Returns:
+        (outputs relative to dest, sha256 if use_hash, number of samples)
+    """
+    from .aim_xrk import aim_xrk
+
+    sha256 = files.file_digest(path) if use_hash else None
+    log = aim_xrk(
+        path,
+        gps_channels=gps_channels,
+        tracks=_track_database(tracks),
+        memory_budget=memory_budget,
+    )
+    outputs = files.write_log(log, dest, _name(source), format)
+    samples = sum(ch.num_rows for ch in log.channels.values())
+    return outputs, sha256, samples
+
+
+def convert(
+    src: str,
+    dest: str,
+    format: str = "parquet",
+    jobs: typing.Optional[int] = None,
+    use_hash: bool = False,
+    force: bool = False,
+    gps_channels: typing.Sequence[str] = (),
+    tracks: typing.Optional[str] = None,
+    memory_budget: typing.Optional[int] = None,
+    out: typing.TextIO = sys.stdout,
+) -> int:
+    """
+    Convert every XRK file under src into dest.
+
+    Args:
+        src: Directory (or single file) to convert
+        dest: Output directory
+        format: 'parquet' or 'arrow'
+        jobs: Worker processes (default: one per CPU)
+        use_hash: Also treat files with a different mtime but the same
+            sha256 as up to date
+        force: Convert even if up to date
+        gps_channels: Optional GPS channels, as for aim_xrk()
+        tracks: Track database JSON file, as for aim_xrk()
+        memory_budget: Bytes of sample data each worker may hold in memory
+            while decoding, as for aim_xrk()
+        out: Where progress is reported
+
+    Returns:
+        The number of files that failed.
+    """
+    root = src if os.path.isdir(src) else os.path.dirname(src)
+    manifest = files.Manifest.load(dest)
+    sources = files.find_sources(src)
+    todo = []
+    for source in sources:
+        path = os.path.join(root, source)
+        if force or not manifest.up_to_date(source, path, format, use_hash):
+            todo.append((source, path))
+    print("%d files to convert, %d up to date" % (len(todo), len(sources) - len(todo)), file=out)
+
+    failed = 0
+    nbytes = samples = 0
+    start = time.perf_counter()
+    jobs = jobs or os.cpu_count() or 1
+    workers = max(1, min(jobs, len(todo)))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(
+                convert_file,
+                path,
+                source,
+                dest,
+                format,
+                tuple(gps_channels),
+                tracks and os.path.abspath(tracks),
+                use_hash,
+                memory_budget,
+            ): (source, path)
+            for source, path in todo
+        }
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                source, path = futures[future]
+                try:
+                    outputs, sha256, count = future.result()
+                except Exception as e:
+                    failed += 1
+                    print("FAILED %s: %s" % (source, e), file=out)
+                    continue
+                manifest.record(source, path, format, outputs, sha256)
+                nbytes += os.path.getsize(path)
+                samples += count
+                print(source, file=out)
+        finally:
+            manifest.save()
+    elapsed = time.perf_counter() - start
+
+    converted = len(todo) - failed
+    print(
+        "converted %d files (%.1f MB, %d samples) in %.1fs: %.1f files/s, %.1f MB/s%s"
+        % (
+            converted,
+            nbytes / 1e6,
+            samples,
+            elapsed,
+            converted / elapsed if elapsed else 0.0,
+            nbytes / 1e6 / elapsed if elapsed else 0.0,
+            ", %d failed" % failed if failed else "",
+        ),
+        file=out,
+    )
+    return failed
+
+
+def catalog(db: str, src: str, jobs: typing.Optional[int] = None) -> int:
+    """Update the catalogue db from src; returns the number of files that failed."""
+    from .catalog import Catalog
+
+    start = time.perf_counter()
+    with Catalog(db) as cat:
+        stats = cat.update(src, jobs=jobs or os.cpu_count() or 1, progress=print)
+    print(
+        "%d added, %d moved, %d unchanged, %d removed, %d failed in %.1fs"
+        % (
+            stats.added,
+            stats.moved,
+            stats.unchanged,
+            stats.removed,
+            stats.failed,
+            time.perf_counter() - start,
+        )
+    )
+    return 1 if stats.failed else 0
+
+
+def best(db: str, limit: int = 10, **filters: typing.Any) -> int:
+    """Print the fastest laps in the catalogue db."""
+    from .catalog import Catalog
+
+    with Catalog(db) as cat:
+        laps = cat.best_laps(limit, **filters).to_pylist()
+    for lap in laps:
+        print(
+            "%d:%06.3f  %-12s %-16s %-12s %-10s lap %-3d %s"
+            % (
+                lap["lap_time"] // 60000,
+                lap["lap_time"] % 60000 / 1000,
+                lap["venue"],
+                lap["vehicle"],
+                lap["driver"],
+                lap["log_date"],
+                lap["num"],
+                lap["path"],
+            )
+        )
+    return 0
+
+
+def serve(
+    root: str,
+    host: str = "127.0.0.1",
+    port: int = 8815,
+    cache_size: int = 8,
+    compact: bool = False,
+) -> int:
+    """Run a Flight server for root until interrupted."""
+    try:
+        from .flight import SessionServer
+    except ImportError as e:
+        print("libxrk serve needs pyarrow with Flight support: %s" % e, file=sys.stderr)
+        return 1
+
+    kwargs: typing.Dict[str, typing.Any] = {}
+    if compact:
+        from .aim_xrk import aim_xrk
+
+        kwargs["loader"] = functools.partial(aim_xrk, compact=True)
+    server = SessionServer(root, "grpc://%s:%d" % (host, port), cache_size=cache_size, **kwargs)
+    print("serving %s on grpc://%s:%d" % (root, host, server.port))
+    try:
+        server.serve()
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+def main(argv: typing.Optional[typing.Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="libxrk")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("convert", help="convert XRK files to Parquet / Arrow IPC")
+    p.add_argument("src", help="directory of XRK files (searched recursively) or a file")
+    p.add_argument("dest", help="output directory")
+    p.add_argument("--format", choices=list(files.FORMATS), default="parquet")
+    p.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: CPUs)")
+    p.add_argument(
+        "--hash",
+        action="store_true",
+        help="compare contents (sha256) of files whose mtime changed",
+    )
+    p.add_argument("--force", action="store_true", help="convert even if up to date")
+    p.add_argument("--gps-channel", action="append", default=[], help="extra GPS channel")
+    p.add_argument("--tracks", help="track database (JSON) for track lookup")
+    p.add_argument(
+        "--memory-budget",
+        type=int,
+        default=None,
+        metavar="MB",
+        help="sample data (MB) a worker holds in memory before spilling to temporary files",
+    )
+
+    p = commands.add_parser("catalog", help="index XRK files into a SQLite catalogue")
+    p.add_argument("db", help="catalogue database file")
+    p.add_argument("src", help="directory of XRK files (searched recursively)")
+    p.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: CPUs)")
+
+    p = commands.add_parser("best", help="fastest laps in a catalogue")
+    p.add_argument("db", help="catalogue database file")
+    for name in ("venue", "vehicle", "driver", "series", "session"):
+        p.add_argument("--" + name, help="only this %s (%% is a wildcard)" % name)
+    p.add_argument("--since", help="first date (YYYY-MM-DD)")
+    p.add_argument("--until", help="last date (YYYY-MM-DD)")
+    p.add_argument("-n", "--limit", type=int, default=10)
+
+    p = commands.add_parser("serve", help="serve XRK files over Arrow Flight")
+    p.add_argument("root", help="directory of XRK files")
+    p.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    p.add_argument("--port", type=int, default=8815)
+    p.add_argument("--cache-size", type=int, default=8, help="decoded files kept in memory")
+    p.add_argument(
+        "--compact", action="store_true", help="keep decoded values as stored (less memory)"
+    )
+
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        if not os.path.isdir(args.root):
+            parser.error("%s is not a directory" % args.root)
+        return serve(args.root, args.host, args.port, args.cache_size, args.compact)
+    if args.command == "catalog":
+        if not os.path.isdir(args.src):
+            parser.error("%s is not a directory" % args.src)
+        return catalog(args.db, args.src, args.jobs)
+    if args.command == "best":
+        filters = {
+            k: getattr(args, k)
+            for k in ("venue", "vehicle", "driver", "series", "session", "since", "until")
+        }
+        return best(args.db, args.limit, **filters)
+    if not os.path.exists(args.src):
+        parser.error("%s does not exist" % args.src)
+    failed = convert(
+        args.src,
+        args.dest,
+        format=args.format,
+        jobs=args.jobs,
+        use_hash=args.hash,
+        force=args.force,
+        gps_channels=args.gps_channel,
+        tracks=args.tracks,
+        memory_budget=args.memory_budget and args.memory_budget << 20,
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
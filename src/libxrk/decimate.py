@@ -0,0 +1,180 @@
+# Copyright 2024, Scott Smith.  MIT License (see LICENSE).
+
+"""Multi-resolution min/max decimation of channels for plotting."""
+
+from dataclasses import dataclass, field
+import hashlib
+import os
+import tempfile
+import typing
+import numpy as np
+import pyarrow as pa
+
+from .base import LogFile, channel_values, expand_channel
+
+
+@dataclass(eq=False)
+class Pyramid:
+    """
+    Min/max envelope of one channel at power-of-two bucket sizes.
+
+    Level k (k >= 1) holds, for each bucket of 2**k consecutive samples, the
+    index of the bucket's minimum and maximum sample.  Level 0 is the raw
+    channel.
+    """
+
+    timecodes: np.ndarray
+    values: np.ndarray
+    min_idx: typing.List[np.ndarray] = field(default_factory=list, repr=False)
+    max_idx: typing.List[np.ndarray] = field(default_factory=list, repr=False)
+
+    @classmethod
+    def build(cls, timecodes: np.ndarray, values: np.ndarray) -> "Pyramid":
+        pyramid = cls(timecodes, values)
+        min_idx = np.arange(len(values), dtype=np.int32 if len(values) < 2**31 else np.int64)
+        max_idx = min_idx
+        while len(min_idx) > 1:
+            # pair up buckets, the odd one out at the end pairs with itself
+            a_min, b_min = min_idx[0::2], min_idx[1::2]
+            a_max, b_max = max_idx[0::2], max_idx[1::2]
+            if len(b_min) < len(a_min):
+                b_min = np.append(b_min, a_min[-1])
+                b_max = np.append(b_max, a_max[-1])
+            min_idx = np.where(values[b_min] < values[a_min], b_min, a_min)
+            max_idx = np.where(values[b_max] > values[a_max], b_max, a_max)
+            pyramid.min_idx.append(min_idx)
+            pyramid.max_idx.append(max_idx)
+        return pyramid
+
+    @property
+    def levels(self) -> int:
+        return len(self.min_idx) + 1
+
+    def query_indices(self, t0: float, t1: float, pixel_width: int) -> np.ndarray:
+        """
+        Return sorted sample indices to plot timecodes [t0, t1] at pixel_width.
+
+        At most about 2 * pixel_width indices are returned.  When the range has
+        few enough samples the raw samples are returned, otherwise the min and
+        max sample of each bucket at the finest level that has no more than
+        pixel_width buckets over the range.
+        """
+        i0 = int(np.searchsorted(self.timecodes, t0, side="left"))
+        i1 = int(np.searchsorted(self.timecodes, t1, side="right"))
+        n = i1 - i0
+        if n <= 2 * pixel_width:
+            return np.arange(i0, i1)
+        # smallest level whose bucket count over the range fits in pixel_width
+        level = max(int(np.ceil(np.log2(n / max(pixel_width - 1, 1)))), 1)
+        level = min(level, self.levels - 1)
+        b0 = i0 >> level
+        b1 = (i1 - 1) >> level
+        lo = self.min_idx[level - 1][b0 : b1 + 1].copy()
+        hi = self.max_idx[level - 1][b0 : b1 + 1].copy()
+        # the first and last buckets can reach outside [i0, i1): theirs
+        # are the extremes of the raw samples inside it
+        for k, start, end in ((0, i0, min((b0 + 1) << level, i1)), (-1, max(b1 << level, i0), i1)):
+            lo[k] = start + np.argmin(self.values[start:end])
+            hi[k] = start + np.argmax(self.values[start:end])
+        idx = np.column_stack([np.minimum(lo, hi), np.maximum(lo, hi)]).ravel()
+        # min and max are the same sample for flat buckets
+        return idx[np.concatenate(([True], idx[1:] != idx[:-1]))]
+
+    def save(self, path: str) -> None:
+        """Save to path, atomically: readers see the old file or the whole new one."""
+        arrays: typing.Dict[str, typing.Any] = {
+            "timecodes": self.timecodes,
+            "values": self.values,
+        }
+        for k, (lo, hi) in enumerate(zip(self.min_idx, self.max_idx)):
+            arrays["min%d" % k] = lo
+            arrays["max%d" % k] = hi
+        fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(path) or ".")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(tmp, path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> "Pyramid":
+        with np.load(path) as data:
+            pyramid = cls(data["timecodes"], data["values"])
+            k = 0
+            while "min%d" % k in data:
+                pyramid.min_idx.append(data["min%d" % k])
+                pyramid.max_idx.append(data["max%d" % k])
+                k += 1
+        return pyramid
+
+
+@dataclass(eq=False)
+class Decimator:
+    """
+    Decimation pyramids for the channels of a LogFile, built on first use.
+
+    If cache_dir is given, pyramids are also saved there and reloaded by later
+    Decimators for the same (unchanged) file.
+
+    Example:
+        dec = Decimator(log, cache_dir="/tmp/xrk-cache")
+        table = dec.query("RPM", 60000, 180000, pixel_width=1200)
+    """
+
+    log: LogFile
+    cache_dir: typing.Optional[str] = None
+    pyramids: typing.Dict[str, Pyramid] = field(default_factory=dict, repr=False)
+
+    def _cache_path(self, channel: str) -> typing.Optional[str]:
+        if self.cache_dir is None:
+            return None
+        key = [os.path.abspath(self.log.file_name), channel]
+        try:
+            st = os.stat(self.log.file_name)
+            key += [str(st.st_size), str(st.st_mtime_ns)]
+        except OSError:
+            pass
+        digest = hashlib.sha1("\0".join(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, digest + ".npz")
+
+    def pyramid(self, channel: str) -> Pyramid:
+        """Return the pyramid for channel, building (or loading) it if needed."""
+        if channel in self.pyramids:
+            return self.pyramids[channel]
+        path = self._cache_path(channel)
+        if path is not None and os.path.exists(path):
+            pyramid = Pyramid.load(path)
+        else:
+            table = self.log.channels[channel]
+            pyramid = Pyramid.build(
+                table.column("timecodes").to_numpy(),
+                channel_values(table),
+            )
+            if path is not None:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                pyramid.save(path)
+        self.pyramids[channel] = pyramid
+        return pyramid
+
+    def query(self, channel: str, t0: float, t1: float, pixel_width: int) -> pa.Table:
+        """
+        Return at most about 2 * pixel_width points of channel between t0 and t1.
+
+        Args:
+            channel: Channel name
+            t0, t1: Time range (ms)
+            pixel_width: Horizontal resolution of the plot
+
+        Returns:
+            A channel table (the schema and metadata of
+            log.channels[channel], with values as channel_values() gives
+            them) holding the min/max envelope of the range, in time order.
+        """
+        pyramid = self.pyramid(channel)
+        idx = pyramid.query_indices(t0, t1, pixel_width)
+        schema = expand_channel(self.log.channels[channel].slice(0, 0)).schema
+        return pa.table(
+            {"timecodes": pyramid.timecodes[idx], channel: pyramid.values[idx]}, schema=schema
+        )
@@ -0,0 +1,125 @@
+# Copyright 2024, Scott Smith.  MIT License (see LICENSE).
+
+"""
+How channel samples are decoded.
+
+A channel's definition (its CHS message) gives a type code (byte 20)
+that says how its samples are stored.  The Decoder registered for that
+code reads them; a decoder registered for a channel's name takes
+precedence, for channels whose type code is misleading.  Channels with
+no decoder are skipped.
+
+Decoders for other logger firmware can be added without changing
+libxrk:
+
+    from libxrk import decoders
+
+    decoders.register(30, decoders.Decoder("h", interpolate=True))
+    decoders.register("Lambda", decoders.Decoder("H", fixup=lambda a: a / 1000))
+
+Fixups are vectorised: they take all of a channel's samples as one numpy
+array and return the values.
+"""
+
+from dataclasses import dataclass
+import functools
+import typing
+import numpy as np
+
+
+@dataclass(eq=False)
+class Decoder:
+    """
+    How to read a channel's samples.
+
+    Attributes:
+        stype: Type of a stored sample (a struct/numpy code, e.g. 'H')
+        interpolate: Whether values between samples are interpolated
+            (see base.channel_metadata)
+        fixup: Converts the array of stored samples (of stype) to values
+        raw: Numpy type compact decodes keep the samples as, instead of
+            applying fixup (see aim_xrk(..., compact=True))
+    """
+
+    stype: str
+    interpolate: bool = False
+    fixup: typing.Optional[typing.Callable[[np.ndarray], np.ndarray]] = None
+    raw: typing.Optional[typing.Type[np.generic]] = None
+
+
+def half_float(a: np.ndarray) -> np.ndarray:
+    """float16 samples (stored as 'H') as float32."""
+    return np.asarray(a).view(np.float16).astype(np.float32)
+
+
+@functools.cache
+def _gear_table() -> np.ndarray:
+    # built on first use
+    table = np.arange(65536, dtype=np.uint16)
+    for gear, c in enumerate("N123456"):
+        table[ord(c)] = gear
+    return table
+
+
+def gear_char(a: np.ndarray) -> np.ndarray:
+    """Gears stored as characters ('N', '1' .. '6') as numbers (0 for N)."""
+    result: np.ndarray = _gear_table()[np.asarray(a)]
+    return result
+
+
+def calculated_gear(a: np.ndarray) -> np.ndarray:
+    """Logger calculated gears: bits 16-18, or 0 if bit 19 (no gear) is set."""
+    a = np.asarray(a)
+    return np.where(a & 0x80000, 0, (a >> 16) & 7).astype(np.uint32)
+
+
+_by_type: typing.Dict[int, Decoder] = {
+    0: Decoder("i"),  # Master Clock on M4GT4?
+    1: Decoder("H", interpolate=True, fixup=half_float, raw=np.float16),
+    3: Decoder("i"),  # Master Clock on ScottE46?
+    4: Decoder("h"),
+    6: Decoder("f", interpolate=True),
+    11: Decoder("h"),
+    12: Decoder("i"),  # Predictive Time?
+    13: Decoder("B"),  # status field?
+    15: Decoder("H", fixup=gear_char),  # ?? NdscSwitch on M4GT4.  Also actual size is 8 bytes
+    20: Decoder("H", interpolate=True, fixup=half_float, raw=np.float16),
+    24: Decoder("i"),  # Best Run Diff?
+}
+
+_by_name: typing.Dict[str, Decoder] = {
+    "Calculated_Gear": Decoder("Q", fixup=calculated_gear),
+    "PreCalcGear": Decoder("Q", fixup=calculated_gear),
+}
+
+
+def _registry(key: typing.Union[int, str]) -> typing.Dict[typing.Any, Decoder]:
+    if isinstance(key, str):
+        return _by_name
+    if isinstance(key, int) and 0 <= key < 256:
+        return _by_type
+    raise TypeError("Decoder key must be a type code (0-255) or a channel name, not %r" % (key,))
+
+
+def register(key: typing.Union[int, str], decoder: Decoder, replace: bool = False) -> None:
+    """
+    Use decoder for channels with type code key (an int) or named key.
+
+    Raises:
+        ValueError: if key already has a decoder (unless replace)
+    """
+    registry = _registry(key)
+    if key in registry and not replace:
+        raise ValueError("A decoder is already registered for %r" % (key,))
+    registry[key] = decoder
+
+
+def unregister(key: typing.Union[int, str]) -> None:
+    """Remove the decoder for key (raises KeyError if there is none)."""
+    del _registry(key)[key]
+
+
+def lookup(name: str, type_code: int) -> typing.Optional[Decoder]:
+    """The decoder for a channel, by its name then its type code (None if neither)."""
+    decoder = _by_name.get(name)
+    return decoder if decoder is not None else _by_type.get(type_code)
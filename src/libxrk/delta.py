@@ -0,0 +1,159 @@
+# Copyright 2024, Scott Smith.  MIT License (see LICENSE).
+
+"""Running delta time of every lap against a reference lap."""
+
+import typing
+import numpy as np
+import pyarrow as pa
+
+from .base import LogFile
+from .distance import ground_ecef, resample_by_distance
+from .spatial import SegmentGrid
+
+
+def best_lap(log: LogFile) -> int:
+    """
+    Return the number of the fastest lap.
+
+    When there are at least 3 laps the first (out) and last (in) laps are
+    not considered.
+    """
+    nums = log.laps.column("num").to_numpy()
+    times = log.laps.column("end_time").to_numpy() - log.laps.column("start_time").to_numpy()
+    if len(nums) >= 3:
+        nums, times = nums[1:-1], times[1:-1]
+    if not len(nums):
+        raise ValueError("No laps")
+    return int(nums[np.argmin(times)])
+
+
+def lap_deltas(
+    log: LogFile,
+    reference_lap: typing.Optional[int] = None,
+    laps: typing.Optional[typing.Iterable[int]] = None,
+    mode: str = "position",
+    step: float = 1.0,
+    max_offset: float = 30.0,
+) -> pa.Table:
+    """
+    Compute running delta time for laps against a reference lap in one batched pass.
+
+    In 'position' mode every GPS sample of every lap is projected onto the
+    nearest point of the reference lap trajectory, using a grid index over
+    the reference segments instead of comparing against every reference
+    point.  The delta is the lap's elapsed time minus the reference lap's
+    elapsed time at the projected point.
+
+    In 'distance' mode every lap is resampled onto a uniform distance grid
+    (see distance.resample_by_distance) and compared at equal distance from
+    the start of the lap.
+
+    Args:
+        log: LogFile with GPS channels and laps
+        reference_lap: Lap number to compare against (default: best_lap())
+        laps: Lap numbers to compute deltas for (default: all laps)
+        mode: 'position' or 'distance'
+        step: Grid spacing in meters for 'distance' mode
+        max_offset: In 'position' mode, samples further than this (meters)
+            from the reference trajectory get a null delta
+
+    Returns:
+        A PyArrow table with columns 'num', 'distance' (meters along the
+        reference lap for 'position', from lap start for 'distance'),
+        'lap_time' (ms since lap start) and 'delta' (ms, positive = slower
+        than reference).  'position' mode also includes 'timecodes'.
+    """
+    if reference_lap is None:
+        reference_lap = best_lap(log)
+    if mode == "distance":
+        return _distance_deltas(log, reference_lap, laps, step)
+    if mode != "position":
+        raise ValueError("Unknown delta mode %r" % mode)
+
+    nums = log.laps.column("num").to_numpy()
+    start = log.laps.column("start_time").to_numpy()
+    end = log.laps.column("end_time").to_numpy()
+    ref = np.nonzero(nums == reference_lap)[0]
+    if not len(ref):
+        raise ValueError("No lap %d" % reference_lap)
+    ref_start, ref_end = start[ref[0]], end[ref[0]]
+
+    timecodes, XYZ = ground_ecef(log)
+
+    # reference trajectory, elapsed time and cumulative distance along it
+    in_ref = (timecodes >= ref_start) & (timecodes <= ref_end)
+    ref_XYZ = XYZ[in_ref]
+    ref_elapsed = timecodes[in_ref] - ref_start
+    ref_dist = np.concatenate(
+        ([0.0], np.cumsum(np.sqrt(np.sum(np.square(np.diff(ref_XYZ, axis=0)), axis=1))))
+    )
+    grid = SegmentGrid(ref_XYZ, cell_size=max_offset)
+
+    # all samples of all requested laps in one query
+    lap_idx = np.searchsorted(start, timecodes, side="right") - 1
+    pick = (lap_idx >= 0) & (timecodes <= end[np.maximum(lap_idx, 0)])
+    if laps is not None:
+        pick &= np.isin(nums[np.maximum(lap_idx, 0)], np.fromiter(laps, dtype=nums.dtype))
+    sample_tc = timecodes[pick]
+    lap_idx = lap_idx[pick]
+
+    seg, t, _ = grid.nearest(XYZ[pick], max_offset)
+    found = seg >= 0
+    seg_c = np.maximum(seg, 0)
+    t_c = np.nan_to_num(t)
+    proj_dist = ref_dist[seg_c] + t_c * (ref_dist[seg_c + 1] - ref_dist[seg_c])
+    proj_time = ref_elapsed[seg_c] + t_c * (ref_elapsed[seg_c + 1] - ref_elapsed[seg_c])
+    lap_time = (sample_tc - start[lap_idx]).astype(np.float64)
+
+    # Near the start/finish line the reference start and end are equally
+    # close; snap projections that wrapped around to the matching end.
+    half = ref_elapsed[-1] / 2
+    wrapped_back = proj_time - lap_time > half
+    wrapped_fwd = lap_time - proj_time > half
+    proj_time[wrapped_back] = 0
+    proj_dist[wrapped_back] = 0
+    proj_time[wrapped_fwd] = ref_elapsed[-1]
+    proj_dist[wrapped_fwd] = ref_dist[-1]
+
+    return pa.table(
+        {
+            "num": pa.array(nums[lap_idx], type=pa.int32()),
+            "timecodes": pa.array(sample_tc, type=pa.int64()),
+            "distance": pa.array(proj_dist, mask=~found),
+            "lap_time": pa.array(lap_time),
+            "delta": pa.array(lap_time - proj_time, mask=~found),
+        }
+    )
+
+
+def _distance_deltas(
+    log: LogFile,
+    reference_lap: int,
+    laps: typing.Optional[typing.Iterable[int]],
+    step: float,
+) -> pa.Table:
+    requested = None if laps is None else set(laps)
+    grid = resample_by_distance(
+        log, [], step=step, laps=None if requested is None else requested | {reference_lap}
+    )
+    nums = grid.column("num").to_numpy()
+    distance = grid.column("distance").to_numpy()
+    lap_time = grid.column("lap_time").to_numpy()
+
+    ref_time = lap_time[nums == reference_lap]
+    if not len(ref_time):
+        raise ValueError("No lap %d" % reference_lap)
+    k = np.rint(distance / step).astype(np.int64)
+    beyond = k >= len(ref_time)
+    delta = lap_time - ref_time[np.minimum(k, len(ref_time) - 1)]
+    table = pa.table(
+        {
+            "num": pa.array(nums, type=pa.int32()),
+            "distance": pa.array(distance),
+            "lap_time": pa.array(lap_time),
+            "delta": pa.array(delta, mask=beyond),
+        }
+    )
+    if requested is not None and reference_lap not in requested:
+        table = table.filter(pa.array(nums != reference_lap))
+    return table
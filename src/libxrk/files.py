@@ -0,0 +1,215 @@
+# Copyright 2024, Scott Smith.  MIT License (see LICENSE).
+
+"""Writing LogFiles to Parquet / Arrow IPC files and tracking what is up to date."""
+
+from dataclasses import dataclass, field
+import datetime
+import hashlib
+import json
+import os
+import typing
+import urllib.parse
+import pyarrow as pa
+
+from .base import LogFile
+
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+XRK_EXTENSIONS = (".xrk",)
+
+# value hive uses for a partition column without a value
+HIVE_DEFAULT_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+
+def log_date(value: str) -> typing.Optional[str]:
+    """The 'Log Date' metadata (MM/DD/YYYY) as an ISO date, or None."""
+    try:
+        return datetime.datetime.strptime(value.strip(), "%m/%d/%Y").date().isoformat()
+    except ValueError:
+        return None
+
+
+def find_sources(src: str) -> typing.List[str]:
+    """XRK files under src (or src itself), sorted, as paths relative to src."""
+    if os.path.isfile(src):
+        return [os.path.basename(src)]
+    found = []
+    for dirpath, dirnames, filenames in os.walk(src):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if name.lower().endswith(XRK_EXTENSIONS):
+                found.append(os.path.relpath(os.path.join(dirpath, name), src))
+    return found
+
+
+def _partition_value(value: typing.Any) -> str:
+    value = str(value).strip() if value is not None else ""
+    if not value:
+        return HIVE_DEFAULT_PARTITION
+    # '/' and '=' would break the layout; readers (pyarrow, spark) decode %xx
+    return urllib.parse.quote(value, safe=" ,()&+'")
+
+
+def partition(log: LogFile) -> typing.Dict[str, str]:
+    """
+    The hive partition of a log: venue, date (ISO) and session from its
+    metadata, encoded for use in a path.
+    """
+    date = log.metadata.get("Log Date")
+    return {
+        "venue": _partition_value(log.metadata.get("Venue")),
+        "date": _partition_value(log_date(date) if isinstance(date, str) else None),
+        "session": _partition_value(log.metadata.get("Session")),
+    }
+
+
+def partition_path(log: LogFile) -> str:
+    """Relative directory of a log's partition, e.g. venue=X/date=2025-11-04/session=Y."""
+    return os.path.join(*("%s=%s" % kv for kv in partition(log).items()))
+
+
+def _with_metadata(table: pa.Table, log: LogFile) -> pa.Table:
+    # file level metadata travels in the schema, channel metadata is
+    # already on the fields
+    meta = dict(table.schema.metadata or {})
+    meta[b"libxrk.metadata"] = json.dumps(log.metadata, default=str).encode("utf-8")
+    meta[b"libxrk.file_name"] = os.path.basename(log.file_name).encode("utf-8")
+    return table.replace_schema_metadata(meta)
+
+
+def _write_table(table: pa.Table, path: str, format: str) -> None:
+    # write to a temporary name first so a crash never leaves a truncated
+    # output that looks up to date
+    tmp = path + ".tmp"
+    if format == "parquet":
+        import pyarrow.parquet as pq
+
+        pq.write_table(table, tmp)
+    else:
+        with pa.OSFile(tmp, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+    os.replace(tmp, path)
+
+
+def write_log(log: LogFile, root: str, name: str, format: str = "parquet") -> typing.List[str]:
+    """
+    Write a log under root in a hive partitioned layout:
+
+        root/channels/venue=../date=../session=../<name>.parquet
+        root/laps/venue=../date=../session=../<name>.parquet
+
+    The channels file is LogFile.get_channels_as_table(), the laps file is
+    LogFile.laps; both carry the log's metadata in their schema metadata.
+
+    Args:
+        log: LogFile to write
+        root: Output directory
+        name: File name (without extension) within the partition
+        format: 'parquet' or 'arrow' (Arrow IPC file)
+
+    Returns:
+        Paths of the written files, relative to root.
+    """
+    if format not in FORMATS:
+        raise ValueError("Unknown format %r" % format)
+    part = partition_path(log)
+    outputs = []
+    for kind, table in (("channels", log.get_channels_as_table()), ("laps", log.laps)):
+        rel = os.path.join(kind, part, name + FORMATS[format])
+        path = os.path.join(root, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _write_table(_with_metadata(table, log), path, format)
+        outputs.append(rel)
+    return outputs
+
+
+def file_digest(path: str) -> str:
+    """sha256 of a file's contents."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+@dataclass(eq=False)
+class Manifest:
+    """
+    What has been converted: for each source file (relative path) its
+    size, mtime, optionally sha256, the output format and output files.
+
+    Stored as JSON in the output directory; the leading underscore keeps
+    dataset readers from treating it as data.
+    """
+
+    root: str
+    entries: typing.Dict[str, typing.Dict[str, typing.Any]] = field(default_factory=dict)
+
+    FILE_NAME: typing.ClassVar[str] = "_manifest.json"
+
+    @classmethod
+    def load(cls, root: str) -> "Manifest":
+        try:
+            with open(os.path.join(root, cls.FILE_NAME), "r", encoding="utf-8") as f:
+                entries = json.load(f).get("files", {})
+        except FileNotFoundError:
+            entries = {}
+        return cls(root, entries)
+
+    def save(self) -> None:
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, self.FILE_NAME)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"files": self.entries}, f, indent=1, sort_keys=True)
+        os.replace(path + ".tmp", path)
+
+    def up_to_date(self, source: str, path: str, format: str, use_hash: bool = False) -> bool:
+        """
+        Whether the outputs of source (key, relative to the input tree) at
+        path exist and were made from the same file in the same format.
+        Files match by size and mtime, or with use_hash by size and sha256
+        (e.g. after a copy changed the mtime), in which case the entry takes
+        the new mtime so the next check needn't hash the file again.
+        """
+        entry = self.entries.get(source)
+        if entry is None or entry.get("format") != format:
+            return False
+        if not all(os.path.exists(os.path.join(self.root, o)) for o in entry["outputs"]):
+            return False
+        st = os.stat(path)
+        if st.st_size != entry["size"]:
+            return False
+        if st.st_mtime_ns == entry["mtime_ns"]:
+            return True
+        if not use_hash or entry.get("sha256") != file_digest(path):
+            return False
+        entry["mtime_ns"] = st.st_mtime_ns
+        return True
+
+    def record(
+        self,
+        source: str,
+        path: str,
+        format: str,
+        outputs: typing.List[str],
+        sha256: typing.Optional[str] = None,
+    ) -> None:
+        """Note source was converted, removing outputs it no longer has."""
+        old = self.entries.get(source)
+        if old is not None:
+            for o in set(old["outputs"]) - set(outputs):
+                try:
+                    os.remove(os.path.join(self.root, o))
+                except FileNotFoundError:
+                    pass
+        st = os.stat(path)
+        entry: typing.Dict[str, typing.Any] = {
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "format": format,
+            "outputs": outputs,
+        }
+        if sha256 is not None:
+            entry["sha256"] = sha256
+        self.entries[source] = entry
@@ -0,0 +1,302 @@
+# Copyright 2024, Scott Smith.  MIT License (see LICENSE).
+
+"""
+Arrow Flight service for decoded sessions.
+
+Tools that read the same XRK files (a web UI, notebooks, reports) can
+share one server, which decodes each file once and keeps the most
+recently used LogFiles in memory:
+
+    libxrk serve logs/ --port 8815
+
+Requests (tickets and command descriptors) are JSON Query objects, e.g.
+
+    client = pyarrow.flight.connect("grpc://localhost:8815")
+    query = {"path": "2025/fuji_0033.xrk", "channels": ["RPM", "GPS Speed"], "lap": 3}
+    table = client.do_get(pyarrow.flight.Ticket(json.dumps(query))).read_all()
+
+list_flights() lists the XRK files under the server's root.  The
+"metadata" action returns a file's LogFile.metadata (JSON) and "clear"
+empties the cache.
+
+Needs pyarrow built with Flight (as the pyarrow wheels are).
+"""
+
+import collections
+import concurrent.futures
+from dataclasses import dataclass
+import json
+import os
+import threading
+import typing
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.flight as flight
+
+from . import files
+from .base import LogFile, expand_channel
+
+TABLES = ("merged", "channel", "laps")
+
+
+def _load(path: str) -> LogFile:
+    from .aim_xrk import aim_xrk
+
+    return aim_xrk(path)
+
+
+class SessionCache:
+    """
+    LRU of decoded LogFiles, keyed by path, size and mtime (so a file that
+    changes is decoded again).  Safe to use from several threads; a file
+    requested by several at once is decoded once.
+    """
+
+    def __init__(self, size: int = 8, loader: typing.Callable[[str], LogFile] = _load):
+        self.size = size
+        self.loader = loader
+        self._lock = threading.Lock()
+        self._entries: "collections.OrderedDict[tuple, concurrent.futures.Future]" = (
+            collections.OrderedDict()
+        )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, path: str) -> LogFile:
+        st = os.stat(path)
+        key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+        with self._lock:
+            entry = self._entries.get(key)
+            load = entry is None
+            if entry is None:
+                entry = self._entries[key] = concurrent.futures.Future()
+            self._entries.move_to_end(key)
+        if load:
+            try:
+                entry.set_result(self.loader(path))
+            except BaseException as e:
+                with self._lock:
+                    self._entries.pop(key, None)
+                entry.set_exception(e)
+                raise
+            self._evict()
+        log: LogFile = entry.result()
+        return log
+
+    def _evict(self) -> None:
+        with self._lock:
+            # oldest first; files still being decoded stay
+            for key in [k for k, e in self._entries.items() if e.done()]:
+                if len(self._entries) <= self.size:
+                    break
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+def _time_slice(
+    table: pa.Table, start: typing.Optional[int], end: typing.Optional[int], margin: int = 0
+) -> pa.Table:
+    # timecodes are sorted: a zero copy slice of [start, end), widened by
+    # margin samples on each side
+    tc = table.column("timecodes").to_numpy()
+    i0 = 0 if start is None else int(np.searchsorted(tc, start, side="left"))
+    i1 = len(tc) if end is None else int(np.searchsorted(tc, end, side="left"))
+    i0, i1 = max(i0 - margin, 0), min(i1 + margin, len(tc))
+    return table.slice(i0, max(i1 - i0, 0))
+
+
+@dataclass(eq=False)
+class Query:
+    """
+    What to get from a file.
+
+    Attributes:
+        path: XRK file, relative to the server's root
+        table: 'merged' (LogFile.get_channels_as_table() of the channels'
+            samples in the time range),
+            'channel' (the one channel's own table) or 'laps'
+        channels: Channels to include (default: all).  Values are as
+            channel_values() gives them, for files decoded compact too
+        lap: Only the time of this lap (laps with num == lap)
+        start, end: Only timecodes in [start, end) (ms), within the lap if
+            there is one
+    """
+
+    path: str
+    table: str = "merged"
+    channels: typing.Optional[typing.List[str]] = None
+    lap: typing.Optional[int] = None
+    start: typing.Optional[int] = None
+    end: typing.Optional[int] = None
+
+    FIELDS: typing.ClassVar[typing.Tuple[str, ...]] = (
+        "path",
+        "table",
+        "channels",
+        "lap",
+        "start",
+        "end",
+    )
+
+    @classmethod
+    def parse(cls, data: typing.Union[bytes, str]) -> "Query":
+        """Query from JSON, raising ValueError for anything malformed."""
+        try:
+            values = json.loads(data)
+        except ValueError as e:
+            raise ValueError("Query is not JSON: %s" % e) from e
+        if not isinstance(values, dict) or "path" not in values:
+            raise ValueError("Query must be an object with a path")
+        unknown = set(values) - set(cls.FIELDS)
+        if unknown:
+            raise ValueError("Unknown query fields: %s" % ", ".join(sorted(unknown)))
+        for name, value in values.items():
+            if value is None and name not in ("path", "table"):
+                continue
+            if name in ("path", "table"):
+                valid = isinstance(value, str)
+            elif name == "channels":
+                valid = isinstance(value, list) and all(isinstance(c, str) for c in value)
+            else:  # lap, start, end
+                valid = isinstance(value, int) and not isinstance(value, bool)
+            if not valid:
+                raise ValueError("Bad query %s: %r" % (name, value))
+        query = cls(**values)
+        if query.table not in TABLES:
+            raise ValueError("Unknown table %r, expected one of %s" % (query.table, TABLES))
+        if query.table == "channel" and (query.channels is None or len(query.channels) != 1):
+            raise ValueError("A channel table needs exactly one channel")
+        return query
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {k: getattr(self, k) for k in self.FIELDS if getattr(self, k) is not None}
+        )
+
+    def time_range(self, log: LogFile) -> typing.Tuple[typing.Optional[int], typing.Optional[int]]:
+        """[start, end) of the query in log, None for unbounded."""
+        start, end = self.start, self.end
+        if self.lap is not None:
+            laps = log.laps.to_pydict()
+            if self.lap not in laps["num"]:
+                raise KeyError("No lap %d" % self.lap)
+            i = laps["num"].index(self.lap)
+            lap_start, lap_end = laps["start_time"][i], laps["end_time"][i]
+            start = lap_start if start is None else max(start, lap_start)
+            end = lap_end if end is None else min(end, lap_end)
+        return start, end
+
+    def select(self, log: LogFile) -> pa.Table:
+        """The table the query asks for."""
+        if self.table == "laps":
+            laps = log.laps
+            if self.lap is not None:
+                laps = laps.filter(pc.equal(laps.column("num"), self.lap))
+            return laps
+        names = list(log.channels) if self.channels is None else self.channels
+        missing = [n for n in names if n not in log.channels]
+        if missing:
+            raise KeyError("No channels %s" % ", ".join(missing))
+        start, end = self.time_range(log)
+        if self.table == "channel":
+            return expand_channel(_time_slice(log.channels[names[0]], start, end))
+        # merge only the samples in range and one either side of it, which
+        # fill the range's edges as the whole merge would (slices of a
+        # group still share their timecodes)
+        subset = LogFile(
+            {n: _time_slice(log.channels[n], start, end, margin=1) for n in names},
+            log.laps,
+            log.metadata,
+            log.file_name,
+        )
+        # columns in the order asked for
+        merged = subset.get_channels_as_table().select(["timecodes"] + names)
+        return _time_slice(merged, start, end)
+
+
+class SessionServer(flight.FlightServerBase):
+    """
+    Flight server for the XRK files under root.
+
+    Args:
+        root: Directory of XRK files; queries can't reach outside it
+        location: Where to listen, e.g. "grpc://0.0.0.0:8815" (the default
+            picks a free port on localhost; see .port)
+        cache_size: Number of decoded files to keep
+        loader: Reads a file (default: aim_xrk)
+    """
+
+    def __init__(
+        self,
+        root: str,
+        location: str = "grpc://127.0.0.1:0",
+        cache_size: int = 8,
+        loader: typing.Callable[[str], LogFile] = _load,
+        **kwargs: typing.Any,
+    ):
+        super().__init__(location, **kwargs)
+        self.root = os.path.realpath(root)
+        self.cache = SessionCache(cache_size, loader)
+
+    def _path(self, path: str) -> str:
+        full = os.path.realpath(os.path.join(self.root, path))
+        if os.path.commonpath([full, self.root]) != self.root:
+            raise ValueError("%s is outside the served directory" % path)
+        if not os.path.isfile(full):
+            raise FileNotFoundError(path)
+        return full
+
+    def _query(self, descriptor: flight.FlightDescriptor) -> Query:
+        if descriptor.descriptor_type == flight.DescriptorType.PATH:
+            return Query(os.path.join(*[p.decode("utf-8") for p in descriptor.path]))
+        return Query.parse(descriptor.command)
+
+    def table(self, query: Query) -> pa.Table:
+        """Answer a query."""
+        return query.select(self.cache.get(self._path(query.path)))
+
+    def _info(self, query: Query, table: typing.Optional[pa.Table]) -> flight.FlightInfo:
+        ticket = flight.Ticket(query.to_json().encode("utf-8"))
+        return flight.FlightInfo(
+            table.schema if table is not None else pa.schema([]),
+            flight.FlightDescriptor.for_command(query.to_json()),
+            [flight.FlightEndpoint(ticket, [])],
+            table.num_rows if table is not None else -1,
+            table.nbytes if table is not None else -1,
+        )
+
+    def list_flights(self, context, criteria):
+        # without decoding anything: no schemas or sizes
+        for source in files.find_sources(self.root):
+            yield self._info(Query(source.replace(os.sep, "/")), None)
+
+    def get_flight_info(self, context, descriptor):
+        query = self._query(descriptor)
+        return self._info(query, self.table(query))
+
+    def get_schema(self, context, descriptor):
+        return flight.SchemaResult(self.table(self._query(descriptor)).schema)
+
+    def do_get(self, context, ticket):
+        return flight.RecordBatchStream(self.table(Query.parse(ticket.ticket)))
+
+    def list_actions(self, context):
+        return [
+            ("metadata", "LogFile.metadata (JSON) of the file in the body (a query)"),
+            ("clear", "Drop all decoded files"),
+        ]
+
+    def do_action(self, context, action):
+        if action.type == "metadata":
+            query = Query.parse(action.body.to_pybytes())
+            log = self.cache.get(self._path(query.path))
+            yield flight.Result(json.dumps(log.metadata, default=str).encode("utf-8"))
+        elif action.type == "clear":
+            self.cache.clear()
+        else:
+            raise KeyError("Unknown action %r" % action.type)
@@ -1,8 +1,14 @@
 # Copyright 2024, Scott Smith.  MIT License (see LICENSE).
 
 from collections import namedtuple
+import functools
 import numpy as np
 
+try:
+    from . import gps_kernels as _kernels
+except ImportError:  # extension not built
+    _kernels = None  # type: ignore[assignment]
+
 # None of the algorithms are slow
 # fastest: Fukushima 2006, but worse accuracy
 # most accurate: Vermeille, also very compact code
@@ -47,7 +53,7 @@ def web2ll(x, y, zoom=0):
 
 # lat, long = degrees
 # x, y, z, alt = meters
-def lla2ecef(lat, lon, alt):
+def lla2ecef_numpy(lat, lon, alt):
     a = 6378137
     e = 8.181919084261345e-2
     e_sq = e * e
@@ -233,15 +239,105 @@ def ecef2lla_vermeille2003(x, y, z):
     )
 
 
+# Start of GPS time, and the GPS - UTC offset (leap seconds) from each
+# GPS time (seconds since the GPS epoch) on.
+_GPS_EPOCH = np.datetime64("1980-01-06T00:00:00", "ms")
+_LEAP_SECONDS = np.array(
+    [
+        (np.datetime64(date, "s") - np.datetime64("1980-01-06", "s")).astype(np.int64) + n - 1
+        for n, date in enumerate(
+            [
+                "1981-07-01",
+                "1982-07-01",
+                "1983-07-01",
+                "1985-07-01",
+                "1988-01-01",
+                "1990-01-01",
+                "1991-01-01",
+                "1992-07-01",
+                "1993-07-01",
+                "1994-07-01",
+                "1996-01-01",
+                "1997-07-01",
+                "1999-01-01",
+                "2006-01-01",
+                "2009-01-01",
+                "2012-07-01",
+                "2015-07-01",
+                "2017-01-01",
+            ],
+            start=1,
+        )
+    ]
+)
+
+
+# GPS week number and time of week (ms) to UTC datetime64[ms]
+def gps_to_utc(week, itow_ms) -> np.ndarray:
+    gps_ms = np.asarray(week, dtype=np.int64) * (7 * 86400 * 1000) + np.asarray(
+        itow_ms, dtype=np.int64
+    )
+    leap = np.searchsorted(_LEAP_SECONDS, gps_ms // 1000, side="right")
+    result: np.ndarray = _GPS_EPOCH + (gps_ms - leap * 1000).astype("timedelta64[ms]")
+    return result
+
+
+# Local tangent plane (east, north, up) at lat0/lon0 (degrees), altitude 0.
+# Returns the ECEF origin and a 3x3 matrix whose rows are the east, north
+# and up unit vectors.  Cached, so e.g. every session at a track shares one
+# basis; the arrays are read only.
+@functools.lru_cache(maxsize=64)
+def enu_basis(lat0: float, lon0: float) -> tuple[np.ndarray, np.ndarray]:
+    origin = np.array(lla2ecef(lat0, lon0, 0.0), dtype=np.float64)
+    slat, clat = np.sin(np.radians(lat0)), np.cos(np.radians(lat0))
+    slon, clon = np.sin(np.radians(lon0)), np.cos(np.radians(lon0))
+    R = np.array(
+        [
+            [-slon, clon, 0.0],
+            [-slat * clon, -slat * slon, clat],
+            [clat * clon, clat * slon, slat],
+        ]
+    )
+    origin.setflags(write=False)
+    R.setflags(write=False)
+    return origin, R
+
+
+# ECEF x, y, z (meters) to east, north, up (meters) relative to lat0/lon0
+def ecef2enu(x, y, z, lat0: float, lon0: float):
+    origin, R = enu_basis(float(lat0), float(lon0))
+    dx = np.subtract(x, origin[0])
+    dy = np.subtract(y, origin[1])
+    dz = np.subtract(z, origin[2])
+    return (
+        R[0, 0] * dx + R[0, 1] * dy,  # east has no z component
+        R[1, 0] * dx + R[1, 1] * dy + R[1, 2] * dz,
+        R[2, 0] * dx + R[2, 1] * dy + R[2, 2] * dz,
+    )
+
+
+# Above this many marker x segment pairs find_crossing_idx uses a spatial
+# index instead of dense broadcasting (3 floats per pair per temporary).
+_DENSE_CROSSING_LIMIT = 1 << 20
+
+
 def find_crossing_idx(
-    XYZ: np.ndarray, marker: np.ndarray  # coordinates to look up in (X, Y, Z), meters
-):  # (lat, long), degrees
+    XYZ: np.ndarray,  # coordinates to look up in (X, Y, Z), meters
+    marker: np.ndarray,  # (lat, long), degrees
+    indexed: bool | None = None,  # None = automatic based on problem size
+    radius: float = 50.0,  # initial search radius for the indexed path, meters
+):
 
     if isinstance(marker, tuple):
         marker = np.array(marker)
     if len(marker.shape) == 1:
         # force it to be a 2d shape to make the rest of the code simpler
-        return find_crossing_idx(XYZ, marker.reshape((1, len(marker))))[0]
+        return find_crossing_idx(XYZ, marker.reshape((1, len(marker))), indexed, radius)[0]
+
+    if indexed is None:
+        indexed = len(marker) > 1 and len(marker) * len(XYZ) > _DENSE_CROSSING_LIMIT
+    if indexed:
+        return _find_crossing_idx_indexed(XYZ, marker, radius)
 
     # very similar to gps lap insert, but we can assume XYZ is a
     # reference (as opposed to GPS lap insert where we aren't sure if
@@ -273,6 +369,54 @@ def find_crossing_idx(
     return np.column_stack([minidx + t[colrange, minidx, 0], np.sqrt(distsq[colrange, minidx])])
 
 
+def _crossing_distsq(O, D, SO, SD):
+    # O, D: trajectory segment origins/directions.  SO, SD: matching marker
+    # origins/directions (broadcastable).  Same math as find_crossing_idx.
+    O = O - SO
+    SN = np.sum(SD * SD, axis=-1, keepdims=True) * D - np.sum(SD * D, axis=-1, keepdims=True) * SD
+    t = np.clip(-np.sum(SN * O, axis=-1) / np.sum(SN * D, axis=-1), 0, 1)
+    return t, np.sum(np.square(O + t[..., np.newaxis] * D), axis=-1)
+
+
+def _find_crossing_idx_indexed(XYZ: np.ndarray, marker: np.ndarray, radius: float):
+    # Same results as the dense path, but only segments near each marker are
+    # evaluated.  The closest crossing point lies on its segment, so if it is
+    # within radius of the marker the segment is guaranteed to be a candidate
+    # from the grid.  Markers without a crossing that close are retried with
+    # a larger radius, and finally brute forced one marker at a time.
+    from .spatial import SegmentGrid
+
+    lat = marker[:, 0]
+    lon = marker[:, 1]
+    SO = np.column_stack(lla2ecef(lat, lon, 0))
+    SD = np.column_stack(lla2ecef(lat, lon, 1000)) - SO
+
+    P = XYZ[:, :3]
+    O = P[:-1]
+    D = P[1:] - O
+    result = np.full((len(marker), 2), np.nan)
+    todo = np.arange(len(marker))
+    extent = np.sqrt(np.sum(np.square(P.max(axis=0) - P.min(axis=0))))
+    grid = SegmentGrid(P, cell_size=radius)
+    while len(todo) and radius <= 2 * extent:
+        qidx, seg = grid.candidates(SO[todo], radius)
+        t, distsq = _crossing_distsq(O[seg], D[seg], SO[todo][qidx], SD[todo][qidx])
+        if len(qidx):
+            order = np.lexsort((seg, distsq, qidx))
+            first = order[np.unique(qidx[order], return_index=True)[1]]
+            first = first[distsq[first] <= radius * radius]
+            result[todo[qidx[first]]] = np.column_stack(
+                [seg[first] + t[first], np.sqrt(distsq[first])]
+            )
+        todo = todo[np.isnan(result[todo, 0])]
+        radius *= 4
+    for m in todo:
+        t, distsq = _crossing_distsq(O, D, SO[m], SD[m])
+        minidx = np.argmin(distsq)
+        result[m] = (minidx + t[minidx], np.sqrt(distsq[minidx]))
+    return result
+
+
 def find_crossing_dist(
     XYZD: np.ndarray,  # coordinates to look up in (X, Y, Z, Distance), meters
     marker: tuple[float, float],
@@ -289,15 +433,24 @@ def find_laps(
     timecodes: np.ndarray,  # time for above coordinates, ms
     marker: tuple[float, float],
 ):  # (lat, long) tuple, degrees
-    # gps lap insert.  We assume the start finish "line" is a
-    # plane containing the vector that goes through the GPS
-    # coordinates sf lat/long from altitude 0 to 1000.  The normal
-    # of the plane is generally in line with the direction of
-    # travel, given the above constraint.
+    # gps lap insert: crossings of the start/finish line
+    return find_crossings(XYZ, timecodes, [marker])[0]
+
+
+def find_crossings(
+    XYZ: np.ndarray,  # coordinates to look up in (X, Y, Z), meters
+    timecodes: np.ndarray,  # time for above coordinates, ms
+    markers,  # sequence of (lat, long) tuples, degrees
+    marker_size: float = 30,  # meters, how far you can be from the marker to count
+) -> list[list[float]]:  # crossing times (ms) for each marker
+    # We assume each "line" is a plane containing the vector that
+    # goes through the GPS coordinates lat/long from altitude 0 to
+    # 1000.  The normal of the plane is generally in line with the
+    # direction of travel, given the above constraint.
 
     # O, D = vehicle vector (O=origin, D=direction, [0]=O, [1]=O+D)
-    # SO, SD = start finish origin, direction (plane must contain SO and SO+SD poitns)
-    # SN = start finish plane normal
+    # SO, SD = marker origin, direction (plane must contain SO and SO+SD poitns)
+    # SN = marker plane normal
 
     # D = a*SD + SN
     # 0 = SD . SN
@@ -313,93 +466,197 @@ def find_laps(
     # t * (D . SN) + SN . (O - SO) = 0
     # t = -SN.(O-SO) / D.SN
 
-    SO = np.array(lla2ecef(*marker, 0.0)).reshape((1, 3))
-    SD = np.array(lla2ecef(*marker, 1000)).reshape((1, 3)) - SO
+    # All markers are handled in the same pass.  Everything above
+    # expands into dot products of the trajectory with the (few)
+    # marker vectors, so the per segment x marker work is a handful
+    # of matrix products rather than 3-vector temporaries.
 
-    O = XYZ - SO
+    markers = np.asarray(markers, dtype=np.float64).reshape((-1, 2))
+    if not len(markers):
+        return []
+    SO = np.column_stack(lla2ecef(markers[:, 0], markers[:, 1], 0.0))
+    SD = np.column_stack(lla2ecef(markers[:, 0], markers[:, 1], 1000)) - SO
 
-    D = O[1:] - O[:-1]
-    O = O[:-1]
+    # work relative to the markers to keep the products small
+    center = np.mean(SO, axis=0)
+    SO = SO - center
+    P = XYZ[:, :3] - center
 
-    # VBox seems to need 30, maybe my friend is using an old map description
-    marker_size = 30  # meters, how far you can be from the marker to count as a lap
+    D = P[1:] - P[:-1]
+    P = P[:-1]
 
     # Precalculate in which time periods we were traveling at least 4 m/s (~10mph)
-    minspeed = np.sum(D * D, axis=1) > np.square((timecodes[1:] - timecodes[:-1]) * (4 / 1000))
-
-    SN = (
-        np.sum(SD * SD, axis=1).reshape((len(SD), 1)) * D
-        - np.sum(SD * D, axis=1).reshape((len(D), 1)) * SD
-    )
-    t = np.maximum(-np.sum(SN * O, axis=1) / np.sum(SN * D, axis=1), 0)
-    # This only works because the track is considered at altitude 0
-    dist = np.sum(np.square(O + t.reshape((len(t), 1)) * D), axis=1)
-    pick = (t[1:] <= 1) & (t[:-1] > 1) & (dist[1:] < marker_size**2)
-
-    # Now that we have a decent candidate selection of lap
-    # crossings, generate a single normal vector for the
-    # start/finish line to use for all lap crossings, to make the
-    # lap times more accurate/consistent.  Weight the crossings by
-    # velocity and add them together.  As it happens, SN is
-    # already weighted by velocity...
-    SN = np.sum(SN[1:][pick & minspeed[1:]], axis=0).reshape((1, 3))
+    DD = np.sum(D * D, axis=1)
+    minspeed = DD > np.square((timecodes[1:] - timecodes[:-1]) * (4 / 1000))
+    DD = DD[:, np.newaxis]
+
+    SOSD = np.sum(SO * SD, axis=1)
+    SS = np.sum(SD * SD, axis=1)  # SD . SD
+    DS = D @ SD.T  # SD . D
+    PS = P @ SD.T - SOSD  # SD . (O - SO)
+    PD = np.sum(P * D, axis=1)[:, np.newaxis] - D @ SO.T  # D . (O - SO)
+    # |O - SO|^2
+    RR = np.sum(P * P, axis=1)[:, np.newaxis] - 2 * (P @ SO.T) + np.sum(SO * SO, axis=1)
+
+    def _pick(num, den):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            t = np.maximum(-num / den, 0)
+        # This only works because the track is considered at altitude 0
+        dist = RR + t * (2 * PD + t * DD)
+        return t, (t[1:] <= 1) & (t[:-1] > 1) & (dist[1:] < marker_size**2)
+
+    # SN . (O - SO) and SN . D for the per segment normal
+    t, pick = _pick(SS * PD - DS * PS, SS * DD - DS * DS)
+
+    # Now that we have a decent candidate selection of crossings,
+    # generate a single normal vector for each marker to use for
+    # all of its crossings, to make the times more
+    # accurate/consistent.  Weight the crossings by velocity and
+    # add them together.  As it happens, SN is already weighted by
+    # velocity...
+    W = (pick & minspeed[1:, np.newaxis]).astype(np.float64)
+    SN = SS[:, np.newaxis] * (W.T @ D[1:]) - np.sum(W * DS[1:], axis=0)[:, np.newaxis] * SD
     # recompute t, dist, pick
-    t = np.maximum(-np.sum(SN * O, axis=1) / np.sum(SN * D, axis=1), 0)
-    dist = np.sum(np.square(O + t.reshape((len(t), 1)) * D), axis=1)
-    pick = (t[1:] <= 1) & (t[:-1] > 1) & (dist[1:] < marker_size**2)
-
-    lap_markers = [0]
-    for idx in np.nonzero(pick)[0] + 1:
-        if timecodes[idx] <= lap_markers[-1]:
-            continue
-        if not minspeed[idx]:
-            idx = np.argmax(minspeed[idx:]) + idx
-        lap_markers.append(timecodes[idx] + t[idx] * (timecodes[idx + 1] - timecodes[idx]))
-    return lap_markers[1:]
-
-
-ecef2lla = ecef2lla_vermeille2003
-
-if __name__ == "__main__":
-
-    def perf_test():
-        import time
-
-        samples = 10000000
-        lat = -90.0 + 180.0 * np.random.rand(samples, 1)
-        long = -180.0 + 360.0 * np.random.rand(samples, 1)
-        alt = -11e3 + (20e3) * np.random.rand(
-            samples, 1
-        )  # From approximately the bottom of the Mariana trench, to the top of the Everest
-
-        print("generating x,y,z")
-        x, y, z = lla2ecef(lat, long, alt)
-        algos = [
-            ("osen", ecef2lla_osen),
-            ("fukushima2006", ecef2lla_fukushima2006),
-            ("vermeille2003", ecef2lla_vermeille2003),
-        ]
-        stats: dict[str, list[float]] = {name: [] for name, algo in algos}
-        for _ in range(5):
-            for name, algo in algos:
-                start = time.time()
-                ilat, ilong, ialt = algo(x, y, z)
-                duration = time.time() - start
-                stats[name].append(duration)
-                print("algorithm %s took %.3f" % (name, duration))
-                print(
-                    "  avg",
-                    np.sqrt(np.sum((ilat - lat) ** 2)) / len(ilat),
-                    np.sqrt(np.sum((ilong - long) ** 2)) / len(ilong),
-                    np.sqrt(np.sum((ialt - alt) ** 2)) / len(ialt),
-                )
-                print(
-                    "  max",
-                    np.max(np.abs(ilat - lat)),
-                    np.max(np.abs(ilong - long)),
-                    np.max(np.abs(ialt - alt)),
-                )
-        for name, stat in stats.items():
-            print(name, ", ".join(["%.3f" % s for s in stat]))
-
-    perf_test()
+    t, pick = _pick(P @ SN.T - np.sum(SO * SN, axis=1), D @ SN.T)
+
+    result = []
+    for m in range(len(markers)):
+        crossings: list[float] = [0]
+        for idx in np.nonzero(pick[:, m])[0] + 1:
+            if timecodes[idx] <= crossings[-1]:
+                continue
+            if not minspeed[idx]:
+                idx = np.argmax(minspeed[idx:]) + idx
+            crossings.append(timecodes[idx] + t[idx, m] * (timecodes[idx + 1] - timecodes[idx]))
+        result.append(crossings[1:])
+    return result
+
+
+class LapDetector:
+    """
+    Incremental version of find_laps() for GPS data that arrives in chunks.
+
+    Feed ECEF coordinates and timecodes with update() as they arrive; each
+    call returns the lap crossings (ms) completed by the new samples.  Work
+    per call is proportional to the size of the chunk.
+
+    Until the first crossing is seen each segment uses its own plane normal
+    (the first pass of find_laps()).  After that, the start/finish normal is
+    the velocity weighted sum over all crossings so far, refined as each new
+    crossing is accepted and applied from the next chunk on.
+    """
+
+    def __init__(
+        self,
+        marker: tuple[float, float],  # (lat, long), degrees
+        marker_size: float = 30,  # meters, how far you can be from the marker to count as a lap
+    ):
+        self.SO = np.array(lla2ecef(*marker, 0.0))
+        self.SD = np.array(lla2ecef(*marker, 1000)) - self.SO
+        self.marker_size = marker_size
+        self.SN = np.zeros(3)  # running velocity weighted normal
+        self.lap_markers: list[float] = []
+        # last two samples, relative to SO, so the previous segment's t is
+        # available to detect a crossing on the first new segment
+        self._tail = np.zeros((0, 3))
+        self._tail_tc = np.zeros(0, dtype=np.int64)
+        # crossing seen below minspeed, waiting for the car to get moving
+        self._pending = False
+
+    def update(
+        self,
+        XYZ: np.ndarray,  # coordinates (X, Y, Z), meters
+        timecodes: np.ndarray,  # time for above coordinates, ms
+    ) -> list[float]:  # new lap crossings, ms
+        P = np.concatenate([self._tail, XYZ[:, :3] - self.SO])
+        tc = np.concatenate([self._tail_tc, timecodes])
+        self._tail = P[-2:]
+        self._tail_tc = tc[-2:]
+        if len(P) < 3:
+            return []
+
+        O = P[:-1]
+        D = P[1:] - O
+        SD = self.SD.reshape((1, 3))
+        minspeed = np.sum(D * D, axis=1) > np.square((tc[1:] - tc[:-1]) * (4 / 1000))
+
+        # see find_crossings() for the math
+        SN_seg = np.sum(SD * SD) * D - np.sum(SD * D, axis=1).reshape((len(D), 1)) * SD
+        SN = SN_seg if not np.any(self.SN) else self.SN.reshape((1, 3))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            t = np.maximum(-np.sum(SN * O, axis=1) / np.sum(SN * D, axis=1), 0)
+        dist = np.sum(np.square(O + t.reshape((len(t), 1)) * D), axis=1)
+        pick = (t[1:] <= 1) & (t[:-1] > 1) & (dist[1:] < self.marker_size**2)
+
+        picked = np.nonzero(pick)[0] + 1
+        candidates = [int(idx) for idx in picked]
+        if self._pending and (not len(picked) or picked[0] != 1):
+            candidates.insert(0, 1)
+        moving = np.nonzero(minspeed)[0]
+        last = self.lap_markers[-1] if self.lap_markers else 0
+        new: list[float] = []
+        self._pending = False
+        for idx in candidates:
+            if tc[idx] <= last:
+                continue
+            if not minspeed[idx]:
+                later = moving[moving >= idx]
+                if not len(later):
+                    self._pending = True
+                    break
+                idx = later[0]
+            last = tc[idx] + t[idx] * (tc[idx + 1] - tc[idx])
+            new.append(last)
+
+        # As it happens, SN is already weighted by velocity...
+        self.SN += np.sum(SN_seg[picked[minspeed[picked]]], axis=0)
+        self.lap_markers += new
+        return new
+
+
+ECEF2LLA_ALGORITHMS = {
+    "vermeille2003": ecef2lla_vermeille2003,
+    "osen": ecef2lla_osen,
+    "fukushima2006": ecef2lla_fukushima2006,
+}
+
+
+def _store(result, out, dtype):
+    # numpy fallback for the out= and dtype= options of the compiled kernels
+    if out is None:
+        if dtype is None:
+            return tuple(result)
+        return tuple(np.asarray(r, dtype=dtype) for r in result)
+    for o, r in zip(out, result):
+        o[...] = r
+    return tuple(out)
+
+
+# Uses the compiled kernels (one pass per point, parallel, no full length
+# temporaries) when available.  out = optional (x, y, z) arrays to store
+# into, dtype = np.float64 (default) or np.float32.
+def lla2ecef(lat, lon, alt, out=None, dtype=None):
+    if _kernels is not None:
+        return _kernels.lla2ecef(lat, lon, alt, out=out, dtype=dtype)
+    return _store(lla2ecef_numpy(lat, lon, alt), out, dtype)
+
+
+# algorithm = key of ECEF2LLA_ALGORITHMS.  out, dtype as for lla2ecef.
+# ground_out = optional float64 (x, y, z) arrays to also store the points
+# projected to altitude 0 (lla2ecef(lat, long, 0)), which the kernels
+# compute in the same pass without any extra trig.
+def ecef2lla(x, y, z, algorithm="vermeille2003", out=None, dtype=None, ground_out=None):
+    # On one thread numpy's vectorised cbrt/arctan2 beat the vermeille2003
+    # kernel; the other algorithms are faster compiled either way.
+    if _kernels is not None and (algorithm != "vermeille2003" or _kernels.threads() > 1):
+        return GPS(
+            *_kernels.ecef2lla(
+                x, y, z, algorithm=algorithm, out=out, dtype=dtype, ground_out=ground_out
+            )
+        )
+    if algorithm not in ECEF2LLA_ALGORITHMS:
+        raise ValueError("Unknown algorithm %r" % algorithm)
+    result = ECEF2LLA_ALGORITHMS[algorithm](x, y, z)
+    if ground_out is not None:
+        _store(lla2ecef(result.lat, result.long, 0), ground_out, None)
+    return GPS(*_store(result, out, dtype))
@@ -0,0 +1,57 @@
+# Copyright 2024, Scott Smith.  MIT License (see LICENSE).
+"""Type stubs for gps_kernels Cython extension module."""
+
+from typing import Any, Optional, Sequence, Tuple
+import numpy as np
+
+ALGORITHMS: dict[str, int]
+
+def threads() -> int:
+    """Number of threads the kernels run on (1 without OpenMP)."""
+    ...
+
+def ecef2lla(
+    x: Any,
+    y: Any,
+    z: Any,
+    algorithm: str = "vermeille2003",
+    out: Optional[Sequence[np.ndarray]] = None,
+    dtype: Any = None,
+    ground_out: Optional[Sequence[np.ndarray]] = None,
+) -> Tuple[Any, Any, Any]:
+    """
+    Convert ECEF coordinates (meters) to (lat, long, alt) (degrees, meters).
+
+    Args:
+        x, y, z: Coordinates, arrays or scalars (broadcast together)
+        algorithm: 'vermeille2003', 'osen' or 'fukushima2006'
+        out: Optional (lat, long, alt) arrays to store the results in
+        dtype: float64 (default) or float32 result arrays
+        ground_out: Optional float64 (x, y, z) arrays to also store each
+            point projected to altitude 0, i.e. lla2ecef(lat, long, 0),
+            computed in the same pass
+
+    Returns:
+        (lat, long, alt) tuple of arrays
+    """
+    ...
+
+def lla2ecef(
+    lat: Any,
+    lon: Any,
+    alt: Any,
+    out: Optional[Sequence[np.ndarray]] = None,
+    dtype: Any = None,
+) -> Tuple[Any, Any, Any]:
+    """
+    Convert (lat, long, alt) (degrees, meters) to ECEF coordinates (meters).
+
+    Args:
+        lat, lon, alt: Coordinates, arrays or scalars (broadcast together)
+        out: Optional (x, y, z) arrays to store the results in
+        dtype: float64 (default) or float32 result arrays
+
+    Returns:
+        (x, y, z) tuple of arrays
+    """
+    ...
@@ -0,0 +1,342 @@
+# Copyright 2024, Scott Smith.  MIT License (see LICENSE).
+
+# cython: boundscheck=False, wraparound=False, cdivision=True
+
+"""Compiled single pass versions of the coordinate conversions in gps.py.
+
+Each point is converted with no full length temporaries, in parallel
+(OpenMP prange) where the extension was built with OpenMP.  Math is done in
+double precision; results can be stored as float32 or float64, into
+caller supplied buffers if desired.
+"""
+
+from cython.parallel import prange
+from libc.math cimport atan2, cbrt, copysign, cos, fabs, sin, sqrt
+
+import numpy as np
+
+ctypedef fused real:
+    float
+    double
+
+cdef struct triple:
+    double a
+    double b
+    double c
+
+cdef struct geodetic:
+    double lat  # degrees
+    double lon  # degrees
+    double alt  # meters
+    double slat  # sin(lat), cos(lat) from the algorithm's own terms, without trig
+    double clat
+
+cdef double R2D = 180 / 3.14159265358979323846
+cdef double D2R = 3.14159265358979323846 / 180
+
+# WGS84
+cdef double WGS_A = 6378137.0
+cdef double WGS_E = 8.181919084261345e-2
+
+ALGORITHMS = {"vermeille2003": 0, "osen": 1, "fukushima2006": 2}
+
+cdef extern from *:
+    """
+    #ifdef _OPENMP
+    #include <omp.h>
+    static int _max_threads(void) { return omp_get_max_threads(); }
+    #else
+    static int _max_threads(void) { return 1; }
+    #endif
+    """
+    int _max_threads() nogil
+
+
+def threads():
+    """Number of threads the kernels run on (1 without OpenMP)."""
+    return _max_threads()
+
+
+cdef inline triple _lla2ecef(double lat, double lon, double alt) noexcept nogil:
+    cdef double e_sq = WGS_E * WGS_E
+    cdef double clat = cos(lat * D2R)
+    cdef double slat = sin(lat * D2R)
+    cdef double N = WGS_A / sqrt(1 - e_sq * slat * slat)
+    cdef triple r
+    r.a = (N + alt) * clat * cos(lon * D2R)
+    r.b = (N + alt) * clat * sin(lon * D2R)
+    r.c = ((1 - e_sq) * N + alt) * slat
+    return r
+
+
+cdef inline geodetic _vermeille2003(double x, double y, double z) noexcept nogil:
+    cdef double e2 = WGS_E * WGS_E
+    cdef double e4 = e2 * e2
+    cdef double p = (x * x + y * y) * (1 / (WGS_A * WGS_A))
+    cdef double q = ((1 - e2) / (WGS_A * WGS_A)) * z * z
+    cdef double r = (p + q - e4) * (1.0 / 6)
+    cdef double s = (e4 / 4) * p * q / (r * r * r)
+    cdef double t = cbrt(1 + s + sqrt(s * (2 + s)))
+    cdef double u = r * (1 + t + 1 / t)
+    cdef double v = sqrt(u * u + e4 * q)
+    u += v
+    cdef double w = (e2 / 2) * (u - q) / v
+    cdef double k = sqrt(u + w * w) - w
+    cdef double D = k * sqrt(x * x + y * y) / (k + e2)
+    cdef double rtDDzz = sqrt(D * D + z * z)
+    cdef geodetic res
+    res.lat = R2D * 2 * atan2(z, D + rtDDzz)
+    res.lon = R2D * atan2(y, x)
+    res.alt = (k + e2 - 1) / k * rtDDzz
+    res.slat = z / rtDDzz
+    res.clat = D / rtDDzz
+    return res
+
+
+cdef inline geodetic _osen(double x, double y, double z) noexcept nogil:
+    cdef double invaa = +2.45817225764733181057e-0014  # 1/(a^2)
+    cdef double l = +3.34718999507065852867e-0003  # (e^2)/2
+    cdef double p1mee = +9.93305620009858682943e-0001  # 1-(e^2)
+    cdef double p1meedaa = +2.44171631847341700642e-0014  # (1-(e^2))/(a^2)
+    cdef double ll4 = +4.48147234524044602618e-0005  # 4*(l^2) = e^4
+    cdef double ll = +1.12036808631011150655e-0005  # l^2 = (e^4)/4
+    cdef double invcbrt2 = +7.93700525984099737380e-0001  # 1/(2^(1/3))
+    cdef double inv3 = +3.33333333333333333333e-0001  # 1/3
+    cdef double inv6 = +1.66666666666666666667e-0001  # 1/6
+
+    cdef double w = x * x + y * y
+    cdef double m = w * invaa
+    w = sqrt(w)
+    cdef double n = z * z * p1meedaa
+    cdef double mpn = m + n
+    cdef double p = inv6 * (mpn - ll4)
+    cdef double P = p * p
+    cdef double G = m * n * ll
+    cdef double H = 2 * P * p + G
+    cdef double C = cbrt(H + G + 2 * sqrt(H * G)) * invcbrt2
+    cdef double i = -ll - 0.5 * mpn
+    cdef double beta = inv3 * i - C - P / C
+    cdef double k = ll * (ll - mpn)
+    cdef double t = sqrt(sqrt(beta * beta - k) - 0.5 * (beta + i)) + sqrt(
+        fabs(0.5 * (beta - i))) * (1 if m < n else -1)
+    # Newton-Raphson correction of t
+    cdef double g = 2 * l * (m - n)
+    cdef double tt = t * t
+    cdef double dt = -(tt * (tt + (i + i)) + g * t + k) / (4 * t * (tt + i) + g)
+    cdef double u = t + dt + l
+    cdef double v = t + dt - l
+    cdef double zu = z * u
+    cdef double wv = w * v
+    cdef double invuv = 1 / (u * v)
+    cdef double dw = w - wv * invuv
+    cdef double dz = z - zu * p1mee * invuv
+    cdef double h = sqrt(zu * zu + wv * wv)
+    cdef geodetic res
+    res.lat = atan2(zu, wv) * R2D
+    res.lon = atan2(y, x) * R2D
+    res.alt = sqrt(dw * dw + dz * dz) * (-1 if u < 1 else 1)
+    res.slat = zu / h
+    res.clat = wv / h
+    return res
+
+
+cdef inline geodetic _fukushima2006(double x, double y, double z) noexcept nogil:
+    cdef double f = 1.0 / 298.257222101
+    cdef double e2 = (2 - f) * f
+    cdef double ec2 = 1 - e2
+    cdef double ec = sqrt(ec2)
+    cdef double c = WGS_A * e2
+
+    cdef double s0 = fabs(z)
+    cdef double p = sqrt(x * x + y * y)
+    cdef double zc = ec * s0
+    cdef double c0 = ec * p
+    cdef double c02 = c0 * c0
+    cdef double s02 = s0 * s0
+    cdef double a02 = c02 + s02
+    cdef double a0 = sqrt(a02)
+    cdef double a03 = a02 * a0
+    cdef double s1 = zc * a03 + c * (s02 * s0)
+    cdef double c1 = p * a03 - c * (c02 * c0)
+    cdef double cs0c0 = c * c0 * s0
+    cdef double b0 = 1.5 * cs0c0 * ((p * s0 - zc * c0) * a0 - cs0c0)
+    s1 = s1 * a03 - b0 * s0
+    cdef double cc = ec * (c1 * a03 - b0 * c0)
+    cdef double s12 = s1 * s1
+    cdef double cc2 = cc * cc
+    cdef double h = sqrt(s12 + cc2)
+    cdef geodetic res
+    res.lat = copysign(atan2(s1, cc), z) * R2D
+    res.lon = atan2(y, x) * R2D
+    res.alt = (p * cc + s0 * s1 - WGS_A * sqrt(ec2 * s12 + cc2)) / h
+    res.slat = copysign(s1 / h, z)
+    res.clat = cc / h
+    return res
+
+
+cdef inline triple _ground(double x, double y, geodetic g) noexcept nogil:
+    # lla2ecef(lat, lon, 0) using the sin/cos already known from the
+    # conversion, so projecting onto the ellipsoid costs no trig
+    cdef double e_sq = WGS_E * WGS_E
+    cdef double p = sqrt(x * x + y * y)
+    cdef double clon = x / p if p > 0 else 1.0
+    cdef double slon = y / p if p > 0 else 0.0
+    cdef double N = WGS_A / sqrt(1 - e_sq * g.slat * g.slat)
+    cdef triple r
+    r.a = N * g.clat * clon
+    r.b = N * g.clat * slon
+    r.c = (1 - e_sq) * N * g.slat
+    return r
+
+
+cdef void _ecef2lla_kernel(const double[:] x, const double[:] y, const double[:] z,
+                           Py_ssize_t sx, Py_ssize_t sy, Py_ssize_t sz,
+                           real[::1] lat, real[::1] lon, real[::1] alt,
+                           double[::1] gx, double[::1] gy, double[::1] gz, bint ground,
+                           int algorithm) noexcept nogil:
+    cdef Py_ssize_t i
+    cdef geodetic r
+    cdef triple g
+    for i in prange(lat.shape[0], schedule='static'):
+        if algorithm == 1:
+            r = _osen(x[i * sx], y[i * sy], z[i * sz])
+        elif algorithm == 2:
+            r = _fukushima2006(x[i * sx], y[i * sy], z[i * sz])
+        else:
+            r = _vermeille2003(x[i * sx], y[i * sy], z[i * sz])
+        lat[i] = <real>r.lat
+        lon[i] = <real>r.lon
+        alt[i] = <real>r.alt
+        if ground:
+            g = _ground(x[i * sx], y[i * sy], r)
+            gx[i] = g.a
+            gy[i] = g.b
+            gz[i] = g.c
+
+
+cdef void _lla2ecef_kernel(const double[:] lat, const double[:] lon, const double[:] alt,
+                           Py_ssize_t slat, Py_ssize_t slon, Py_ssize_t salt,
+                           real[::1] x, real[::1] y, real[::1] z) noexcept nogil:
+    cdef Py_ssize_t i
+    cdef triple r
+    for i in prange(x.shape[0], schedule='static'):
+        r = _lla2ecef(lat[i * slat], lon[i * slon], alt[i * salt])
+        x[i] = <real>r.a
+        y[i] = <real>r.b
+        z[i] = <real>r.c
+
+
+def _inputs(arrays):
+    # Flatten the inputs to 1-D float64, leaving single values (e.g. alt=0)
+    # as length 1 arrays with a step of 0 rather than broadcasting them.
+    arrays = [np.asarray(a, dtype=np.float64) for a in arrays]
+    shape = np.broadcast_shapes(*[a.shape for a in arrays])
+    flat = []
+    steps = []
+    for a in arrays:
+        if a.size == 1:
+            flat.append(a.reshape(1))
+            steps.append(0)
+        else:
+            flat.append(np.ascontiguousarray(np.broadcast_to(a, shape)).reshape(-1))
+            steps.append(1)
+    return shape, flat, steps
+
+
+def _outputs(shape, out, dtype):
+    if out is None:
+        dtype = np.dtype(np.float64 if dtype is None else dtype)
+        if dtype not in (np.dtype(np.float32), np.dtype(np.float64)):
+            raise ValueError("dtype must be float32 or float64, not %s" % dtype)
+        return tuple(np.empty(shape, dtype=dtype) for _ in range(3))
+    out = tuple(out)
+    if len(out) != 3:
+        raise ValueError("out must be 3 arrays")
+    for o in out:
+        if (not isinstance(o, np.ndarray) or o.shape != shape or o.dtype != out[0].dtype
+                or not o.flags.c_contiguous or not o.flags.writeable):
+            raise ValueError("out arrays must be writeable C contiguous arrays of shape %s "
+                             "and the same dtype" % (shape,))
+    if dtype is not None and np.dtype(dtype) != out[0].dtype:
+        raise ValueError("dtype %s does not match out arrays" % np.dtype(dtype))
+    if out[0].dtype not in (np.dtype(np.float32), np.dtype(np.float64)):
+        raise ValueError("out arrays must be float32 or float64, not %s" % out[0].dtype)
+    return out
+
+
+def _result(result, out):
+    if out is None and result[0].shape == ():
+        return tuple(r[()] for r in result)
+    return result
+
+
+def ecef2lla(x, y, z, algorithm="vermeille2003", out=None, dtype=None, ground_out=None):
+    """
+    Convert ECEF coordinates (meters) to (lat, long, alt) (degrees, meters).
+
+    Args:
+        x, y, z: Coordinates, arrays or scalars (broadcast together)
+        algorithm: 'vermeille2003', 'osen' or 'fukushima2006'
+        out: Optional (lat, long, alt) arrays to store the results in
+        dtype: float64 (default) or float32 result arrays
+        ground_out: Optional float64 (x, y, z) arrays to also store each
+            point projected to altitude 0, i.e. lla2ecef(lat, long, 0),
+            computed in the same pass
+
+    Returns:
+        (lat, long, alt) tuple of arrays
+    """
+    if algorithm not in ALGORITHMS:
+        raise ValueError("Unknown algorithm %r" % algorithm)
+    shape, (fx, fy, fz), steps = _inputs((x, y, z))
+    result = _outputs(shape, out, dtype)
+    cdef bint ground = ground_out is not None
+    if ground:
+        ground_out = _outputs(shape, ground_out, np.float64)
+    else:
+        ground_out = (np.empty(1),) * 3
+    cdef const double[:] vx = fx, vy = fy, vz = fz
+    cdef Py_ssize_t sx = steps[0], sy = steps[1], sz = steps[2]
+    cdef int algo = ALGORITHMS[algorithm]
+    cdef double[::1] g0, g1, g2
+    g0, g1, g2 = [g.reshape(-1) for g in ground_out]
+    cdef float[::1] f0, f1, f2
+    cdef double[::1] d0, d1, d2
+    if result[0].dtype == np.float32:
+        f0, f1, f2 = [r.reshape(-1) for r in result]
+        with nogil:
+            _ecef2lla_kernel(vx, vy, vz, sx, sy, sz, f0, f1, f2, g0, g1, g2, ground, algo)
+    else:
+        d0, d1, d2 = [r.reshape(-1) for r in result]
+        with nogil:
+            _ecef2lla_kernel(vx, vy, vz, sx, sy, sz, d0, d1, d2, g0, g1, g2, ground, algo)
+    return _result(result, out)
+
+
+def lla2ecef(lat, lon, alt, out=None, dtype=None):
+    """
+    Convert (lat, long, alt) (degrees, meters) to ECEF coordinates (meters).
+
+    Args:
+        lat, lon, alt: Coordinates, arrays or scalars (broadcast together)
+        out: Optional (x, y, z) arrays to store the results in
+        dtype: float64 (default) or float32 result arrays
+
+    Returns:
+        (x, y, z) tuple of arrays
+    """
+    shape, (flat, flon, falt), steps = _inputs((lat, lon, alt))
+    result = _outputs(shape, out, dtype)
+    cdef const double[:] vlat = flat, vlon = flon, valt = falt
+    cdef Py_ssize_t slat = steps[0], slon = steps[1], salt = steps[2]
+    cdef float[::1] f0, f1, f2
+    cdef double[::1] d0, d1, d2
+    if result[0].dtype == np.float32:
+        f0, f1, f2 = [r.reshape(-1) for r in result]
+        with nogil:
+            _lla2ecef_kernel(vlat, vlon, valt, slat, slon, salt, f0, f1, f2)
+    else:
+        d0, d1, d2 = [r.reshape(-1) for r in result]
+        with nogil:
+            _lla2ecef_kernel(vlat, vlon, valt, slat, slon, salt, d0, d1, d2)
+    return _result(result, out)
@@ -0,0 +1,226 @@
+# Copyright 2024, Scott Smith.  MIT License (see LICENSE).
+
+"""Time weighted histograms / time-in-range tables of channels."""
+
+import typing
+import numpy as np
+import pyarrow as pa
+
+from .base import LogFile, channel_values, resample_channel
+
+Bins = typing.Union[int, typing.Sequence[float], np.ndarray]
+Logs = typing.Union[LogFile, typing.Sequence[LogFile]]
+
+
+def dwell_times(timecodes: np.ndarray, max_dwell: typing.Optional[float] = None) -> np.ndarray:
+    """
+    Time (ms) each sample is in effect: until the next sample.
+
+    The last sample is given the median sample period.  If max_dwell is given,
+    dwell times are capped to it so gaps in logging aren't attributed to the
+    sample before the gap.
+    """
+    timecodes = np.asarray(timecodes)
+    if not len(timecodes):
+        return np.zeros(0)
+    dt = np.diff(timecodes).astype(np.float64)
+    dwell = np.append(dt, np.median(dt) if len(dt) else 0.0)
+    if max_dwell is not None:
+        dwell = np.minimum(dwell, max_dwell)
+    return dwell
+
+
+def _as_list(logs: Logs) -> typing.List[LogFile]:
+    return [logs] if isinstance(logs, LogFile) else list(logs)
+
+
+def _edges(bins: Bins, values: typing.Callable[[], typing.Iterable[np.ndarray]]) -> np.ndarray:
+    if not isinstance(bins, (int, np.integer)):
+        return np.asarray(bins, dtype=np.float64)
+    lo, hi = np.inf, -np.inf
+    for v in values():
+        if len(v):
+            lo, hi = min(lo, np.min(v)), max(hi, np.max(v))
+    if lo > hi:
+        lo, hi = 0.0, 1.0
+    elif lo == hi:
+        lo, hi = lo - 0.5, hi + 0.5
+    return np.linspace(lo, hi, int(bins) + 1)
+
+
+def _bin_index(values: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    # like np.histogram: bins are half open except the last which includes
+    # its upper edge; out of range values get -1.
+    idx = np.searchsorted(edges, values, side="right") - 1
+    idx[values == edges[-1]] = len(edges) - 2
+    idx[(idx < 0) | (idx >= len(edges) - 1)] = -1
+    return idx
+
+
+def _groups(
+    log: LogFile, timecodes: np.ndarray, by_lap: bool
+) -> typing.Tuple[np.ndarray, np.ndarray]:
+    # returns (group index per sample, -1 = excluded) and the lap number per group
+    if not by_lap:
+        return np.zeros(len(timecodes), dtype=np.int64), np.zeros(1, dtype=np.int64)
+    if not log.laps.num_rows:
+        # no laps (no GPS or beacon): every sample is outside them
+        return np.full(len(timecodes), -1, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    nums = log.laps.column("num").to_numpy()
+    start = log.laps.column("start_time").to_numpy()
+    end = log.laps.column("end_time").to_numpy()
+    lap = np.searchsorted(start, timecodes, side="right") - 1
+    lap[(lap < 0) | (timecodes >= end[np.maximum(lap, 0)])] = -1
+    return lap, nums
+
+
+def _accumulate(
+    log: LogFile,
+    timecodes: np.ndarray,
+    bin_idx: np.ndarray,
+    nbins: int,
+    by_lap: bool,
+    max_dwell: typing.Optional[float],
+) -> typing.Tuple[np.ndarray, np.ndarray]:
+    group, nums = _groups(log, timecodes, by_lap)
+    weight = dwell_times(timecodes, max_dwell)
+    keep = (group >= 0) & (bin_idx >= 0)
+    key = group[keep] * nbins + bin_idx[keep]
+    totals = np.bincount(key, weights=weight[keep], minlength=len(nums) * nbins)
+    return totals.reshape((len(nums), nbins)), nums
+
+
+def histogram(
+    logs: Logs,
+    channel: str,
+    bins: Bins = 50,
+    by_lap: bool = False,
+    max_dwell: typing.Optional[float] = None,
+) -> pa.Table:
+    """
+    Time weighted histogram (time-in-range table) of a channel.
+
+    Each sample is weighted by its dwell time from the channel's own
+    timecodes, so the result is in ms regardless of sample rate.  Binning
+    uses one vectorised bincount per file covering every lap at once.
+
+    Args:
+        logs: A LogFile or a sequence of them
+        channel: Channel name
+        bins: Number of equal width bins spanning all values, or bin edges
+        by_lap: Split the histogram per lap instead of per session
+        max_dwell: Cap on the dwell time of a single sample (ms)
+
+    Returns:
+        A PyArrow table with columns 'file', 'num' (lap, null when not
+        by_lap), 'bin_lo', 'bin_hi' and 'time' (ms), one row per bin per lap
+        (or session) per file.
+    """
+    logs = _as_list(logs)
+    edges = _edges(
+        bins,
+        lambda: (channel_values(log.channels[channel]) for log in logs),
+    )
+    nbins = len(edges) - 1
+
+    files: typing.List[str] = []
+    nums: typing.List[np.ndarray] = []
+    totals: typing.List[np.ndarray] = []
+    for log in logs:
+        table = log.channels[channel]
+        timecodes = table.column("timecodes").to_numpy()
+        values = channel_values(table)
+        t, n = _accumulate(log, timecodes, _bin_index(values, edges), nbins, by_lap, max_dwell)
+        files += [log.file_name] * t.size
+        nums.append(np.repeat(n, nbins))
+        totals.append(t.ravel())
+
+    count = sum(len(t) for t in totals)
+    return pa.table(
+        {
+            "file": pa.array(files, type=pa.string()),
+            "num": pa.array(
+                np.concatenate(nums) if nums else np.zeros(0),
+                type=pa.int32(),
+                mask=np.full(count, not by_lap),
+            ),
+            "bin_lo": pa.array(np.tile(edges[:-1], count // max(nbins, 1))),
+            "bin_hi": pa.array(np.tile(edges[1:], count // max(nbins, 1))),
+            "time": pa.array(np.concatenate(totals) if totals else np.zeros(0)),
+        }
+    )
+
+
+def histogram2d(
+    logs: Logs,
+    x: str,
+    y: str,
+    x_bins: Bins = 50,
+    y_bins: Bins = 50,
+    by_lap: bool = False,
+    max_dwell: typing.Optional[float] = None,
+) -> pa.Table:
+    """
+    Time weighted 2-D histogram of two channels, e.g. RPM x throttle or a G-G diagram.
+
+    y is sampled at x's timecodes (interpolated or held per its metadata) and
+    each pair is weighted by x's dwell time, without building the merged
+    table of all channels.
+
+    Args:
+        logs: A LogFile or a sequence of them
+        x, y: Channel names
+        x_bins, y_bins: Number of equal width bins, or bin edges
+        by_lap: Split the histogram per lap instead of per session
+        max_dwell: Cap on the dwell time of a single sample (ms)
+
+    Returns:
+        A PyArrow table with columns 'file', 'num' (lap, null when not
+        by_lap), 'x_lo', 'x_hi', 'y_lo', 'y_hi' and 'time' (ms), one row per
+        cell per lap (or session) per file.
+    """
+    logs = _as_list(logs)
+    samples = []
+    for log in logs:
+        table = log.channels[x]
+        timecodes = table.column("timecodes").to_numpy()
+        samples.append(
+            (
+                timecodes,
+                channel_values(table),
+                resample_channel(log.channels[y], timecodes, log.timebase(y)),
+            )
+        )
+    xe = _edges(x_bins, lambda: (s[1] for s in samples))
+    ye = _edges(y_bins, lambda: (s[2] for s in samples))
+    nx, ny = len(xe) - 1, len(ye) - 1
+
+    files: typing.List[str] = []
+    nums: typing.List[np.ndarray] = []
+    totals: typing.List[np.ndarray] = []
+    for log, (timecodes, xv, yv) in zip(logs, samples):
+        xi = _bin_index(xv, xe)
+        yi = _bin_index(yv, ye)
+        cell = np.where((xi >= 0) & (yi >= 0), xi * ny + yi, -1)
+        t, n = _accumulate(log, timecodes, cell, nx * ny, by_lap, max_dwell)
+        files += [log.file_name] * t.size
+        nums.append(np.repeat(n, nx * ny))
+        totals.append(t.ravel())
+
+    count = sum(len(t) for t in totals)
+    reps = count // max(nx * ny, 1)
+    return pa.table(
+        {
+            "file": pa.array(files, type=pa.string()),
+            "num": pa.array(
+                np.concatenate(nums) if nums else np.zeros(0),
+                type=pa.int32(),
+                mask=np.full(count, not by_lap),
+            ),
+            "x_lo": pa.array(np.tile(np.repeat(xe[:-1], ny), reps)),
+            "x_hi": pa.array(np.tile(np.repeat(xe[1:], ny), reps)),
+            "y_lo": pa.array(np.tile(np.tile(ye[:-1], nx), reps)),
+            "y_hi": pa.array(np.tile(np.tile(ye[1:], nx), reps)),
+            "time": pa.array(np.concatenate(totals) if totals else np.zeros(0)),
+        }
+    )
@@ -0,0 +1,162 @@
+# Copyright 2024, Scott Smith.  MIT License (see LICENSE).
+
+"""Derived ("math") channels computed from the channels of a LogFile."""
+
+from dataclasses import dataclass, field
+import typing
+import numpy as np
+import pyarrow as pa
+
+from .base import LogFile, channel_metadata, channel_values, resample_channel
+
+
+@dataclass(eq=False)
+class MathChannel:
+    name: str
+    inputs: typing.List[str]  # native or derived channel names, passed positionally to func
+    func: typing.Callable[..., typing.Any]  # vectorised: numpy arrays in, numpy array out
+    units: str = ""
+    dec_pts: int = 0
+    interpolate: bool = True
+    timebase: typing.Optional[str] = None  # input whose timecodes the result uses
+
+
+@dataclass(eq=False)
+class MathChannels:
+    """
+    Lazily evaluated derived channels on top of LogFile.channels.
+
+    Each derived channel is a vectorised function of other channels (native or
+    derived).  Inputs are aligned onto a common timebase - by default the
+    input with the most samples - using the same interpolate / hold rules as
+    LogFile.get_channels_as_table().  Results are computed on first access and
+    cached as channel tables with the same layout and metadata as native
+    channels.
+
+    Example:
+        math = MathChannels(log)
+        math.define("Combined G", ["InlineAcc", "LateralAcc"], np.hypot, units="G", dec_pts=2)
+        table = math["Combined G"]
+    """
+
+    log: LogFile
+    definitions: typing.Dict[str, MathChannel] = field(default_factory=dict)
+    _cache: typing.Dict[str, pa.Table] = field(default_factory=dict, repr=False)
+
+    def define(
+        self,
+        name: str,
+        inputs: typing.Sequence[str],
+        func: typing.Callable[..., typing.Any],
+        units: str = "",
+        dec_pts: int = 0,
+        interpolate: bool = True,
+        timebase: typing.Optional[str] = None,
+    ) -> MathChannel:
+        """
+        Register a derived channel.  Nothing is evaluated until it is accessed.
+
+        Args:
+            name: Name of the derived channel
+            inputs: Channel names whose aligned values are passed to func, in order
+            func: Vectorised function computing the channel values
+            units: Units stored in the field metadata
+            dec_pts: Decimal places stored in the field metadata
+            interpolate: Interpolate flag stored in the field metadata
+            timebase: Input whose timecodes are used (default: most samples)
+
+        Returns:
+            The registered MathChannel definition.
+        """
+        if name in self.log.channels:
+            raise ValueError("%s is already a native channel" % name)
+        if timebase is not None and timebase not in inputs:
+            raise ValueError("timebase %s is not one of the inputs of %s" % (timebase, name))
+        definition = MathChannel(name, list(inputs), func, units, dec_pts, interpolate, timebase)
+        self.definitions[name] = definition
+        self.invalidate(name)
+        return definition
+
+    def invalidate(self, name: typing.Optional[str] = None) -> None:
+        """Drop cached results for name and everything depending on it (or all if None)."""
+        if name is None:
+            self._cache.clear()
+            return
+        self._cache.pop(name, None)
+        for other in self.definitions.values():
+            if name in other.inputs and other.name in self._cache:
+                self.invalidate(other.name)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self.definitions
+
+    def __getitem__(self, name: str) -> pa.Table:
+        return self._evaluate(name, ())
+
+    def keys(self) -> typing.KeysView[str]:
+        return self.definitions.keys()
+
+    def dependencies(self, name: str) -> typing.List[str]:
+        """Return the derived channels name depends on, in evaluation order."""
+        order: typing.List[str] = []
+
+        def visit(n: str, stack: typing.Tuple[str, ...]) -> None:
+            if n in stack:
+                raise ValueError("Circular math channel dependency: %s" % " -> ".join(stack + (n,)))
+            if n not in self.definitions or n in order:
+                return
+            for dep in self.definitions[n].inputs:
+                visit(dep, stack + (n,))
+            order.append(n)
+
+        visit(name, ())
+        return order[:-1]
+
+    def materialize(
+        self, names: typing.Optional[typing.Iterable[str]] = None
+    ) -> typing.Dict[str, pa.Table]:
+        """Evaluate derived channels (all by default) and return them keyed by name."""
+        return {n: self[n] for n in (self.definitions if names is None else names)}
+
+    def _lookup(self, name: str, stack: typing.Tuple[str, ...]) -> pa.Table:
+        if name in self.log.channels:
+            return self.log.channels[name]
+        if name in self.definitions:
+            return self._evaluate(name, stack)
+        raise KeyError(name)
+
+    def _evaluate(self, name: str, stack: typing.Tuple[str, ...]) -> pa.Table:
+        if name in self._cache:
+            return self._cache[name]
+        if name in stack:
+            raise ValueError("Circular math channel dependency: %s" % " -> ".join(stack + (name,)))
+        definition = self.definitions[name]
+        tables = [self._lookup(n, stack + (name,)) for n in definition.inputs]
+
+        if definition.timebase is not None:
+            base_table = tables[definition.inputs.index(definition.timebase)]
+        else:
+            base_table = max(tables, key=len)
+        timecodes = base_table.column("timecodes").to_numpy()
+
+        # Inputs already on the chosen timebase are passed through without resampling
+        args = [
+            (channel_values(t) if t is base_table else resample_channel(t, timecodes))
+            for t in tables
+        ]
+        values = np.asarray(definition.func(*args))
+        if values.shape != timecodes.shape:
+            values = np.broadcast_to(values, timecodes.shape).copy()
+
+        metadata = channel_metadata(definition.units, definition.dec_pts, definition.interpolate)
+        schema = pa.schema(
+            [
+                pa.field("timecodes", pa.int64()),
+                pa.field(name, pa.from_numpy_dtype(values.dtype), metadata=metadata),
+            ]
+        )
+        result = pa.table(
+            {"timecodes": base_table.column("timecodes"), name: pa.array(values)}, schema=schema
+        )
+        self._cache[name] = result
+        return result
@@ -0,0 +1,81 @@
+# Copyright 2024, Scott Smith.  MIT License (see LICENSE).
+
+"""Sector / split times from GPS crossings of split lines."""
+
+import typing
+import numpy as np
+import pyarrow as pa
+
+from . import gps
+from .base import LogFile
+from .distance import ground_ecef
+from .tracks import LatLong, Track
+
+
+def split_crossings(log: LogFile, splits: typing.Sequence[typing.Tuple[float, float]]):
+    """
+    Find every crossing of every split line over the whole session.
+
+    All splits are located in a single pass over the ECEF trajectory with
+    gps.find_crossings(), using the same plane intersection and velocity
+    weighted normal refinement as the start/finish lap insert.
+
+    Args:
+        log: LogFile with GPS channels
+        splits: (lat, long) of each split line, degrees
+
+    Returns:
+        A list with one numpy array of crossing times (ms) per split.
+    """
+    timecodes, XYZ = ground_ecef(log)
+    return [np.asarray(c, dtype=np.float64) for c in gps.find_crossings(XYZ, timecodes, splits)]
+
+
+def sector_times(
+    log: LogFile,
+    splits: typing.Union[Track, typing.Sequence[LatLong]],
+    laps: typing.Optional[typing.Iterable[int]] = None,
+) -> pa.Table:
+    """
+    Compute per lap sector times for any number of split lines.
+
+    Laps are divided at the first crossing of each split (in order) after
+    the previous split, so N splits give N+1 sectors per lap, the last one
+    ending at the lap's end.  If a split isn't crossed within a lap, the
+    sectors on either side of it are null.
+
+    Args:
+        log: LogFile with GPS channels and laps
+        splits: (lat, long) of each split line, in lap order, degrees, or a
+            Track (e.g. from a tracks.TrackDatabase) to use its sectors
+        laps: Lap numbers to include (default: all laps)
+
+    Returns:
+        A PyArrow table with columns 'num', 'sector_1' .. 'sector_<N+1>'
+        and 'lap_time', all times in ms.
+    """
+    if isinstance(splits, Track):
+        splits = splits.sectors
+    nums = log.laps.column("num").to_numpy()
+    start = log.laps.column("start_time").to_numpy().astype(np.float64)
+    end = log.laps.column("end_time").to_numpy().astype(np.float64)
+    if laps is not None:
+        pick = np.isin(nums, np.fromiter(laps, dtype=nums.dtype))
+        nums, start, end = nums[pick], start[pick], end[pick]
+
+    # boundary k of each lap: start, first crossing of split k after
+    # boundary k-1 (nan once a split is missed), end
+    bounds = [start]
+    for crossings in split_crossings(log, splits):
+        prev = bounds[-1]
+        idx = np.searchsorted(crossings, np.nan_to_num(prev, nan=np.inf), side="right")
+        found = np.append(crossings, np.inf)[idx]
+        bounds.append(np.where(found < end, found, np.nan))
+    bounds.append(end)
+
+    result = {"num": pa.array(nums, type=pa.int32())}
+    for k, (lo, hi) in enumerate(zip(bounds[:-1], bounds[1:])):
+        sector = hi - lo
+        result["sector_%d" % (k + 1)] = pa.array(sector, mask=np.isnan(sector))
+    result["lap_time"] = pa.array(end - start)
+    return pa.table(result)
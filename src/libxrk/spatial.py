@@ -0,0 +1,133 @@
+# Copyright 2024, Scott Smith.  MIT License (see LICENSE).
+
+"""Uniform grid spatial index over polyline segments."""
+
+import typing
+import numpy as np
+
+
+def _expand_cells(lo: np.ndarray, hi: np.ndarray) -> typing.Tuple[np.ndarray, np.ndarray]:
+    # lo, hi: (N, d) inclusive integer cell ranges.  Returns (owner, cells)
+    # where owner[i] is the row each cell in cells[i] came from.  Everything
+    # is vectorised; each row typically covers 1 or 2 cells per axis.
+    extent = hi - lo + 1
+    total = np.prod(extent, axis=1)
+    owner = np.repeat(np.arange(len(lo)), total)
+    k = np.arange(len(owner)) - np.repeat(np.cumsum(total) - total, total)
+    cells = np.empty((len(owner), lo.shape[1]), dtype=np.int64)
+    for axis in range(lo.shape[1]):
+        n = extent[owner, axis]
+        cells[:, axis] = lo[owner, axis] + k % n
+        k //= n
+    return owner, cells
+
+
+class SegmentGrid:
+    """
+    Spatial index of the segments of a polyline (points[i] -> points[i+1]).
+
+    Segment bounding boxes are bucketed into a uniform grid of cubic cells.
+    Queries only examine the segments sharing a cell with the query
+    neighborhood, so memory and time scale with the number of candidate pairs
+    rather than queries x segments.  Works in any number of dimensions.
+    """
+
+    def __init__(self, points: np.ndarray, cell_size: float):
+        points = np.asarray(points, dtype=np.float64)
+        assert points.ndim == 2 and len(points) >= 2
+        self.points = points
+        self.cell_size = float(cell_size)
+        self.origin = points.min(axis=0)
+
+        O = points[:-1]
+        D = points[1:] - O
+        self.O = O
+        self.D = D
+        self.DD = np.sum(D * D, axis=1)
+
+        lo = self._cell(np.minimum(points[:-1], points[1:]))
+        hi = self._cell(np.maximum(points[:-1], points[1:]))
+        self._dims = hi.max(axis=0) + 3  # room for query neighborhoods
+        seg, cells = _expand_cells(lo, hi)
+        keys = self._key(cells)
+        order = np.argsort(keys, kind="stable")
+        self._keys, self._starts = np.unique(keys[order], return_index=True)
+        self._ends = np.append(self._starts[1:], len(order))
+        self._segs = seg[order]
+
+    def __len__(self) -> int:
+        return len(self.O)
+
+    def _cell(self, p: np.ndarray) -> np.ndarray:
+        # shift by one so query neighborhoods just outside the bbox stay non-negative
+        cell: np.ndarray = np.floor((p - self.origin) / self.cell_size).astype(np.int64)
+        return cell + 1
+
+    def _key(self, cells: np.ndarray) -> np.ndarray:
+        key = np.zeros(len(cells), dtype=np.int64)
+        for axis in range(cells.shape[1]):
+            key = key * self._dims[axis] + cells[:, axis]
+        return key
+
+    def candidates(self, query: np.ndarray, radius: float) -> typing.Tuple[np.ndarray, np.ndarray]:
+        """
+        Find segments whose bounding box cells intersect the neighborhood of each query point.
+
+        Args:
+            query: (M, d) query points
+            radius: neighborhood radius, same units as the points
+
+        Returns:
+            (query_idx, seg_idx) arrays of candidate pairs.  Every segment
+            within radius of a query point is included; some further away may
+            be too.  Pairs may repeat.
+        """
+        query = np.asarray(query, dtype=np.float64).reshape((-1, self.points.shape[1]))
+        lo = np.maximum(self._cell(query - radius), 0)
+        hi = np.minimum(self._cell(query + radius), self._dims - 1)
+        valid = np.all(lo <= hi, axis=1)
+        qidx, cells = _expand_cells(lo[valid], hi[valid])
+        qidx = np.nonzero(valid)[0][qidx]
+
+        keys = self._key(cells)
+        slot = np.minimum(np.searchsorted(self._keys, keys), len(self._keys) - 1)
+        hit = self._keys[slot] == keys
+        qidx, slot = qidx[hit], slot[hit]
+        counts = self._ends[slot] - self._starts[slot]
+        pos = np.arange(np.sum(counts)) - np.repeat(np.cumsum(counts) - counts, counts)
+        pos += np.repeat(self._starts[slot], counts)
+        return np.repeat(qidx, counts), self._segs[pos]
+
+    def nearest(
+        self, query: np.ndarray, radius: float
+    ) -> typing.Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Project query points onto the nearest segment within radius.
+
+        Args:
+            query: (M, d) query points
+            radius: search radius, same units as the points
+
+        Returns:
+            (seg_idx, t, dist) arrays of length M.  t in [0, 1] is the position
+            along the segment.  Points with no segment within radius get
+            seg_idx -1, t nan and dist inf.
+        """
+        query = np.asarray(query, dtype=np.float64).reshape((-1, self.points.shape[1]))
+        qidx, sidx = self.candidates(query, radius)
+        rel = query[qidx] - self.O[sidx]
+        t = np.clip(np.sum(rel * self.D[sidx], axis=1) / np.maximum(self.DD[sidx], 1e-12), 0, 1)
+        distsq = np.sum(np.square(rel - t[:, np.newaxis] * self.D[sidx]), axis=1)
+
+        seg_out = np.full(len(query), -1, dtype=np.int64)
+        t_out = np.full(len(query), np.nan)
+        dist_out = np.full(len(query), np.inf)
+        if len(qidx):
+            order = np.lexsort((distsq, qidx))
+            first = order[np.unique(qidx[order], return_index=True)[1]]
+            keep = distsq[first] <= radius * radius
+            first = first[keep]
+            seg_out[qidx[first]] = sidx[first]
+            t_out[qidx[first]] = t[first]
+            dist_out[qidx[first]] = np.sqrt(distsq[first])
+        return seg_out, t_out, dist_out
@@ -0,0 +1,158 @@
+# Copyright 2024, Scott Smith.  MIT License (see LICENSE).
+
+"""
+Compact timecodes for channels sampled at a fixed rate.
+
+Most channels are logged at a fixed period, so their timecodes are runs
+of start + k * period, broken only where logging paused.  A Timebase
+stores each run as (start, period, count): a handful of numbers rather
+than one int64 per sample.  Looking up a time is arithmetic within its
+run instead of a binary search over every sample.
+
+The decoder keeps M message channels as runs while it scans a file, then
+materializes their timecodes: channel tables are Arrow tables, with a
+timecodes column.  LogFile.timebase() gives the runs alongside them.
+"""
+
+from dataclasses import dataclass, field
+import typing
+import numpy as np
+
+# from_timecodes() gives up on channels with more than one run per this
+# many samples: their timecodes aren't worth describing as runs.
+MIN_RUN_LENGTH = 16
+
+
+@dataclass(eq=False)
+class Timebase:
+    """
+    Strictly increasing timecodes as runs: run r is the count[r] timecodes
+    start[r] + k * period[r] (k = 0 .. count[r] - 1).  Runs are in time
+    order and don't overlap; the gaps between them are arbitrary.
+    """
+
+    start: np.ndarray
+    period: np.ndarray
+    count: np.ndarray
+    offset: np.ndarray = field(init=False, repr=False)  # index of each run's first sample
+
+    def __post_init__(self) -> None:
+        self.start = np.asarray(self.start, dtype=np.int64)
+        self.period = np.asarray(self.period, dtype=np.int64)
+        self.count = np.asarray(self.count, dtype=np.int64)
+        self.offset = np.cumsum(self.count) - self.count
+
+    def __len__(self) -> int:
+        return int(self.count.sum())
+
+    @property
+    def runs(self) -> int:
+        return len(self.start)
+
+    @classmethod
+    def from_runs(cls, start: np.ndarray, count: np.ndarray, period: int) -> "Timebase":
+        """
+        Timebase of consecutive blocks of samples at one period (such as
+        M messages), joining blocks that continue the previous one.
+        """
+        start = np.asarray(start, dtype=np.int64)
+        count = np.asarray(count, dtype=np.int64)
+        if not len(start):
+            return cls(start, start, count)
+        # a block starts a new run unless it follows on from the last one
+        new = np.ones(len(start), dtype=bool)
+        new[1:] = start[1:] != start[:-1] + count[:-1] * period
+        first = np.flatnonzero(new)
+        return cls(
+            start[first],
+            np.full(len(first), max(period, 1)),
+            np.add.reduceat(count, first),
+        )
+
+    @classmethod
+    def from_timecodes(
+        cls, timecodes: np.ndarray, min_run_length: int = MIN_RUN_LENGTH
+    ) -> typing.Optional["Timebase"]:
+        """
+        Find the fixed period runs of timecodes.
+
+        Returns:
+            The Timebase, or None if timecodes aren't strictly increasing
+            or have more than one run per min_run_length samples.
+        """
+        tc = np.asarray(timecodes, dtype=np.int64)
+        n = len(tc)
+        if n < 2:
+            return cls(tc[:1], np.ones(n), np.ones(n))
+        d = np.diff(tc)
+        if d.min() <= 0:
+            return None
+        # positions where the step changes; each run is found from one
+        changes = np.flatnonzero(d[1:] != d[:-1]) + 1
+        if len(changes) > 2 * n // min_run_length:
+            return None
+        starts, periods, counts = [], [], []
+        a = 0
+        while a < n:
+            # a run from sample a at step d[a] ends at the next change of
+            # step (if any); the step to the following sample is a gap
+            period, b = 1, a
+            if a < n - 1:
+                j = np.searchsorted(changes, a, side="right")
+                period, b = d[a], changes[j] if j < len(changes) else n - 1
+            starts.append(tc[a])
+            periods.append(period)
+            counts.append(b - a + 1)
+            a = b + 1
+        return cls(np.array(starts), np.array(periods), np.array(counts))
+
+    def materialize(self, out: typing.Optional[np.ndarray] = None) -> np.ndarray:
+        """The timecodes (int64), into out if given."""
+        n = len(self)
+        if out is None:
+            out = np.empty(n, dtype=np.int64)
+        run = np.repeat(np.arange(self.runs), self.count)
+        np.subtract(np.arange(n), self.offset[run], out=out)
+        out *= self.period[run]
+        out += self.start[run]
+        return out
+
+    def at(self, indices: np.ndarray) -> np.ndarray:
+        """Timecodes of samples at indices (0 <= indices < len(self))."""
+        i = np.asarray(indices, dtype=np.int64)
+        run = np.searchsorted(self.offset, i, side="right") - 1
+        result: np.ndarray = self.start[run] + (i - self.offset[run]) * self.period[run]
+        return result
+
+    def searchsorted(
+        self, t: np.ndarray, side: typing.Literal["left", "right"] = "left"
+    ) -> np.ndarray:
+        """np.searchsorted(self.materialize(), t, side), without materializing."""
+        t = np.asarray(t)
+        if not self.runs:
+            return np.zeros(t.shape, dtype=np.int64)
+        # the run each time falls in (or after), then the position in it
+        run = np.maximum(np.searchsorted(self.start, t, side=side) - 1, 0)
+        into = t - self.start[run]
+        if side == "left":
+            k = -np.floor_divide(-into, self.period[run])  # samples before t: ceil
+        else:
+            k = np.floor_divide(into, self.period[run]) + 1  # samples up to t
+        result: np.ndarray = self.offset[run] + np.clip(k, 0, self.count[run]).astype(np.int64)
+        return result
+
+    def interp(self, t: np.ndarray, values: np.ndarray) -> np.ndarray:
+        """np.interp(t, self.materialize(), values), without materializing."""
+        t = np.asarray(t, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64)
+        n = len(values)
+        if n == 1:
+            return np.full(t.shape, values[0])
+        i = np.clip(self.searchsorted(t, side="right") - 1, 0, n - 2)
+        t0 = self.at(i)
+        t1 = self.at(i + 1)
+        w = np.clip((t - t0) / (t1 - t0), 0.0, 1.0)
+        result = values[i] + (values[i + 1] - values[i]) * w
+        # exact at (and beyond) the samples, as np.interp is
+        exact: np.ndarray = np.where(w == 1.0, values[i + 1], result)
+        return exact
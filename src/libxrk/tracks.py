@@ -0,0 +1,187 @@
+# Copyright 2024, Scott Smith.  MIT License (see LICENSE).
+
+"""Track database: start/finish and split lines, outlines, and lookup by position."""
+
+from dataclasses import dataclass, field
+import json
+import typing
+import numpy as np
+
+from . import gps
+
+LatLong = typing.Tuple[float, float]
+
+# meters per degree of latitude (close enough for bounding boxes)
+_M_PER_DEG = 111320.0
+
+
+@dataclass(eq=False)
+class Track:
+    """
+    A venue: its start/finish line, split lines in lap order and optionally
+    an outline of the circuit, all as (lat, long) degrees.
+    """
+
+    name: str
+    start_finish: LatLong
+    sectors: typing.List[LatLong] = field(default_factory=list)
+    outline: typing.Optional[np.ndarray] = field(default=None, repr=False)  # (N, 2) lat, long
+
+    def points(self) -> np.ndarray:
+        """All known points of the track as an (N, 2) array of (lat, long)."""
+        pts = [np.array([self.start_finish], dtype=np.float64)]
+        if self.sectors:
+            pts.append(np.array(self.sectors, dtype=np.float64))
+        if self.outline is not None and len(self.outline):
+            pts.append(np.asarray(self.outline, dtype=np.float64))
+        return np.concatenate(pts)
+
+    def to_dict(self) -> typing.Dict[str, typing.Any]:
+        ret: typing.Dict[str, typing.Any] = {
+            "name": self.name,
+            "start_finish": list(self.start_finish),
+            "sectors": [list(s) for s in self.sectors],
+        }
+        if self.outline is not None:
+            ret["outline"] = np.asarray(self.outline).tolist()
+        return ret
+
+    @classmethod
+    def from_dict(cls, d: typing.Dict[str, typing.Any]) -> "Track":
+        outline = d.get("outline")
+        return cls(
+            name=d["name"],
+            start_finish=(float(d["start_finish"][0]), float(d["start_finish"][1])),
+            sectors=[(float(s[0]), float(s[1])) for s in d.get("sectors", [])],
+            outline=None if outline is None else np.array(outline, dtype=np.float64),
+        )
+
+
+@dataclass(eq=False)
+class TrackDatabase:
+    """
+    Tracks keyed by name (as found in the TRK message of XRK files), with
+    a bounding box index to find the track a session was recorded at from
+    its GPS fixes.
+
+    Example:
+        tracks = TrackDatabase.load("tracks.json")
+        track = tracks.match(lat, long)  # or tracks.get("Fuji GP Sh")
+    """
+
+    tracks: typing.Dict[str, Track] = field(default_factory=dict)
+    margin: float = 500.0  # meters around a track's points that count as at the track
+    _names: typing.List[str] = field(default_factory=list, repr=False)
+    _bbox: typing.Optional[np.ndarray] = field(default=None, repr=False)
+
+    def add(self, track: Track) -> None:
+        self.tracks[track.name] = track
+        self._bbox = None
+
+    def get(self, name: str) -> typing.Optional[Track]:
+        return self.tracks.get(name)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self.tracks
+
+    def __len__(self) -> int:
+        return len(self.tracks)
+
+    def _index(self) -> np.ndarray:
+        # (T, 4) lat_min, lat_max, long_min, long_max including the margin
+        if self._bbox is None:
+            self._names = list(self.tracks)
+            boxes = np.empty((len(self._names), 4))
+            for i, name in enumerate(self._names):
+                pts = self.tracks[name].points()
+                dlat = self.margin / _M_PER_DEG
+                dlon = dlat / max(np.cos(np.radians(np.max(np.abs(pts[:, 0])))), 1e-6)
+                boxes[i] = (
+                    pts[:, 0].min() - dlat,
+                    pts[:, 0].max() + dlat,
+                    pts[:, 1].min() - dlon,
+                    pts[:, 1].max() + dlon,
+                )
+            self._bbox = boxes
+        return self._bbox
+
+    def candidates(self, lat: float, long: float) -> typing.List[Track]:
+        """Tracks whose (margin expanded) bounding box contains the point."""
+        box = self._index()
+        inside = (box[:, 0] <= lat) & (lat <= box[:, 1]) & (box[:, 2] <= long) & (long <= box[:, 3])
+        return [self.tracks[self._names[i]] for i in np.nonzero(inside)[0]]
+
+    @staticmethod
+    def _fix(
+        lat: np.ndarray, long: np.ndarray, samples: int
+    ) -> typing.Optional[typing.Tuple[float, float]]:
+        # median of the first valid fixes; no fix is usually reported as 0, 0 (or nan)
+        lat = np.asarray(lat, dtype=np.float64)
+        long = np.asarray(long, dtype=np.float64)
+        valid = np.isfinite(lat) & np.isfinite(long) & ((lat != 0) | (long != 0))
+        lat, long = lat[valid][:samples], long[valid][:samples]
+        if not len(lat):
+            return None
+        return float(np.median(lat)), float(np.median(long))
+
+    def match(
+        self, lat: np.ndarray, long: np.ndarray, samples: int = 100
+    ) -> typing.Optional[Track]:
+        """
+        Find the track GPS fixes were recorded at.
+
+        Uses the median of the first valid fixes, so a few bad fixes before
+        GPS lock don't matter.  When several tracks are nearby (e.g. layouts
+        of one venue) the one with a point closest to the fixes is chosen.
+
+        Args:
+            lat, long: GPS fixes, degrees
+            samples: How many of the first valid fixes to use
+
+        Returns:
+            The matching Track, or None if the fixes aren't at a known track.
+        """
+        fix = self._fix(lat, long, samples)
+        if fix is None:
+            return None
+        found = self.candidates(*fix)
+        if len(found) <= 1:
+            return found[0] if found else None
+        P = np.array(gps.lla2ecef(fix[0], fix[1], 0.0))
+
+        def _dist(track: Track) -> float:
+            pts = track.points()
+            XYZ = np.column_stack(gps.lla2ecef(pts[:, 0], pts[:, 1], 0.0))
+            return float(np.min(np.sum(np.square(XYZ - P), axis=1)))
+
+        return min(found, key=_dist)
+
+    def resolve(
+        self, name: typing.Optional[str], lat: np.ndarray, long: np.ndarray, samples: int = 100
+    ) -> typing.Optional[Track]:
+        """
+        Pick the track for a session whose TRK message names name (None if
+        there is no TRK message).
+
+        The named track is used if it is in the database and the fixes are
+        at it (or there are no valid fixes), otherwise the track is looked
+        up from the fixes.
+        """
+        track = self.get(name) if name is not None else None
+        fix = self._fix(lat, long, samples)
+        if track is not None and (fix is None or track in self.candidates(*fix)):
+            return track
+        return self.match(lat, long, samples)
+
+    def save(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"tracks": [t.to_dict() for t in self.tracks.values()]}, f, indent=1)
+
+    @classmethod
+    def load(cls, path: str) -> "TrackDatabase":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        db = cls()
+        for d in data.get("tracks", []):
+            db.add(Track.from_dict(d))
+        return db
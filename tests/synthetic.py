@@ -0,0 +1,212 @@
+"""Synthetic sessions for unit tests that don't need a real XRK file."""
+
+import struct
+
+import numpy as np
+import pyarrow as pa
+from libxrk import gps
+from libxrk.base import LogFile, channel_metadata
+
+# Somewhere near Fuji Speedway
+LAT0 = 35.3700
+LON0 = 138.9270
+
+
+def channel_table(name, timecodes, values, interpolate=True, units="", dec_pts=1):
+    """Build a channel table with the same layout as aim_xrk produces."""
+    values = np.asarray(values)
+    return pa.table(
+        {"timecodes": pa.array(timecodes, type=pa.int64()), name: pa.array(values)},
+        schema=pa.schema(
+            [
+                pa.field("timecodes", pa.int64()),
+                pa.field(
+                    name,
+                    pa.from_numpy_dtype(values.dtype),
+                    metadata=channel_metadata(units, dec_pts, interpolate),
+                ),
+            ]
+        ),
+    )
+
+
+def enu_to_ecef(east, north, up=0.0, lat0=LAT0, lon0=LON0):
+    """Convert local east/north/up meters around (lat0, lon0) to ECEF."""
+    origin = np.array(gps.lla2ecef(lat0, lon0, 0.0))
+    slat, clat = np.sin(np.radians(lat0)), np.cos(np.radians(lat0))
+    slon, clon = np.sin(np.radians(lon0)), np.cos(np.radians(lon0))
+    e = np.array([-slon, clon, 0.0])
+    n = np.array([-slat * clon, -slat * slon, clat])
+    u = np.array([clat * clon, clat * slon, slat])
+    return (
+        origin
+        + np.multiply.outer(np.asarray(east, dtype=np.float64), e)
+        + np.multiply.outer(np.asarray(north, dtype=np.float64), n)
+        + np.multiply.outer(np.asarray(up, dtype=np.float64) * np.ones_like(east), u)
+    )
+
+
+def enu_to_lla(east, north, lat0=LAT0, lon0=LON0):
+    """Convert local east/north meters around (lat0, lon0) to lat/long degrees."""
+    XYZ = enu_to_ecef(east, north, 0.0, lat0, lon0)
+    return gps.ecef2lla(XYZ[:, 0], XYZ[:, 1], XYZ[:, 2])
+
+
+def circuit(lap_times, radius=100.0, period=100):
+    """
+    A car lapping a circle counterclockwise, starting on the finish line.
+
+    The start/finish line crosses the circle at its easternmost point.  Each
+    lap is driven at constant speed.
+
+    Returns:
+        (timecodes, east, north, speed, lap_markers) numpy arrays, lap
+        markers in ms at each line crossing (including t=0).
+    """
+    lap_markers = np.concatenate(([0], np.cumsum(lap_times)))
+    timecodes = np.arange(0, lap_markers[-1] + 1, period)
+    lap = np.minimum(np.searchsorted(lap_markers, timecodes, side="right") - 1, len(lap_times) - 1)
+    frac = (timecodes - lap_markers[lap]) / np.asarray(lap_times)[lap]
+    theta = 2 * np.pi * (lap + frac)
+    speed = 2 * np.pi * radius / (np.asarray(lap_times)[lap] / 1000)
+    return timecodes, radius * np.cos(theta), radius * np.sin(theta), speed, lap_markers
+
+
+def circuit_log(lap_times, radius=100.0, period=100, channels=None):
+    """LogFile for circuit() with GPS channels and exact laps."""
+    timecodes, east, north, speed, lap_markers = circuit(lap_times, radius, period)
+    lla = enu_to_lla(east, north)
+    all_channels = {
+        "GPS Speed": channel_table("GPS Speed", timecodes, speed, units="m/s"),
+        "GPS Latitude": channel_table("GPS Latitude", timecodes, lla.lat, units="deg"),
+        "GPS Longitude": channel_table("GPS Longitude", timecodes, lla.long, units="deg"),
+    }
+    all_channels.update(channels or {})
+    return LogFile(
+        channels=all_channels,
+        laps=pa.table(
+            {
+                "num": pa.array(np.arange(len(lap_times)), type=pa.int32()),
+                "start_time": pa.array(lap_markers[:-1], type=pa.int64()),
+                "end_time": pa.array(lap_markers[1:], type=pa.int64()),
+            }
+        ),
+        metadata={},
+        file_name="synthetic.xrk",
+    )
+
+
+def sf_marker(radius=100.0):
+    """(lat, long) of the start/finish line of circuit()."""
+    lla = enu_to_lla(np.array([radius]), np.array([0.0]))
+    return (float(lla.lat[0]), float(lla.long[0]))
+
+
+# Raw XRK streams, laid out the way aim_xrk's decoder reads them.
+
+
+def xrk_message(token, payload, ver=0):
+    """A <h token> message: header, payload and checksummed footer."""
+    tok = struct.unpack("<I", token.encode("ascii").ljust(4, b"\0"))[0]
+    return (
+        struct.pack("<2sIiBc", b"<h", tok, len(payload), ver, b">")
+        + payload
+        + struct.pack("<cIHc", b"<", tok, sum(payload) & 0xFFFF, b">")
+    )
+
+
+def xrk_channel(index, name, size, decoder, units=6, rate=0):
+    """
+    A CHS message (channel definition).  decoder and units are the codes
+    of libxrk.decoders and aim_xrk._unit_map, rate the byte that gives
+    the spacing of M message samples (32 = 20ms).
+    """
+    content = bytearray(112)
+    struct.pack_into("<H", content, 0, index)
+    content[12] = units
+    content[20] = decoder
+    content[24:32] = name[:8].encode("ascii").ljust(8, b"\0")
+    content[32:56] = name.encode("ascii").ljust(24, b"\0")
+    content[64] = rate
+    content[72] = size
+    return xrk_message("CHS", bytes(content))
+
+
+def xrk_group(index, channels):
+    """A GRP message: channels (indices) sampled together in G messages."""
+    return xrk_message(
+        "GRP", struct.pack("<%dH" % (len(channels) + 2), index, len(channels), *channels)
+    )
+
+
+def xrk_config(*messages):
+    """A CNF message holding CHS/GRP messages."""
+    return xrk_message("CNF", b"".join(messages))
+
+
+def xrk_sample(index, timecode, data):
+    """An S message: one sample of a channel."""
+    return b"(S" + struct.pack("<iH", timecode, index) + data + b")"
+
+
+def xrk_group_sample(index, timecode, data):
+    """A G message: one sample of every channel of a group."""
+    return b"(G" + struct.pack("<iH", timecode, index) + data + b")"
+
+
+def xrk_expanded_sample(index, timecode, data):
+    """A c message: one sample of a channel."""
+    return b"(c" + struct.pack("<BHBBi", 0, index << 3 | 4, 0x84, 6, timecode) + data + b")"
+
+
+def xrk_multi_sample(index, timecode, count, data):
+    """An M message: count samples of a channel, spaced by its rate."""
+    return b"(M" + struct.pack("<iHH", timecode, index, count) + data + b")"
+
+
+def xrk_gps(timecodes, XYZ):
+    """A GPS message with one fix (ECEF meters) per timecode."""
+    cm = np.round(np.asarray(XYZ) * 100).astype(int).tolist()
+    return xrk_message(
+        "GPS",
+        b"".join(
+            struct.pack("<iIIHxxiiiiiiiixxxB4x", t, 0, 0, 0, x, y, z, 100, 0, 0, 0, 100, 9)
+            for t, (x, y, z) in zip(np.asarray(timecodes).tolist(), cm)
+        ),
+    )
+
+
+def xrk_session(lap_times=(10000, 9000), start=1000):
+    """
+    The records of a raw XRK stream of circuit(): a configuration, then a
+    sample of every kind of record every 100ms (S: Speed and Battery (mV),
+    c: RPM, G: AccX and Gear, M: Steer, five samples), GPS fixes, and a
+    LAP message for each lap.  Timecodes start at start.
+    """
+    timecodes, east, north, _, lap_markers = circuit(list(lap_times))
+    XYZ = enu_to_ecef(east, north)
+    records = [
+        xrk_config(
+            xrk_channel(0, "Speed", 4, 6),
+            xrk_channel(1, "RPM", 2, 4, units=15),
+            xrk_channel(2, "AccX", 4, 6, units=3),
+            xrk_channel(3, "Gear", 2, 15),
+            xrk_channel(4, "Battery", 2, 4, units=21),
+            xrk_channel(5, "Steer", 2, 4, units=4, rate=32),
+            xrk_group(0, [2, 3]),
+        )
+    ]
+    for i, t in enumerate(timecodes.tolist()):
+        tc = start + t
+        records.append(xrk_sample(0, tc, struct.pack("<f", i * 0.5)))
+        records.append(xrk_expanded_sample(1, tc, struct.pack("<h", 1000 + i)))
+        records.append(xrk_group_sample(0, tc, struct.pack("<fH", -i / 8, ord("N123"[i % 4]))))
+        records.append(xrk_multi_sample(5, tc, 5, struct.pack("<5h", *range(i, i + 5))))
+        if i % 10 == 0:
+            records.append(xrk_sample(4, tc, struct.pack("<h", 12000 + i)))
+            records.append(xrk_gps(timecodes[i : i + 10] + start, XYZ[i : i + 10]))
+    for lap, (t0, t1) in enumerate(zip(lap_markers[:-1].tolist(), lap_markers[1:].tolist())):
+        records.append(
+            xrk_message("LAP", struct.pack("<xBHIxxxxxxxxI", 0, lap, t1 - t0, start + t1))
+        )
+    return records
@@ -0,0 +1,58 @@
+"""Unit tests for the GPS benchmark harness."""
+
+import json
+import unittest
+from libxrk import bench
+
+
+class TestBench(unittest.TestCase):
+    """Small runs of every benchmark."""
+
+    def setUp(self):
+        self.results = bench.run(
+            sizes=[1000],
+            dtypes=["float64", "float32"],
+            laps=[3],
+            markers=[20],
+            repeat=1,
+            imports=["libxrk"],
+        )
+
+    def _find(self, name, variant="", dtype="float64"):
+        return [r for r in self.results if (r.name, r.variant, r.dtype) == (name, variant, dtype)]
+
+    def test_cases(self):
+        """Each algorithm, dtype and code path is measured once."""
+        self.assertEqual(len(self.results), 1 + 3 * 2 + 2 + 1 + 2)
+        for r in self.results:
+            self.assertGreater(r.seconds, 0)
+            self.assertGreater(r.throughput, 0)
+            self.assertGreater(r.peak_memory, 0)
+            self.assertEqual(set(r.max_error), set(r.avg_error))
+
+    def test_accuracy(self):
+        """The reported errors are the known accuracy of each case."""
+        (r,) = self._find("ecef2lla", "vermeille2003")
+        self.assertLess(r.max_error["lat"], 1e-9)
+        self.assertLess(r.max_error["alt"], 1e-6)
+        (r,) = self._find("ecef2lla", "fukushima2006", "float32")
+        self.assertLess(r.max_error["alt"], 0.01)
+        (r,) = self._find("lla2ecef", dtype="float32")
+        self.assertLess(r.max_error["xyz"], 2.0)
+        (r,) = self._find("find_laps")
+        self.assertEqual(set(r.max_error), {"ms"})
+        self.assertLess(r.max_error["ms"], 50)
+        for variant in ("dense", "indexed"):
+            (r,) = self._find("find_crossing_idx", variant)
+            self.assertLess(r.max_error["idx"], 1)
+
+    def test_report(self):
+        """Results format as a table and serialise to JSON."""
+        self.assertEqual(len(bench.format_results(self.results).splitlines()), 13)
+        data = json.loads(json.dumps([r.to_dict() for r in self.results]))
+        self.assertEqual(data[1]["name"], "ecef2lla")
+        self.assertIn("throughput", data[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
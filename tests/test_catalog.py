@@ -0,0 +1,128 @@
+"""Unit tests for the SQLite session catalogue."""
+
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+from libxrk import catalog, cli
+from libxrk.catalog import Catalog
+from .synthetic import circuit_log
+
+
+def _read(path):
+    # the "XRK files" in these tests are JSON describing a synthetic session
+    with open(path, "r", encoding="utf-8") as f:
+        spec = json.load(f)
+    if "error" in spec:
+        raise ValueError(spec["error"])
+    log = circuit_log(spec.pop("laps"))
+    log.metadata.update(spec)
+    return log
+
+
+class TestCatalog(unittest.TestCase):
+    """Tests for indexing and querying sessions."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmp.name, "logs")
+        os.makedirs(self.root)
+        self.catalog_path = os.path.join(self.tmp.name, "catalog.db")
+        self.catalog = Catalog(self.catalog_path)
+        patcher = mock.patch.object(catalog, "_read", side_effect=_read)
+        self.read = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.write("a.xrk", "Fuji GP Sh", "SFJ", "11/04/2025", [60000, 50000, 49000, 52000])
+        self.write("b.xrk", "Fuji GP Sh", "Inferno 86", "11/01/2025", [60000, 48000, 55000])
+        self.write("day2/c.xrk", "Fuji GP Sh", "SFJ", "11/05/2025", [45000, 49500, 48500, 40000])
+        self.write("d.xrk", "Tsukuba", "SFJ", "10/01/2025", [30000, 40000, 39000, 35000])
+
+    def tearDown(self):
+        self.catalog.close()
+        self.tmp.cleanup()
+
+    def write(self, name, venue, vehicle, date, laps):
+        path = os.path.join(self.root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        spec = {"Venue": venue, "Vehicle": vehicle, "Log Date": date, "laps": laps}
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(spec, f)
+
+    def test_best_laps(self):
+        """Out and in laps don't count; filters narrow the search."""
+        self.catalog.update(self.root)
+        best = self.catalog.best_laps(limit=1, venue="Fuji GP Sh", vehicle="SFJ").to_pylist()
+        self.assertEqual(len(best), 1)
+        self.assertEqual(best[0]["path"], os.path.join("day2", "c.xrk"))
+        self.assertEqual((best[0]["num"], best[0]["lap_time"]), (2, 48500))
+        self.assertEqual(best[0]["log_date"], "2025-11-05")
+
+        laps = self.catalog.best_laps(venue="Fuji%", limit=None).column("lap_time").to_pylist()
+        self.assertEqual(laps, [48000, 48500, 49000, 49500, 50000])
+        best = self.catalog.best_laps(vehicle="SFJ", until="2025-11-04").to_pylist()
+        self.assertEqual(best[0]["lap_time"], 39000)
+        with self.assertRaises(TypeError):
+            self.catalog.best_laps(colour="red")
+
+    def test_sessions(self):
+        """Sessions store metadata, laps and channels."""
+        self.catalog.update(self.root)
+        sessions = self.catalog.sessions(vehicle="SFJ").to_pylist()
+        self.assertEqual(
+            [s["log_date"] for s in sessions], ["2025-11-05", "2025-11-04", "2025-10-01"]
+        )
+        first = sessions[1]
+        self.assertEqual(
+            (first["lap_count"], first["best_lap"], first["best_lap_time"]), (4, 2, 49000)
+        )
+        self.assertEqual(self.catalog.metadata(first["id"])["Venue"], "Fuji GP Sh")
+        laps = self.catalog.laps(first["id"])
+        self.assertEqual(laps.column("timed").to_pylist(), [0, 1, 1, 0])
+        channels = self.catalog.channels(first["id"]).to_pylist()
+        self.assertEqual(
+            [c["name"] for c in channels], ["GPS Latitude", "GPS Longitude", "GPS Speed"]
+        )
+        self.assertEqual(channels[2]["units"], "m/s")
+
+    def test_incremental(self):
+        """Only new contents are decoded; moves and copies are matched by hash."""
+        stats = self.catalog.update(self.root)
+        self.assertEqual((stats.added, stats.unchanged), (4, 0))
+        self.assertEqual(self.read.call_count, 4)
+
+        stats = self.catalog.update(self.root)
+        self.assertEqual((stats.added, stats.unchanged), (0, 4))
+
+        os.rename(os.path.join(self.root, "a.xrk"), os.path.join(self.root, "moved.xrk"))
+        self.write("e.xrk", "Tsukuba", "SFJ", "10/02/2025", [30000, 38000, 35000])
+        os.remove(os.path.join(self.root, "b.xrk"))
+        stats = self.catalog.update(self.root)
+        self.assertEqual((stats.added, stats.moved, stats.removed), (1, 1, 2))
+        self.assertEqual(self.read.call_count, 5)
+        self.assertEqual(len(self.catalog.sessions()), 4)
+        self.assertEqual(self.catalog.best_laps(vehicle="Inferno 86").num_rows, 0)
+        best = self.catalog.best_laps(limit=1, venue="Fuji GP Sh").to_pylist()
+        self.assertEqual(best[0]["path"], os.path.join("day2", "c.xrk"))
+
+    def test_single_file(self):
+        """A file rather than a folder is rejected, leaving the catalogue as it was."""
+        self.catalog.update(self.root)
+        with self.assertRaises(NotADirectoryError):
+            self.catalog.update(os.path.join(self.root, "a.xrk"))
+        self.assertEqual(len(self.catalog.sessions()), 4)
+        with mock.patch("sys.stderr"), self.assertRaises(SystemExit):
+            cli.main(["catalog", self.catalog_path, os.path.join(self.root, "a.xrk")])
+
+    def test_failed(self):
+        """Files that fail to decode are counted and retried."""
+        with open(os.path.join(self.root, "bad.xrk"), "w", encoding="utf-8") as f:
+            json.dump({"error": "truncated"}, f)
+        stats = self.catalog.update(self.root)
+        self.assertEqual((stats.added, stats.failed), (4, 1))
+        stats = self.catalog.update(self.root)
+        self.assertEqual((stats.unchanged, stats.failed), (4, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
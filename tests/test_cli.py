@@ -0,0 +1,67 @@
+"""Tests for the libxrk command line tools."""
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+import pyarrow.dataset as ds
+from libxrk import cli, files
+
+TEST_DATA_DIR = Path(__file__).parent / "test_data"
+SFJ_XRK_FILE = TEST_DATA_DIR / "SFJ" / "CMD_SFJ_Fuji GP Sh_Generic testing_a_0033.xrk"
+
+
+class TestConvert(unittest.TestCase):
+    """Tests for libxrk convert."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.src = os.path.join(self.tmp.name, "src")
+        self.dest = os.path.join(self.tmp.name, "dest")
+        os.makedirs(os.path.join(self.src, "day1"))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _convert(self):
+        out = io.StringIO()
+        failed = cli.convert(self.src, self.dest, jobs=2, out=out)
+        return failed, out.getvalue()
+
+    def test_find_sources(self):
+        """XRK files are found recursively, relative to the source."""
+        for name in ("day1/b.xrk", "day1/notes.txt", "A.XRK"):
+            open(os.path.join(self.src, name), "wb").close()
+        self.assertEqual(files.find_sources(self.src), ["A.XRK", os.path.join("day1", "b.xrk")])
+
+    def test_bad_file(self):
+        """A file that doesn't decode is reported and retried next time."""
+        with open(os.path.join(self.src, "day1", "bad.xrk"), "wb") as f:
+            f.write(b"not an xrk file")
+        failed, out = self._convert()
+        self.assertEqual(failed, 1)
+        self.assertIn("FAILED", out)
+        failed, out = self._convert()
+        self.assertEqual(failed, 1)
+        self.assertEqual(cli.main(["convert", self.src, self.dest, "-j", "1"]), 1)
+
+    def test_convert(self):
+        """Files convert to a hive dataset once, then are up to date."""
+        shutil.copy(SFJ_XRK_FILE, os.path.join(self.src, "day1"))
+        failed, out = self._convert()
+        self.assertEqual(failed, 0)
+        self.assertIn("converted 1 files", out)
+
+        laps = ds.dataset(os.path.join(self.dest, "laps"), partitioning="hive").to_table()
+        self.assertEqual(laps.num_rows, 13)
+        self.assertEqual(set(laps.column("venue").to_pylist()), {"Fuji GP Sh"})
+        self.assertEqual(set(laps.column("date").to_pylist()), {"2025-11-04"})
+
+        failed, out = self._convert()
+        self.assertIn("0 files to convert, 1 up to date", out)
+
+
+if __name__ == "__main__":
+    unittest.main()
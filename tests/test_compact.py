@@ -0,0 +1,93 @@
+"""Tests for compact decoding: values kept as stored, widened on use."""
+
+import os
+import struct
+import tempfile
+import unittest
+import numpy as np
+import pyarrow as pa
+from libxrk import aim_xrk
+from libxrk.base import channel_values, expand_channel, resample_channel
+from .synthetic import xrk_channel, xrk_config, xrk_sample, xrk_session
+
+
+def _stream():
+    # float16 channels (decoders 1 and 20), one of them in volts (mV)
+    records = [
+        xrk_config(
+            xrk_channel(0, "Oil Temp", 2, 20, units=6),
+            xrk_channel(1, "Sensor V", 2, 1, units=21),
+            xrk_channel(2, "Battery", 2, 4, units=21),
+        )
+    ]
+    for i in range(200):
+        tc = 1000 + 10 * i
+        records.append(xrk_sample(0, tc, np.float16(80 + i / 7).tobytes()))
+        records.append(xrk_sample(1, tc, np.float16(4000 + i).tobytes()))
+        records.append(xrk_sample(2, tc, struct.pack("<h", 12000 + 3 * i)))
+    return b"".join(records)
+
+
+class TestCompact(unittest.TestCase):
+    """Tests for aim_xrk(..., compact=True)."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "compact.xrk")
+        with open(self.path, "wb") as f:
+            f.write(_stream())
+        self.log = aim_xrk(self.path)
+        self.compact = aim_xrk(self.path, compact=True)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_stored_types(self):
+        """Values keep the file's types, with a scale for millivolts."""
+        types = {name: t.schema.field(1).type for name, t in self.compact.channels.items()}
+        self.assertEqual(
+            types, {"Oil Temp": pa.float16(), "Sensor V": pa.float16(), "Battery": pa.int16()}
+        )
+        metadata = self.compact.channels["Battery"].schema.field(1).metadata
+        self.assertEqual(metadata[b"scale"], b"0.001")
+        self.assertEqual(metadata[b"units"], b"V")
+        self.assertNotIn(b"scale", self.log.channels["Battery"].schema.field(1).metadata)
+        self.assertLess(
+            sum(t.nbytes for t in self.compact.channels.values()),
+            sum(t.nbytes for t in self.log.channels.values()),
+        )
+
+    def test_values(self):
+        """channel_values() and expand_channel() give the values decoded without compact."""
+        for name, table in self.log.channels.items():
+            compact = self.compact.channels[name]
+            np.testing.assert_array_equal(channel_values(compact), channel_values(table))
+            self.assertEqual(channel_values(compact).dtype, channel_values(table).dtype)
+            self.assertTrue(expand_channel(compact).equals(table), name)
+            self.assertIs(expand_channel(table), table)
+
+    def test_log_file(self):
+        """LogFile's methods see the widened values."""
+        self.assertTrue(
+            self.compact.get_channels_as_table().equals(self.log.get_channels_as_table())
+        )
+        self.assertTrue(self.compact.lap_stats().equals(self.log.lap_stats()))
+        t = np.linspace(0, 3000, 500)
+        for name in self.log.channels:
+            np.testing.assert_array_equal(
+                resample_channel(self.compact.channels[name], t),
+                resample_channel(self.log.channels[name], t),
+            )
+
+    def test_session(self):
+        """A whole session decodes the same, compact or not."""
+        path = os.path.join(self.tmp.name, "session.xrk")
+        with open(path, "wb") as f:
+            f.write(b"".join(xrk_session()))
+        log, compact = aim_xrk(path), aim_xrk(path, compact=True)
+        self.assertEqual(compact.channels["Battery"].schema.field(1).type, pa.int16())
+        self.assertTrue(compact.get_channels_as_table().equals(log.get_channels_as_table()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+"""Unit tests for min/max decimation pyramids."""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+import pyarrow as pa
+from libxrk import aim_xrk
+from libxrk.base import LogFile, expand_channel
+from libxrk.decimate import Decimator, Pyramid
+from .synthetic import channel_table, xrk_session
+
+
+class TestDecimation(unittest.TestCase):
+    """Tests for Pyramid and Decimator queries."""
+
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.timecodes = np.arange(0, 1_000_003 * 5, 5)
+        self.values = np.cumsum(rng.normal(size=len(self.timecodes))).astype(np.float32)
+        self.log = LogFile(
+            channels={"RPM": channel_table("RPM", self.timecodes, self.values, units="rpm")},
+            laps=pa.table({"num": [], "start_time": [], "end_time": []}),
+            metadata={},
+            file_name="test.xrk",
+        )
+
+    def test_levels(self):
+        """Each level halves the number of buckets and keeps the true extremes."""
+        pyramid = Pyramid.build(self.timecodes[:1000], self.values[:1000])
+        self.assertEqual(len(pyramid.min_idx[0]), 500)
+        self.assertEqual(len(pyramid.min_idx[1]), 250)
+        self.assertEqual(len(pyramid.min_idx[-1]), 1)
+        self.assertEqual(self.values[pyramid.min_idx[-1][0]], self.values[:1000].min())
+        self.assertEqual(self.values[pyramid.max_idx[-1][0]], self.values[:1000].max())
+        np.testing.assert_array_equal(
+            self.values[pyramid.max_idx[2]], self.values[:1000].reshape(-1, 8).max(axis=1)
+        )
+
+    def test_query_bounds_points_and_keeps_envelope(self):
+        """Queries return at most 2 x width points covering the true min and max."""
+        dec = Decimator(self.log)
+        t0, t1 = 123_456, 4_000_000
+        result = dec.query("RPM", t0, t1, 800)
+
+        self.assertLessEqual(len(result), 2 * 800)
+        self.assertGreater(len(result), 800)
+        self.assertEqual(result.schema, self.log.channels["RPM"].schema)
+        tc = result.column("timecodes").to_numpy()
+        self.assertTrue(np.all(np.diff(tc) > 0))
+
+        raw = self.values[(self.timecodes >= t0) & (self.timecodes <= t1)]
+        values = result.column("RPM").to_numpy()
+        self.assertEqual(values.min(), raw.min())
+        self.assertEqual(values.max(), raw.max())
+
+    def test_query_off_bucket_boundaries(self):
+        """Ranges not on bucket boundaries only get samples inside them."""
+        pyramid = Pyramid.build(self.timecodes[:1000] // 5, self.values[:1000])
+        idx = pyramid.query_indices(10, 990, 20)
+        self.assertGreaterEqual(idx[0], 10)
+        self.assertLessEqual(idx[-1], 990)
+        rng = np.random.default_rng(7)
+        for _ in range(50):
+            t0, t1 = np.sort(rng.integers(0, 1000, 2))
+            idx = pyramid.query_indices(t0, t1, int(rng.integers(2, 40)))
+            self.assertTrue(np.all((idx >= t0) & (idx <= t1)), (t0, t1))
+            raw = self.values[t0 : t1 + 1]
+            self.assertEqual(self.values[idx].min(), raw.min())
+            self.assertEqual(self.values[idx].max(), raw.max())
+
+    def test_query_small_range_is_raw(self):
+        """Zoomed in far enough the raw samples are returned."""
+        result = Decimator(self.log).query("RPM", 1000, 1100, 800)
+        self.assertEqual(result.column("timecodes").to_pylist(), list(range(1000, 1101, 5)))
+
+    def test_compact(self):
+        """Channels decoded compact are queried with their widened values."""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "session.xrk")
+            with open(path, "wb") as f:
+                f.write(b"".join(xrk_session()))
+            log = aim_xrk(path, compact=True)
+        dec = Decimator(log)
+        for name, table in log.channels.items():
+            tc = table.column("timecodes").to_numpy()
+            result = dec.query(name, tc[0], tc[-1], len(tc))
+            self.assertTrue(result.equals(expand_channel(table)), name)
+            self.assertNotIn(b"scale", result.schema.field(name).metadata)
+
+    def test_disk_cache(self):
+        """Pyramids are saved to and reloaded from the cache directory."""
+        with tempfile.TemporaryDirectory() as cache_dir:
+            first = Decimator(self.log, cache_dir=cache_dir).query("RPM", 0, 5_000_000, 500)
+            second_dec = Decimator(self.log, cache_dir=cache_dir)
+            second = second_dec.query("RPM", 0, 5_000_000, 500)
+            self.assertTrue(first.equals(second))
+            self.assertEqual(
+                second_dec.pyramids["RPM"].levels, Pyramid.build(self.timecodes, self.values).levels
+            )
+
+    def test_interrupted_save(self):
+        """A save that fails part way leaves neither a partial cache file nor its temp file."""
+        pyramid = Pyramid.build(self.timecodes[:1000], self.values[:1000])
+        with tempfile.TemporaryDirectory() as cache_dir:
+            path = os.path.join(cache_dir, "rpm.npz")
+            with mock.patch.object(np, "savez", side_effect=OSError("disk full")):
+                with self.assertRaises(OSError):
+                    pyramid.save(path)
+            self.assertEqual(os.listdir(cache_dir), [])
+            pyramid.save(path)
+            self.assertEqual(os.listdir(cache_dir), ["rpm.npz"])
+            self.assertEqual(Pyramid.load(path).levels, pyramid.levels)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+"""Tests for the decoder registry and its vectorised fixups."""
+
+import os
+import struct
+import tempfile
+import unittest
+from array import array
+import numpy as np
+from libxrk import aim_xrk, decoders
+from .synthetic import xrk_channel, xrk_config, xrk_sample
+
+
+def _stream(type_code, name="Custom"):
+    records = [xrk_config(xrk_channel(0, name, 2, type_code))]
+    for i in range(50):
+        records.append(xrk_sample(0, 1000 + 10 * i, struct.pack("<h", 3 * i - 20)))
+    return b"".join(records)
+
+
+class TestFixups(unittest.TestCase):
+    """The fixups match the per sample conversions they replace."""
+
+    def test_calculated_gear(self):
+        raw = np.array([0, 1 << 16, 3 << 16 | 0x1234, 0x80000 | 2 << 16, 7 << 16, 15 << 16])
+        expected = array(
+            "I", [0 if int(x) & 0x80000 else (int(x) >> 16) & 7 for x in raw.astype(np.uint64)]
+        )
+        result = decoders.calculated_gear(raw.astype(np.uint64))
+        self.assertEqual(result.dtype, np.uint32)
+        self.assertEqual(result.tolist(), expected.tolist())
+
+    def test_gear_char(self):
+        raw = np.array([ord(c) for c in "N123456"] + [9], dtype=np.uint16)
+        self.assertEqual(decoders.gear_char(raw).tolist(), [0, 1, 2, 3, 4, 5, 6, 9])
+
+    def test_half_float(self):
+        values = np.array([0.5, -2.25, 65504], dtype=np.float16)
+        result = decoders.half_float(values.view(np.uint16))
+        self.assertEqual(result.dtype, np.float32)
+        self.assertEqual(result.tolist(), [0.5, -2.25, 65504])
+
+
+class TestRegistry(unittest.TestCase):
+    """Tests for registering decoders."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "custom.xrk")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+        for key in (99, "Custom"):
+            try:
+                decoders.unregister(key)
+            except KeyError:
+                pass
+
+    def _decode(self, stream):
+        with open(self.path, "wb") as f:
+            f.write(stream)
+        return aim_xrk(self.path)
+
+    def test_lookup(self):
+        """Channels are looked up by name, then by type code."""
+        gear = decoders.lookup("Calculated_Gear", 4)
+        assert gear is not None
+        self.assertIs(gear.fixup, decoders.calculated_gear)
+        rpm = decoders.lookup("RPM", 4)
+        assert rpm is not None
+        self.assertEqual(rpm.stype, "h")
+        self.assertIsNone(decoders.lookup("RPM", 99))
+
+    def test_register_type_code(self):
+        """A channel of an unknown type is decoded once it has a decoder."""
+        self.assertNotIn("Custom", self._decode(_stream(99)).channels)
+        decoders.register(99, decoders.Decoder("h", interpolate=True, fixup=lambda a: a / 10))
+        table = self._decode(_stream(99)).channels["Custom"]
+        self.assertEqual(table.column(1).to_pylist()[:3], [-2.0, -1.7, -1.4])
+        self.assertEqual(table.schema.field(1).metadata[b"interpolate"], b"True")
+
+    def test_register_name(self):
+        """A decoder for a name takes precedence over the type code."""
+        decoders.register("Custom", decoders.Decoder("H"))
+        table = self._decode(_stream(4)).channels["Custom"]
+        self.assertEqual(table.column(1).to_pylist()[0], 65516)
+
+    def test_register_twice(self):
+        decoders.register(99, decoders.Decoder("h"))
+        with self.assertRaises(ValueError):
+            decoders.register(99, decoders.Decoder("H"))
+        decoders.register(99, decoders.Decoder("H"), replace=True)
+        decoder = decoders.lookup("", 99)
+        assert decoder is not None
+        self.assertEqual(decoder.stype, "H")
+        with self.assertRaises(ValueError):
+            decoders.register(4, decoders.Decoder("H"))
+        with self.assertRaises(TypeError):
+            decoders.register(256, decoders.Decoder("H"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+"""Unit tests for the segment grid index and lap delta times."""
+
+import unittest
+import numpy as np
+from libxrk.delta import best_lap, lap_deltas
+from libxrk.spatial import SegmentGrid
+from .synthetic import circuit_log
+
+
+class TestSegmentGrid(unittest.TestCase):
+    """Tests for SegmentGrid nearest segment projection."""
+
+    def test_matches_brute_force(self):
+        """Indexed projection matches an exhaustive search."""
+        rng = np.random.default_rng(1)
+        points = np.cumsum(rng.normal(size=(500, 3)), axis=0)
+        query = points[rng.integers(0, len(points), 200)] + rng.normal(scale=0.5, size=(200, 3))
+        grid = SegmentGrid(points, cell_size=2.0)
+        seg, t, dist = grid.nearest(query, 2.0)
+
+        O = points[:-1][np.newaxis]
+        D = (points[1:] - points[:-1])[np.newaxis]
+        rel = query[:, np.newaxis] - O
+        bt = np.clip(np.sum(rel * D, axis=2) / np.sum(D * D, axis=2), 0, 1)
+        bdist = np.sqrt(np.sum(np.square(rel - bt[:, :, np.newaxis] * D), axis=2))
+        best = np.argmin(bdist, axis=1)
+        bmin = bdist[np.arange(len(query)), best]
+
+        within = bmin <= 2.0
+        np.testing.assert_allclose(dist[within], bmin[within])
+        self.assertTrue(np.all(seg[~within] == -1))
+        self.assertTrue(np.all(np.isinf(dist[~within])))
+
+    def test_2d(self):
+        """Works for planar points too."""
+        grid = SegmentGrid(np.array([[0.0, 0.0], [10.0, 0.0], [10.0, 10.0]]), cell_size=1.0)
+        seg, t, dist = grid.nearest(np.array([[5.0, 0.5], [10.5, 7.0], [50.0, 50.0]]), 1.0)
+        self.assertEqual(seg.tolist(), [0, 1, -1])
+        np.testing.assert_allclose(t[:2], [0.5, 0.7])
+        np.testing.assert_allclose(dist[:2], [0.5, 0.5])
+
+
+class TestLapDeltas(unittest.TestCase):
+    """Tests for lap_deltas against a reference lap."""
+
+    def setUp(self):
+        # out lap, two flying laps (the second is 10% slower), in lap
+        self.log = circuit_log([40000, 30000, 33000, 45000])
+
+    def test_best_lap(self):
+        """Out and in laps are not considered for the best lap."""
+        self.assertEqual(best_lap(self.log), 1)
+
+    def test_position_mode(self):
+        """Delta grows linearly for a uniformly slower lap."""
+        result = lap_deltas(self.log, laps=[1, 2])
+        nums = result.column("num").to_numpy()
+        delta = result.column("delta").to_numpy()
+        lap_time = result.column("lap_time").to_numpy()
+
+        self.assertEqual(result.column_names, ["num", "timecodes", "distance", "lap_time", "delta"])
+        self.assertEqual(result.column("delta").null_count, 0)
+        np.testing.assert_allclose(delta[nums == 1], 0, atol=1.0)
+        lap2 = nums == 2
+        np.testing.assert_allclose(delta[lap2], lap_time[lap2] * (3000 / 33000), atol=20.0)
+
+    def test_distance_mode(self):
+        """Distance mode agrees with position mode on a uniform lap."""
+        result = lap_deltas(self.log, reference_lap=1, laps=[2], mode="distance", step=5.0)
+        self.assertEqual(set(result.column("num").to_pylist()), {2})
+        delta = result.column("delta").to_numpy(zero_copy_only=False)
+        lap_time = result.column("lap_time").to_numpy()
+        valid = ~np.isnan(delta)
+        np.testing.assert_allclose(delta[valid], lap_time[valid] * (3000 / 33000), atol=20.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
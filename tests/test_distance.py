@@ -0,0 +1,91 @@
+"""Unit tests for the distance channel and distance-domain resampling."""
+
+import unittest
+import numpy as np
+import pyarrow as pa
+from libxrk import gps
+from libxrk.base import LogFile
+from libxrk.distance import distance_channel, resample_by_distance, session_distance
+from .synthetic import channel_table
+
+
+def _straight_line_log(speed=10.0):
+    """Vehicle driving due east at constant speed, two laps of 4s and 6s."""
+    timecodes = np.arange(0, 10001, 100)
+    lat0, lon0 = 35.37, 138.93
+    origin = np.array(gps.lla2ecef(lat0, lon0, 0.0))
+    east = np.array([-np.sin(np.radians(lon0)), np.cos(np.radians(lon0)), 0.0])
+    XYZ = origin + np.outer(timecodes / 1000 * speed, east)
+    lla = gps.ecef2lla(XYZ[:, 0], XYZ[:, 1], XYZ[:, 2])
+    return LogFile(
+        channels={
+            "GPS Speed": channel_table("GPS Speed", timecodes, np.full(len(timecodes), speed)),
+            "GPS Latitude": channel_table("GPS Latitude", timecodes, lla.lat),
+            "GPS Longitude": channel_table("GPS Longitude", timecodes, lla.long),
+            "RPM": channel_table("RPM", timecodes, timecodes.astype(np.float64)),
+            "Gear": channel_table("Gear", [0, 5000], np.array([2, 3], dtype=np.uint32), False),
+        },
+        laps=pa.table(
+            {
+                "num": pa.array([0, 1], type=pa.int32()),
+                "start_time": pa.array([0, 4000], type=pa.int64()),
+                "end_time": pa.array([4000, 10000], type=pa.int64()),
+            }
+        ),
+        metadata={},
+        file_name="test.xrk",
+    )
+
+
+class TestDistance(unittest.TestCase):
+    """Tests for distance computation and resampling."""
+
+    def test_session_distance_methods_agree(self):
+        """Integrated speed and summed displacement give the same distance."""
+        log = _straight_line_log()
+        _, by_speed = session_distance(log, "speed")
+        _, by_position = session_distance(log, "position")
+        self.assertAlmostEqual(by_speed[-1], 100.0)
+        np.testing.assert_allclose(by_position, by_speed, atol=0.01)
+
+    def test_distance_channel_resets_per_lap(self):
+        """Distance restarts from zero at every lap start."""
+        log = _straight_line_log()
+        table = distance_channel(log)
+
+        self.assertEqual(table.column_names, ["timecodes", "Distance"])
+        self.assertEqual(table.schema.field("Distance").metadata[b"units"], b"m")
+        timecodes = table.column("timecodes").to_numpy()
+        dist = table.column("Distance").to_numpy()
+        self.assertAlmostEqual(dist[timecodes == 3900][0], 39.0)
+        self.assertAlmostEqual(dist[timecodes == 4000][0], 0.0)
+        self.assertAlmostEqual(dist[timecodes == 6000][0], 20.0)
+
+    def test_resample_by_distance(self):
+        """All laps are resampled onto a uniform grid in one call."""
+        log = _straight_line_log()
+        result = resample_by_distance(log, ["RPM", "Gear"], step=5.0)
+
+        self.assertEqual(result.column_names, ["num", "distance", "lap_time", "RPM", "Gear"])
+        nums = result.column("num").to_numpy()
+        self.assertEqual(np.sum(nums == 0), 9)  # 0..40m
+        self.assertEqual(np.sum(nums == 1), 13)  # 0..60m
+
+        lap1 = nums == 1
+        np.testing.assert_allclose(result.column("distance").to_numpy()[lap1][:3], [0, 5, 10])
+        np.testing.assert_allclose(result.column("lap_time").to_numpy()[lap1][:3], [0, 500, 1000])
+        # RPM is interpolated, Gear holds the previous value
+        np.testing.assert_allclose(result.column("RPM").to_numpy()[lap1][:3], [4000, 4500, 5000])
+        self.assertEqual(result.column("Gear").to_pylist()[9:12], [2, 2, 3])
+        self.assertEqual(result.schema.field("RPM").metadata[b"interpolate"], b"True")
+
+    def test_resample_selected_laps(self):
+        """Only requested laps are included."""
+        log = _straight_line_log()
+        result = resample_by_distance(log, ["RPM"], step=10.0, laps=[1])
+        self.assertEqual(set(result.column("num").to_pylist()), {1})
+        self.assertEqual(len(result), 7)
+
+
+if __name__ == "__main__":
+    unittest.main()
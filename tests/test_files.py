@@ -0,0 +1,141 @@
+"""Unit tests for writing logs to Parquet / Arrow IPC and the conversion manifest."""
+
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+import pyarrow as pa
+import pyarrow.parquet as pq
+from libxrk import files
+from .synthetic import circuit_log
+
+
+class TestWriteLog(unittest.TestCase):
+    """Tests for the hive partitioned output layout."""
+
+    def setUp(self):
+        self.log = circuit_log([40000, 30000])
+        self.log.metadata.update(
+            {"Venue": "Fuji GP Sh", "Log Date": "11/04/2025", "Session": "Generic testing"}
+        )
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_partition(self):
+        """Venue, ISO date and session, with path characters escaped."""
+        self.assertEqual(
+            files.partition_path(self.log),
+            os.path.join("venue=Fuji GP Sh", "date=2025-11-04", "session=Generic testing"),
+        )
+        self.log.metadata.update({"Venue": "A/B=C", "Log Date": "garbage"})
+        del self.log.metadata["Session"]
+        part = files.partition(self.log)
+        self.assertEqual(part["venue"], "A%2FB%3DC")
+        self.assertEqual(part["date"], files.HIVE_DEFAULT_PARTITION)
+        self.assertEqual(part["session"], files.HIVE_DEFAULT_PARTITION)
+
+    def test_write_parquet(self):
+        """Channels and laps land in their own trees with the log's metadata."""
+        outputs = files.write_log(self.log, self.root, "a_0001")
+        part = files.partition_path(self.log)
+        self.assertEqual(
+            outputs,
+            [
+                os.path.join("channels", part, "a_0001.parquet"),
+                os.path.join("laps", part, "a_0001.parquet"),
+            ],
+        )
+        channels = pq.read_table(os.path.join(self.root, outputs[0]))
+        self.assertEqual(channels.num_rows, self.log.get_channels_as_table().num_rows)
+        self.assertEqual(channels.schema.field("GPS Speed").metadata[b"units"], b"m/s")
+        meta = json.loads(channels.schema.metadata[b"libxrk.metadata"])
+        self.assertEqual(meta["Venue"], "Fuji GP Sh")
+        laps = pq.read_table(os.path.join(self.root, outputs[1]))
+        self.assertEqual(laps.column("end_time").to_pylist(), [40000, 70000])
+        self.assertEqual(
+            os.listdir(os.path.dirname(os.path.join(self.root, outputs[0]))), ["a_0001.parquet"]
+        )
+
+    def test_write_arrow(self):
+        """Arrow IPC files read back as the same table."""
+        outputs = files.write_log(self.log, self.root, "a_0001", format="arrow")
+        self.assertTrue(outputs[0].endswith(".arrow"))
+        with pa.memory_map(os.path.join(self.root, outputs[1])) as source:
+            laps = pa.ipc.open_file(source).read_all()
+        self.assertTrue(laps.equals(self.log.laps))
+        with self.assertRaises(ValueError):
+            files.write_log(self.log, self.root, "a_0001", format="csv")
+
+
+class TestManifest(unittest.TestCase):
+    """Tests for skipping files whose outputs are up to date."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+        self.source = os.path.join(self.root, "a.xrk")
+        with open(self.source, "wb") as f:
+            f.write(b"x" * 100)
+        self.output = "out.parquet"
+        with open(os.path.join(self.root, self.output), "wb") as f:
+            f.write(b"")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _touch(self, data=None):
+        if data is not None:
+            with open(self.source, "wb") as f:
+                f.write(data)
+        st = os.stat(self.source)
+        os.utime(self.source, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+    def test_up_to_date(self):
+        """Size and mtime decide, and the manifest survives a reload."""
+        manifest = files.Manifest.load(self.root)
+        self.assertFalse(manifest.up_to_date("a.xrk", self.source, "parquet"))
+        manifest.record("a.xrk", self.source, "parquet", [self.output])
+        manifest.save()
+        manifest = files.Manifest.load(self.root)
+        self.assertTrue(manifest.up_to_date("a.xrk", self.source, "parquet"))
+        self.assertFalse(manifest.up_to_date("a.xrk", self.source, "arrow"))
+        self._touch()
+        self.assertFalse(manifest.up_to_date("a.xrk", self.source, "parquet"))
+
+    def test_hash(self):
+        """With hashes, a new mtime with the same contents is up to date."""
+        manifest = files.Manifest(self.root)
+        manifest.record(
+            "a.xrk", self.source, "parquet", [self.output], files.file_digest(self.source)
+        )
+        self._touch()
+        self.assertFalse(manifest.up_to_date("a.xrk", self.source, "parquet"))
+        self.assertTrue(manifest.up_to_date("a.xrk", self.source, "parquet", use_hash=True))
+        # the new mtime is remembered, so the file isn't hashed again
+        manifest.save()
+        manifest = files.Manifest.load(self.root)
+        with mock.patch.object(files, "file_digest") as digest:
+            self.assertTrue(manifest.up_to_date("a.xrk", self.source, "parquet", use_hash=True))
+        digest.assert_not_called()
+        self._touch(b"y" * 100)
+        self.assertFalse(manifest.up_to_date("a.xrk", self.source, "parquet", use_hash=True))
+
+    def test_missing_output(self):
+        """Deleted outputs are rebuilt, and outputs that moved are removed."""
+        manifest = files.Manifest(self.root)
+        manifest.record("a.xrk", self.source, "parquet", [self.output])
+        with open(os.path.join(self.root, "new.parquet"), "wb") as f:
+            f.write(b"")
+        manifest.record("a.xrk", self.source, "parquet", ["new.parquet"])
+        self.assertFalse(os.path.exists(os.path.join(self.root, self.output)))
+        self.assertTrue(manifest.up_to_date("a.xrk", self.source, "parquet"))
+        os.remove(os.path.join(self.root, "new.parquet"))
+        self.assertFalse(manifest.up_to_date("a.xrk", self.source, "parquet"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,257 @@
+"""Tests for the Arrow Flight session server."""
+
+import functools
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+import pyarrow as pa
+
+try:
+    import pyarrow.flight as pa_flight
+except ImportError:  # pyarrow built without Flight
+    pa_flight = None
+
+from libxrk import aim_xrk
+from libxrk.base import LogFile
+from .synthetic import channel_table, xrk_session
+
+if pa_flight is not None:
+    from libxrk.flight import Query, SessionCache, SessionServer, _time_slice
+
+
+def _ticket(**query):
+    return pa_flight.Ticket(json.dumps(query).encode("utf-8"))
+
+
+@unittest.skipIf(pa_flight is None, "pyarrow has no Flight support")
+class TestSessionCache(unittest.TestCase):
+    """Tests for SessionCache."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.paths = []
+        for name in "abc":
+            path = os.path.join(self.tmp.name, name + ".xrk")
+            with open(path, "wb") as f:
+                f.write(name.encode("ascii"))
+            self.paths.append(path)
+        self.loads = []
+        self.cache = SessionCache(2, self._loader)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _loader(self, path):
+        self.loads.append(os.path.basename(path))
+        return os.path.basename(path)
+
+    def test_lru(self):
+        """The least recently used file is dropped."""
+        a, b, c = self.paths
+        for path in (a, b, a, c, a, b):
+            self.cache.get(path)
+        self.assertEqual(self.loads, ["a.xrk", "b.xrk", "c.xrk", "b.xrk"])
+        self.assertEqual(len(self.cache), 2)
+
+    def test_changed_file(self):
+        """A file is decoded again once it changes."""
+        a = self.paths[0]
+        self.cache.get(a)
+        with open(a, "ab") as f:
+            f.write(b"more")
+        self.cache.get(a)
+        self.assertEqual(self.loads, ["a.xrk", "a.xrk"])
+
+    def test_concurrent(self):
+        """Threads asking for the same file share one decode."""
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow(path):
+            started.set()
+            release.wait(10)
+            return self._loader(path)
+
+        cache = SessionCache(2, slow)
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(cache.get(self.paths[0])))
+            for _ in range(3)
+        ]
+        for t in threads:
+            t.start()
+        started.wait(10)
+        release.set()
+        for t in threads:
+            t.join(10)
+        self.assertEqual(results, ["a.xrk"] * 3)
+        self.assertEqual(self.loads, ["a.xrk"])
+
+    def test_failure_not_cached(self):
+        """A file that fails to decode is tried again next time."""
+
+        def fail(path):
+            self.loads.append(path)
+            raise ValueError("bad file")
+
+        cache = SessionCache(2, fail)
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                cache.get(self.paths[0])
+        self.assertEqual(len(self.loads), 2)
+        self.assertEqual(len(cache), 0)
+
+
+@unittest.skipIf(pa_flight is None, "pyarrow has no Flight support")
+class TestQuery(unittest.TestCase):
+    """Tests for Query.select on a log."""
+
+    def test_sparse_channels(self):
+        """Channels without samples in the range are filled as in the whole merge."""
+        rpm = np.arange(0, 2000, 100)
+        log = LogFile(
+            {
+                "Gear": channel_table("Gear", [0, 1000], np.array([2, 3]), interpolate=False),
+                "RPM": channel_table("RPM", rpm, rpm * 5.0),
+                "Temp": channel_table("Temp", [0, 1900], [50.0, 70.0]),
+            },
+            pa.table({"num": [], "start_time": [], "end_time": []}),
+            {},
+            "test.xrk",
+        )
+        merged = log.get_channels_as_table()
+        for start, end in ((500, 800), (450, 1050), (None, 300), (1950, None)):
+            table = Query("test.xrk", start=start, end=end).select(log)
+            self.assertTrue(table.equals(_time_slice(merged, start, end)), (start, end))
+        table = Query("test.xrk", start=500, end=800).select(log)
+        self.assertEqual(table.column("Gear").to_pylist(), [2, 2, 2])
+
+
+@unittest.skipIf(pa_flight is None, "pyarrow has no Flight support")
+class TestSessionServer(unittest.TestCase):
+    """Tests for SessionServer, through a Flight client."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        os.makedirs(os.path.join(self.tmp.name, "2025"))
+        self.path = os.path.join(self.tmp.name, "2025", "session.xrk")
+        with open(self.path, "wb") as f:
+            f.write(b"".join(xrk_session((10000, 9000, 9500))))
+        self.log = aim_xrk(self.path)
+        self.server = SessionServer(self.tmp.name, cache_size=1)
+        self.client = pa_flight.connect("grpc://127.0.0.1:%d" % self.server.port)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.tmp.cleanup()
+
+    def _get(self, **query):
+        query.setdefault("path", "2025/session.xrk")
+        return self.client.do_get(_ticket(**query)).read_all()
+
+    def test_list_flights(self):
+        """Every XRK file under the root is listed."""
+        flights = list(self.client.list_flights())
+        self.assertEqual(len(flights), 1)
+        query = Query.parse(flights[0].endpoints[0].ticket.ticket)
+        self.assertEqual(query.path, "2025/session.xrk")
+
+    def test_merged(self):
+        """The merged table, projected to channels, in the order asked for."""
+        table = self._get(channels=["RPM", "Speed"])
+        self.assertEqual(table.column_names, ["timecodes", "RPM", "Speed"])
+        self.assertEqual(table.schema.field("RPM").metadata[b"units"], b"rpm")
+        self.assertEqual(table.num_rows, self.log.channels["RPM"].num_rows)
+        self.assertEqual(len(self._get().column_names), len(self.log.channels) + 1)
+
+    def test_channel(self):
+        """A channel's own table, for a time range."""
+        table = self._get(table="channel", channels=["Steer"], start=1000, end=2000)
+        expected = self.log.channels["Steer"]
+        tc = expected.column("timecodes").to_numpy()
+        self.assertTrue(table.equals(expected.filter((tc >= 1000) & (tc < 2000))))
+
+    def test_lap(self):
+        """A lap, optionally narrowed by a time range."""
+        table = self._get(table="channel", channels=["RPM"], lap=1)
+        tc = table.column("timecodes").to_numpy()
+        self.assertEqual((tc[0], tc[-1]), (10000, 18900))
+        table = self._get(table="channel", channels=["RPM"], lap=1, start=15000)
+        self.assertEqual(table.column("timecodes").to_numpy()[0], 15000)
+        laps = self._get(table="laps", lap=2)
+        self.assertEqual(laps.to_pydict(), {"num": [2], "start_time": [19000], "end_time": [28500]})
+
+    def test_merged_lap(self):
+        """A lap of the merged table merges only that lap's samples."""
+        table = self._get(channels=["Steer", "RPM"], lap=1)
+        tc = table.column("timecodes").to_numpy()
+        self.assertEqual((tc[0], tc[-1]), (10000, 18980))
+        rpm = self.log.channels["RPM"].column("RPM").to_numpy()
+        np.testing.assert_array_equal(np.unique(table.column("RPM").to_numpy()), rpm[100:190])
+        self.assertEqual(table.num_rows, len(np.unique(tc)))
+
+    def test_flight_info(self):
+        """get_flight_info describes a query's result and how to get it."""
+        descriptor = pa_flight.FlightDescriptor.for_command(
+            json.dumps({"path": "2025/session.xrk", "channels": ["Speed"], "lap": 0})
+        )
+        info = self.client.get_flight_info(descriptor)
+        table = self.client.do_get(info.endpoints[0].ticket).read_all()
+        self.assertEqual(info.schema, table.schema)
+        self.assertEqual(info.total_records, table.num_rows)
+        np.testing.assert_array_equal(
+            table.column("Speed").to_numpy(),
+            self.log.channels["Speed"].column("Speed").to_numpy()[:100],
+        )
+        path = pa_flight.FlightDescriptor.for_path("2025", "session.xrk")
+        self.assertEqual(self.client.get_schema(path).schema.names[0], "timecodes")
+
+    def test_actions(self):
+        """The metadata and clear actions."""
+        results = list(self.client.do_action(("metadata", b'{"path": "2025/session.xrk"}')))
+        self.assertEqual(json.loads(results[0].body.to_pybytes()), self.log.metadata)
+        list(self.client.do_action(("clear", b"")))
+        self.assertEqual(len(self.server.cache), 0)
+
+    def test_compact(self):
+        """Files cached compact are served with their widened values."""
+        server = SessionServer(self.tmp.name, loader=functools.partial(aim_xrk, compact=True))
+        client = pa_flight.connect("grpc://127.0.0.1:%d" % server.port)
+        try:
+            for name in ("Battery", "RPM"):
+                query = _ticket(path="2025/session.xrk", table="channel", channels=[name])
+                table = client.do_get(query).read_all()
+                self.assertTrue(table.equals(self.log.channels[name]), name)
+        finally:
+            client.close()
+            server.shutdown()
+
+    def test_errors(self):
+        """Bad queries are reported to the client."""
+        with self.assertRaises(pa.ArrowInvalid):
+            self._get(table="channel", channels=["RPM", "Speed"])
+        with self.assertRaises(pa.ArrowInvalid):
+            self._get(colour="red")
+        with self.assertRaises(pa.ArrowInvalid):
+            self._get(path="../outside.xrk")
+        with self.assertRaises(pa.ArrowInvalid):
+            self._get(lap="3")
+        with self.assertRaises(pa.ArrowInvalid):
+            self._get(channels="RPM")
+        with self.assertRaises(pa.ArrowInvalid):
+            self._get(start=True)
+        with self.assertRaises(pa.ArrowKeyError):
+            self._get(channels=["Boost"])
+        with self.assertRaises(pa.ArrowKeyError):
+            self._get(lap=7)
+        with self.assertRaises(pa_flight.FlightServerError):
+            self._get(path="missing.xrk")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,13 @@
 """Unit tests for LogFile.get_channels_as_table() method."""
 
+import os
+import tempfile
 import unittest
+import numpy as np
 import pyarrow as pa
+from libxrk import aim_xrk
 from libxrk.base import LogFile
+from .synthetic import channel_table, xrk_session
 
 
 class TestChannelMerge(unittest.TestCase):
@@ -506,5 +511,72 @@ class TestChannelMerge(unittest.TestCase):
         self.assertEqual(channel_b_values, [100.0, 200.0])
 
 
+def _grouped_log(copy=False):
+    # two groups (shared timecodes arrays) and a channel of its own
+    def timecodes(a):
+        return a.to_numpy().copy() if copy else a
+
+    fast = pa.array(np.arange(0, 1000, 20), type=pa.int64())
+    slow = pa.array(np.arange(10, 1000, 100), type=pa.int64())
+    channels = {
+        "AccX": channel_table("AccX", timecodes(fast), np.sin(np.arange(50) / 5), True),
+        "AccY": channel_table("AccY", timecodes(fast), np.cos(np.arange(50) / 5), True),
+        "Gear": channel_table("Gear", timecodes(slow), np.arange(10) % 4, False),
+        "Water": channel_table("Water", timecodes(slow), 80 + np.arange(10) / 2, True),
+        "Lambda": channel_table(
+            "Lambda", timecodes(pa.array([5, 500, 995], type=pa.int64())), [0.9, 1.0, 1.1], True
+        ),
+    }
+    return LogFile(
+        channels, pa.table({"num": [], "start_time": [], "end_time": []}), {}, "test.xrk"
+    )
+
+
+class TestChannelGroups(unittest.TestCase):
+    """Tests for channels sharing timecodes."""
+
+    def test_channel_groups(self):
+        """Channel tables on one timecodes array are a group."""
+        self.assertEqual(
+            _grouped_log().channel_groups(), [["AccX", "AccY"], ["Gear", "Water"], ["Lambda"]]
+        )
+        # equal, but not shared
+        self.assertEqual(len(_grouped_log(copy=True).channel_groups()), 5)
+
+    def test_group_table(self):
+        """A group's channels side by side, without copies."""
+        log = _grouped_log()
+        table = log.group_table(["Water", "Gear"])
+        self.assertEqual(table.column_names, ["timecodes", "Water", "Gear"])
+        self.assertEqual(table.schema.field("Water").metadata[b"interpolate"], b"True")
+        self.assertEqual(
+            table.column("Gear").chunk(0).buffers()[1].address,
+            log.channels["Gear"].column("Gear").chunk(0).buffers()[1].address,
+        )
+        with self.assertRaises(ValueError):
+            log.group_table(["AccX", "Gear"])
+
+    def test_merge_by_group(self):
+        """Merging by group gives the same table as merging channel by channel."""
+        grouped = _grouped_log().get_channels_as_table()
+        self.assertEqual(
+            grouped.column_names, ["timecodes", "AccX", "AccY", "Gear", "Lambda", "Water"]
+        )
+        self.assertTrue(grouped.equals(_grouped_log(copy=True).get_channels_as_table()))
+
+    def test_decoded_groups(self):
+        """aim_xrk stores the timecodes of a GRP, and of the GPS channels, once."""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "session.xrk")
+            with open(path, "wb") as f:
+                f.write(b"".join(xrk_session()))
+            log = aim_xrk(path)
+        groups = sorted(sorted(g) for g in log.channel_groups() if len(g) > 1)
+        self.assertEqual(
+            groups,
+            [["AccX", "Gear"], ["GPS Altitude", "GPS Latitude", "GPS Longitude", "GPS Speed"]],
+        )
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,236 @@
+"""Unit tests for gps marker crossing and lap detection helpers."""
+
+import unittest
+from unittest import mock
+import numpy as np
+from libxrk import gps
+from .synthetic import LAT0, LON0, circuit, enu_to_ecef, enu_to_lla, sf_marker
+
+
+class TestFindCrossingIdx(unittest.TestCase):
+    """Tests for the dense and indexed paths of find_crossing_idx."""
+
+    def setUp(self):
+        # three laps of a 300m radius circle sampled every 50ms
+        timecodes, east, north, _, _ = circuit([60000, 62000, 61000], radius=300.0, period=50)
+        self.XYZ = enu_to_ecef(east, north)
+        angles = np.linspace(0, 2 * np.pi, 40, endpoint=False)
+        # markers on the track, slightly off it, and one far away
+        east_m = np.append(np.cos(angles) * (300 + 5 * np.sin(3 * angles)), 5000.0)
+        north_m = np.append(np.sin(angles) * 300, 5000.0)
+        lla = enu_to_lla(east_m, north_m)
+        self.markers = np.column_stack([lla.lat, lla.long])
+
+    def test_indexed_matches_dense(self):
+        """The indexed path returns the same (idx, distance) as broadcasting."""
+        dense = gps.find_crossing_idx(self.XYZ, self.markers, indexed=False)
+        indexed = gps.find_crossing_idx(self.XYZ, self.markers, indexed=True, radius=20.0)
+        np.testing.assert_allclose(indexed, dense, rtol=1e-9, atol=1e-6)
+        self.assertGreater(dense[-1, 1], 4000)
+
+    def test_single_marker(self):
+        """A single (lat, long) marker returns one (idx, distance) pair."""
+        marker = self.markers[5]
+        dense = gps.find_crossing_idx(self.XYZ, marker, indexed=False)
+        indexed = gps.find_crossing_idx(self.XYZ, marker, indexed=True)
+        self.assertEqual(dense.shape, (2,))
+        np.testing.assert_allclose(indexed, dense, rtol=1e-9, atol=1e-6)
+
+
+class TestFindCrossings(unittest.TestCase):
+    """Tests for finding crossings of several lines in one pass."""
+
+    def test_matches_find_laps(self):
+        """Each marker gets the same crossings as find_laps on its own."""
+        timecodes, east, north, _, _ = circuit([40000, 30000, 33000, 45000])
+        XYZ = enu_to_ecef(east, north)
+        lla = enu_to_lla(np.array([100.0, 0.0, -100.0]), np.array([0.0, 100.0, 0.0]))
+        markers = list(zip(lla.lat, lla.long))
+        crossings = gps.find_crossings(XYZ, timecodes, markers)
+        self.assertEqual(len(crossings), 3)
+        for marker, times in zip(markers, crossings):
+            np.testing.assert_allclose(times, gps.find_laps(XYZ, timecodes, marker))
+        np.testing.assert_allclose(crossings[0], [40000, 70000, 103000, 148000], atol=50)
+        self.assertEqual(gps.find_crossings(XYZ, timecodes, []), [])
+
+
+class TestLapDetector(unittest.TestCase):
+    """Tests for incremental lap detection."""
+
+    def setUp(self):
+        timecodes, east, north, _, _ = circuit([40000, 30000, 33000, 45000])
+        rng = np.random.default_rng(0)
+        self.timecodes = timecodes
+        self.XYZ = enu_to_ecef(
+            east + rng.normal(scale=0.3, size=len(east)),
+            north + rng.normal(scale=0.3, size=len(north)),
+        )
+        self.marker = sf_marker()
+        self.expected = gps.find_laps(self.XYZ, self.timecodes, self.marker)
+
+    def _feed(self, cuts):
+        detector = gps.LapDetector(self.marker)
+        found = []
+        for chunk in np.split(np.arange(len(self.timecodes)), cuts):
+            found += detector.update(self.XYZ[chunk], self.timecodes[chunk])
+        self.assertEqual(found, detector.lap_markers)
+        return found
+
+    def test_random_chunks(self):
+        """Chunked detection agrees with find_laps over the whole session."""
+        cuts = np.sort(np.random.default_rng(1).integers(0, len(self.timecodes), 40))
+        np.testing.assert_allclose(self._feed(cuts), self.expected, atol=2)
+
+    def test_single_samples(self):
+        """Feeding one sample at a time works too."""
+        cuts = np.arange(1, len(self.timecodes))
+        np.testing.assert_allclose(self._feed(cuts), self.expected, atol=2)
+
+
+class TestConversions(unittest.TestCase):
+    """Tests for the compiled conversions against the numpy versions."""
+
+    def setUp(self):
+        rng = np.random.default_rng(2)
+        self.lat = rng.uniform(-89, 89, 1000)
+        self.long = rng.uniform(-180, 180, 1000)
+        self.alt = rng.uniform(-11e3, 9e3, 1000)
+        self.XYZ = gps.lla2ecef_numpy(self.lat, self.long, self.alt)
+        self.x, self.y, self.z = self.XYZ
+
+    def test_lla2ecef(self):
+        """Matches the numpy version, with arrays, broadcasting and scalars."""
+        np.testing.assert_allclose(
+            gps.lla2ecef(self.lat, self.long, self.alt), self.XYZ, rtol=0, atol=1e-6
+        )
+        np.testing.assert_allclose(
+            gps.lla2ecef(self.lat.reshape((10, 100)), self.long.reshape((10, 100)), 0),
+            [x.reshape((10, 100)) for x in gps.lla2ecef_numpy(self.lat, self.long, 0)],
+            rtol=0,
+            atol=1e-6,
+        )
+        x, y, z = gps.lla2ecef(35.0, 139.0, 0.0)
+        np.testing.assert_allclose((x, y, z), gps.lla2ecef_numpy(35.0, 139.0, 0.0))
+        self.assertEqual(np.ndim(x), 0)
+
+    def test_ecef2lla_algorithms(self):
+        """Every algorithm matches its numpy version."""
+        for name, func in gps.ECEF2LLA_ALGORITHMS.items():
+            expected = func(*self.XYZ)
+            result = gps.ecef2lla(self.x, self.y, self.z, algorithm=name)
+            np.testing.assert_allclose(result.lat, expected.lat, rtol=0, atol=1e-9, err_msg=name)
+            np.testing.assert_allclose(result.long, expected.long, rtol=0, atol=1e-9, err_msg=name)
+            np.testing.assert_allclose(result.alt, expected.alt, rtol=0, atol=1e-4, err_msg=name)
+        with self.assertRaises(ValueError):
+            gps.ecef2lla(self.x, self.y, self.z, algorithm="nope")
+
+    def test_out_and_float32(self):
+        """Results can be stored as float32, and into given arrays."""
+        result = gps.ecef2lla(self.x, self.y, self.z, dtype=np.float32)
+        self.assertEqual(result.lat.dtype, np.float32)
+        np.testing.assert_allclose(result.lat, self.lat, rtol=1e-6)
+
+        out = tuple(np.empty(1000) for _ in range(3))
+        result = gps.ecef2lla(self.x, self.y, self.z, out=out)
+        self.assertTrue(all(r is o for r, o in zip(result, out)))
+        np.testing.assert_allclose(out[0], self.lat, rtol=0, atol=1e-9)
+        np.testing.assert_allclose(out[2], self.alt, rtol=0, atol=1e-4)
+
+        out32 = tuple(np.empty(1000, dtype=np.float32) for _ in range(3))
+        gps.lla2ecef(self.lat, self.long, self.alt, out=out32)
+        np.testing.assert_allclose(out32, self.XYZ, rtol=1e-6)
+
+    def test_ground_out(self):
+        """ground_out matches converting lat/long back at altitude 0."""
+        for name in gps.ECEF2LLA_ALGORITHMS:
+            ground = np.empty((3, 1000))
+            result = gps.ecef2lla(self.x, self.y, self.z, algorithm=name, ground_out=ground)
+            expected = gps.lla2ecef_numpy(result.lat, result.long, 0)
+            np.testing.assert_allclose(ground, expected, rtol=0, atol=1e-6, err_msg=name)
+
+    def test_laps_from_ground(self):
+        """Laps found from ground_out match the lat/long round trip."""
+        timecodes, east, north, _, _ = circuit([40000, 30000, 33000, 45000])
+        XYZ = enu_to_ecef(east, north, up=50 + 10 * np.sin(timecodes / 5000))
+        ground = np.empty((3, len(timecodes)))
+        lla = gps.ecef2lla(XYZ[:, 0], XYZ[:, 1], XYZ[:, 2], ground_out=ground)
+        round_trip = np.column_stack(gps.lla2ecef(lla.lat, lla.long, 0))
+        np.testing.assert_allclose(
+            gps.find_laps(ground.T, timecodes, sf_marker()),
+            gps.find_laps(round_trip, timecodes, sf_marker()),
+            rtol=0,
+            atol=1e-3,
+        )
+
+    @unittest.skipIf(gps._kernels is None, "gps_kernels extension not built")
+    def test_single_thread_dispatch(self):
+        """On one thread vermeille2003 is converted by numpy, the others by the kernels."""
+        calls = []
+
+        def kernel(*args, **kwargs):
+            calls.append(kwargs["algorithm"])
+            return ecef2lla(*args, **kwargs)
+
+        ecef2lla = gps._kernels.ecef2lla
+        with (
+            mock.patch.object(gps._kernels, "threads", return_value=1),
+            mock.patch.object(gps._kernels, "ecef2lla", kernel),
+        ):
+            for name in gps.ECEF2LLA_ALGORITHMS:
+                gps.ecef2lla(self.x, self.y, self.z, algorithm=name)
+            self.assertEqual(calls, ["osen", "fukushima2006"])
+            with mock.patch.object(gps._kernels, "threads", return_value=4):
+                gps.ecef2lla(self.x, self.y, self.z)
+            self.assertEqual(calls[-1], "vermeille2003")
+
+    @unittest.skipIf(gps._kernels is None, "gps_kernels extension not built")
+    def test_bad_out(self):
+        """Mismatched out arrays are rejected."""
+        with self.assertRaises(ValueError):
+            gps.lla2ecef(self.lat, self.long, 0, out=(np.empty(10),) * 3)
+        with self.assertRaises(ValueError):
+            gps.lla2ecef(self.lat, self.long, 0, dtype=np.int32)
+
+
+class TestGPSTime(unittest.TestCase):
+    """Tests for GPS week/time of week to UTC."""
+
+    def test_gps_to_utc(self):
+        """Leap seconds are applied for the GPS time given."""
+        # GPS week 1930 started 2017-01-01 00:00:18 UTC... minus the new leap second
+        result = gps.gps_to_utc(np.array([1930, 1930, 1929]), np.array([18000, 60500, 0]))
+        self.assertEqual(result.dtype, np.dtype("datetime64[ms]"))
+        self.assertEqual(
+            result.tolist(),
+            np.array(
+                ["2017-01-01T00:00:00", "2017-01-01T00:00:42.5", "2016-12-24T23:59:43"],
+                dtype="datetime64[ms]",
+            ).tolist(),
+        )
+        self.assertEqual(gps.gps_to_utc(0, 0), np.datetime64("1980-01-06T00:00:00", "ms"))
+
+
+class TestENU(unittest.TestCase):
+    """Tests for the local tangent plane projection."""
+
+    def test_round_trip(self):
+        """ecef2enu inverts a known east/north/up offset."""
+        east = np.array([0.0, 100.0, -2500.0, 40.0])
+        north = np.array([0.0, -30.0, 1800.0, 3000.0])
+        up = np.array([0.0, 5.0, -20.0, 100.0])
+        XYZ = enu_to_ecef(east, north, up)
+        e, n, u = gps.ecef2enu(XYZ[:, 0], XYZ[:, 1], XYZ[:, 2], LAT0, LON0)
+        np.testing.assert_allclose(e, east, atol=1e-6)
+        np.testing.assert_allclose(n, north, atol=1e-6)
+        np.testing.assert_allclose(u, up, atol=1e-6)
+
+    def test_basis_cached(self):
+        """The basis for a point is computed once and is read only."""
+        origin, R = gps.enu_basis(LAT0, LON0)
+        self.assertIs(gps.enu_basis(LAT0, LON0)[1], R)
+        self.assertFalse(R.flags.writeable)
+        np.testing.assert_allclose(R @ R.T, np.eye(3), atol=1e-12)
+
+
+if __name__ == "__main__":
+    unittest.main()
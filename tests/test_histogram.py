@@ -0,0 +1,98 @@
+"""Unit tests for time weighted histograms."""
+
+import unittest
+import numpy as np
+import pyarrow as pa
+from libxrk.base import LogFile
+from libxrk.histogram import dwell_times, histogram, histogram2d
+from .synthetic import channel_table
+
+
+def _log(name, rpm_tc, rpm, tps_tc, tps):
+    return LogFile(
+        channels={
+            "RPM": channel_table("RPM", rpm_tc, rpm),
+            "TPS": channel_table("TPS", tps_tc, tps, interpolate=False),
+        },
+        laps=pa.table(
+            {
+                "num": pa.array([0, 1], type=pa.int32()),
+                "start_time": pa.array([0, 200], type=pa.int64()),
+                "end_time": pa.array([200, 400], type=pa.int64()),
+            }
+        ),
+        metadata={},
+        file_name=name,
+    )
+
+
+class TestHistogram(unittest.TestCase):
+    """Tests for histogram and histogram2d."""
+
+    def setUp(self):
+        self.a = _log(
+            "a.xrk",
+            [0, 100, 200, 250, 300, 350],
+            [1000.0, 3000.0, 5000.0, 5000.0, 1000.0, 3000.0],
+            [0, 200],
+            [0.0, 100.0],
+        )
+        self.b = _log("b.xrk", [0, 100], [5000.0, 5000.0], [0], [100.0])
+
+    def test_dwell_times(self):
+        """Each sample lasts until the next, the last gets the median period."""
+        np.testing.assert_array_equal(
+            dwell_times(np.array([0, 100, 150, 1150])), [100, 50, 1000, 100]
+        )
+        np.testing.assert_array_equal(
+            dwell_times(np.array([0, 100, 150, 1150]), 200), [100, 50, 200, 100]
+        )
+
+    def test_session_histogram(self):
+        """Time in range per session is weighted by dwell time."""
+        result = histogram(self.a, "RPM", bins=[0, 2000, 4000, 6000])
+        self.assertEqual(result.column_names, ["file", "num", "bin_lo", "bin_hi", "time"])
+        self.assertEqual(result.column("time").to_pylist(), [150.0, 150.0, 100.0])
+        self.assertEqual(result.column("num").null_count, 3)
+
+    def test_lap_histogram_multiple_files(self):
+        """Histograms are split per lap and per file in one call."""
+        result = histogram([self.a, self.b], "RPM", bins=[0, 2000, 4000, 6000], by_lap=True)
+        self.assertEqual(result.column("file").to_pylist(), ["a.xrk"] * 6 + ["b.xrk"] * 6)
+        self.assertEqual(result.column("num").to_pylist(), [0, 0, 0, 1, 1, 1] * 2)
+        self.assertEqual(
+            result.column("time").to_pylist(),
+            [100.0, 100.0, 0.0, 50.0, 50.0, 100.0, 0.0, 0.0, 200.0, 0.0, 0.0, 0.0],
+        )
+
+    def test_no_laps(self):
+        """By lap, a session without laps has no rows."""
+        log = LogFile(
+            self.a.channels, pa.table({"num": [], "start_time": [], "end_time": []}), {}, "c.xrk"
+        )
+        result = histogram([log, self.b], "RPM", bins=[0, 2000, 4000, 6000], by_lap=True)
+        self.assertEqual(result.column("file").to_pylist(), ["b.xrk"] * 6)
+        result = histogram2d(log, "RPM", "TPS", x_bins=2, y_bins=2, by_lap=True)
+        self.assertEqual(result.num_rows, 0)
+
+    def test_automatic_bins(self):
+        """Integer bins span the range of all files."""
+        result = histogram([self.a, self.b], "RPM", bins=4)
+        self.assertEqual(result.column("bin_lo")[0].as_py(), 1000.0)
+        self.assertEqual(result.column("bin_hi")[3].as_py(), 5000.0)
+        self.assertEqual(sum(result.column("time").to_pylist()), 400.0 + 200.0)
+
+    def test_histogram2d(self):
+        """2-D histograms pair y with x's timecodes."""
+        result = histogram2d(self.a, "RPM", "TPS", x_bins=[0, 4000, 6000], y_bins=[0, 50, 150])
+        self.assertEqual(
+            result.column_names, ["file", "num", "x_lo", "x_hi", "y_lo", "y_hi", "time"]
+        )
+        self.assertEqual(result.column("x_lo").to_pylist(), [0, 0, 4000, 4000])
+        self.assertEqual(result.column("y_lo").to_pylist(), [0, 50, 0, 50])
+        # TPS holds 0 before 200ms, 100 after
+        self.assertEqual(result.column("time").to_pylist(), [200.0, 100.0, 0.0, 100.0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+"""Tests that importing libxrk stays cheap."""
+
+import importlib
+import os
+import subprocess
+import sys
+import unittest
+import libxrk
+
+_SRC = os.path.dirname(os.path.dirname(os.path.abspath(libxrk.__file__)))
+
+
+def _loaded_after(statement):
+    # modules a fresh interpreter has loaded after running statement
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [_SRC, env.get("PYTHONPATH")]))
+    out = subprocess.run(
+        [sys.executable, "-c", statement + "; import sys; print(' '.join(sys.modules))"],
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return set(out.split())
+
+
+class TestImport(unittest.TestCase):
+    """Heavy modules load on first use, not on import."""
+
+    def test_import_package(self):
+        """import libxrk loads no extension, numpy or pyarrow."""
+        loaded = _loaded_after("import libxrk")
+        for module in ("libxrk.aim_xrk", "numpy", "pyarrow", "typing", "concurrent.futures"):
+            self.assertNotIn(module, loaded)
+
+    def test_import_reader(self):
+        """The compiled reader defers pyarrow, gps and the thread pool."""
+        loaded = _loaded_after("import libxrk.aim_xrk")
+        for module in ("pyarrow", "libxrk.gps", "libxrk.gps_kernels", "concurrent.futures"):
+            self.assertNotIn(module, loaded)
+
+    def test_lazy_attributes(self):
+        """Lazy names resolve to the functions, even after importing the submodule."""
+        module = importlib.import_module("libxrk.aim_xrk")
+        self.assertIs(libxrk.aim_xrk, module.aim_xrk)
+        self.assertIs(libxrk.aim_track_dbg, module.aim_track_dbg)
+        self.assertIn("aim_xrk", dir(libxrk))
+        with self.assertRaises(AttributeError):
+            getattr(libxrk, "no_such_name")
+
+
+if __name__ == "__main__":
+    unittest.main()
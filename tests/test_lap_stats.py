@@ -0,0 +1,95 @@
+"""Unit tests for LogFile.lap_stats()."""
+
+import unittest
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from libxrk.base import LogFile
+from .synthetic import channel_table
+
+
+class TestLapStats(unittest.TestCase):
+    """Tests for per lap channel statistics."""
+
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        fast_tc = np.arange(0, 3000, 10)
+        slow_tc = np.arange(0, 3000, 250)
+        self.fast = rng.normal(100.0, 5.0, len(fast_tc))
+        self.slow = rng.normal(size=len(slow_tc))
+        self.log = LogFile(
+            channels={
+                "Fast": channel_table("Fast", fast_tc, self.fast),
+                "Slow": channel_table("Slow", slow_tc, self.slow),
+            },
+            laps=pa.table(
+                {
+                    "num": pa.array([0, 1, 2, 3], type=pa.int32()),
+                    "start_time": pa.array([0, 1000, 2400, 2900], type=pa.int64()),
+                    "end_time": pa.array([1000, 2400, 2900, 2950], type=pa.int64()),
+                }
+            ),
+            metadata={},
+            file_name="test.xrk",
+        )
+        self.bounds = [(0, 1000), (1000, 2400), (2400, 2900), (2900, 2950)]
+
+    def _check(self, result, name, tc, values):
+        rows = result.filter(pc.equal(result.column("channel"), name))
+        self.assertEqual(rows.column("num").to_pylist(), [0, 1, 2, 3])
+        for i, (start, end) in enumerate(self.bounds):
+            lap = values[(tc >= start) & (tc < end)]
+            self.assertEqual(rows.column("count")[i].as_py(), len(lap))
+            if not len(lap):
+                self.assertIsNone(rows.column("mean")[i].as_py())
+                self.assertIsNone(rows.column("p50")[i].as_py())
+                continue
+            self.assertAlmostEqual(rows.column("min")[i].as_py(), lap.min())
+            self.assertAlmostEqual(rows.column("max")[i].as_py(), lap.max())
+            self.assertAlmostEqual(rows.column("mean")[i].as_py(), lap.mean())
+            self.assertAlmostEqual(rows.column("std")[i].as_py(), lap.std())
+            for p in (5, 50, 95):
+                self.assertAlmostEqual(rows.column("p%d" % p)[i].as_py(), np.percentile(lap, p))
+
+    def test_matches_numpy(self):
+        """Segmented reductions match per lap numpy results for mixed sample rates."""
+        result = self.log.lap_stats()
+        self.assertEqual(
+            result.column_names,
+            ["num", "channel", "count", "min", "max", "mean", "std", "p5", "p50", "p95"],
+        )
+        self.assertEqual(len(result), 8)
+        self._check(result, "Fast", np.arange(0, 3000, 10), self.fast)
+        self._check(result, "Slow", np.arange(0, 3000, 250), self.slow)
+
+    def test_channel_selection_and_percentiles(self):
+        """Channels and percentiles can be chosen."""
+        result = self.log.lap_stats(channels=["Slow"], percentiles=[25, 99.5])
+        self.assertEqual(set(result.column("channel").to_pylist()), {"Slow"})
+        self.assertIn("p99.5", result.column_names)
+        self.assertNotIn("p50", result.column_names)
+
+    def test_non_numeric(self):
+        """Non-numeric channels are left out by default, and refused if asked for."""
+        tc = np.arange(0, 3000, 100)
+        times = pa.array(tc + 1_700_000_000_000, type=pa.timestamp("ms", tz="UTC"))
+        self.log.channels["GPS UTC Time"] = pa.table({"timecodes": tc, "GPS UTC Time": times})
+        result = self.log.lap_stats()
+        self.assertEqual(set(result.column("channel").to_pylist()), {"Fast", "Slow"})
+        with self.assertRaises(TypeError):
+            self.log.lap_stats(channels=["Fast", "GPS UTC Time"])
+
+    def test_no_laps(self):
+        """A session without laps gives an empty table."""
+        self.log.laps = pa.table(
+            {
+                "num": pa.array([], type=pa.int32()),
+                "start_time": pa.array([], type=pa.int64()),
+                "end_time": pa.array([], type=pa.int64()),
+            }
+        )
+        self.assertEqual(len(self.log.lap_stats()), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
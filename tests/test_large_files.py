@@ -0,0 +1,106 @@
+"""Tests for decoding through a sliding file window, with 64 bit offsets."""
+
+import importlib
+import mmap
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from libxrk import aim_xrk
+from .synthetic import xrk_message, xrk_session
+
+_aim_xrk = importlib.import_module("libxrk.aim_xrk")
+
+GRANULARITY = mmap.ALLOCATIONGRANULARITY
+
+
+class TestFileWindow(unittest.TestCase):
+    """Tests for _decode_sequence over a _FileWindow."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "session.xrk")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write(self, *parts):
+        # parts are bytes, or an int to seek to (leaving a hole)
+        with open(self.path, "wb") as f:
+            for part in parts:
+                if isinstance(part, int):
+                    f.seek(part)
+                else:
+                    f.write(part)
+
+    def _decode(self, size=_aim_xrk._WINDOW, margin=_aim_xrk._WINDOW_MARGIN, progress=None):
+        with open(self.path, "rb") as f:
+            window = _aim_xrk._FileWindow(f, size, margin)
+            return _aim_xrk._decode_sequence(window, progress)
+
+    def assertSameData(self, data, expected):
+        self.assertEqual(sorted(data.channels), sorted(expected.channels))
+        for name, ch in data.channels.items():
+            np.testing.assert_array_equal(
+                np.asarray(ch.timecodes), np.asarray(expected.channels[name].timecodes), name
+            )
+            np.testing.assert_array_equal(
+                np.asarray(ch.sampledata), np.asarray(expected.channels[name].sampledata), name
+            )
+        self.assertEqual(data.messages.keys(), expected.messages.keys())
+        self.assertTrue(data.laps.equals(expected.laps))
+
+    def test_small_windows(self):
+        """Records split across windows, and ones larger than a window, decode the same."""
+        records = xrk_session((60000,))
+        # a message larger than any of the windows below
+        records.insert(len(records) // 2, xrk_message("NTE", b"note" * 20000))
+        stream = b"".join(records)
+        expected = _aim_xrk._decode_sequence(stream)
+        self._write(stream)
+        for size, margin in (
+            (4 * GRANULARITY, 2 * GRANULARITY),
+            (5 * GRANULARITY + 1, 2 * GRANULARITY + 7),
+            (len(stream) + 1, len(stream) // 2),
+        ):
+            with self.subTest(size=size):
+                self.assertGreater(len(stream), 4 * size // 5)
+                data = self._decode(size, margin)
+                self.assertSameData(data, expected)
+                self.assertEqual(data.messages[_aim_xrk._tokdec("NTE")][0].content, "note" * 20000)
+
+    def test_resync(self):
+        """Bad bytes between records are skipped, wherever they fall."""
+        records = xrk_session()
+        expected = _aim_xrk._decode_sequence(b"".join(records))
+        garbage = bytes(3000) + b"((<h" + bytes(range(256)) * 20
+        for i in range(1, len(records), 50):
+            records.insert(i, garbage)
+        self._write(b"".join(records))
+        self.assertSameData(self._decode(4 * GRANULARITY, 2 * GRANULARITY), expected)
+        self.assertSameData(self._decode(), expected)
+
+    def test_sparse_over_4gb(self):
+        """Records past the first 4GB of a (sparse) file are found."""
+        records = xrk_session()
+        half = len(records) // 2
+        head, tail = b"".join(records[:half]), b"".join(records[half:])
+        offset = (1 << 32) + 12345
+        self._write(head, offset, tail)
+        self.assertEqual(os.path.getsize(self.path), offset + len(tail))
+
+        positions = []
+        data = self._decode(progress=lambda pos, total: positions.append((pos, total)))
+        self.assertSameData(data, _aim_xrk._decode_sequence(head + tail))
+        self.assertGreater(max(positions)[0], 1 << 32)
+        self.assertEqual(positions[-1][1], offset + len(tail))
+
+        log = aim_xrk(self.path)
+        self.assertEqual(log.laps.column("end_time").to_pylist(), [10000, 19000])
+        self.assertEqual(log.channels["RPM"].column("RPM").to_pylist()[-1], 1190)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+"""Unit tests for derived math channels."""
+
+import unittest
+import numpy as np
+import pyarrow as pa
+from libxrk.base import LogFile
+from libxrk.math_channels import MathChannels
+from .synthetic import channel_table
+
+
+class TestMathChannels(unittest.TestCase):
+    """Tests for MathChannels evaluation, alignment and caching."""
+
+    def setUp(self):
+        self.log = LogFile(
+            channels={
+                "InlineAcc": channel_table("InlineAcc", [0, 100, 200, 300], [0.0, 0.3, 0.6, 0.9]),
+                "LateralAcc": channel_table("LateralAcc", [0, 100, 200, 300], [0.4, 0.4, 0.8, 1.2]),
+                "Gear": channel_table("Gear", [0, 200], np.array([1, 2], dtype=np.uint32), False),
+                "Speed": channel_table("Speed", [0, 200], [10.0, 30.0]),
+            },
+            laps=pa.table({"num": [], "start_time": [], "end_time": []}),
+            metadata={},
+            file_name="test.xrk",
+        )
+        self.math = MathChannels(self.log)
+
+    def test_same_timebase(self):
+        """Inputs sharing timecodes are combined sample by sample."""
+        self.math.define("Combined G", ["InlineAcc", "LateralAcc"], np.hypot, units="G")
+        result = self.math["Combined G"]
+
+        self.assertEqual(result.column_names, ["timecodes", "Combined G"])
+        self.assertEqual(result.column("timecodes").to_pylist(), [0, 100, 200, 300])
+        np.testing.assert_allclose(
+            result.column("Combined G").to_numpy(), [0.4, 0.5, 1.0, 1.5], rtol=1e-12
+        )
+        metadata = result.schema.field("Combined G").metadata
+        self.assertEqual(metadata[b"units"], b"G")
+        self.assertEqual(metadata[b"interpolate"], b"True")
+
+    def test_alignment(self):
+        """Lower rate inputs are interpolated or held onto the fastest timebase."""
+        self.math.define("Speed x Gear", ["Speed", "Gear", "InlineAcc"], lambda s, g, _: s * g)
+        result = self.math["Speed x Gear"]
+
+        self.assertEqual(result.column("timecodes").to_pylist(), [0, 100, 200, 300])
+        # Speed interpolates (10, 20, 30, 30), Gear holds (1, 1, 2, 2)
+        self.assertEqual(result.column("Speed x Gear").to_pylist(), [10.0, 20.0, 60.0, 60.0])
+
+    def test_explicit_timebase(self):
+        """The timebase can be pinned to a specific input."""
+        self.math.define("Speed2", ["Speed", "InlineAcc"], lambda s, a: s * 2, timebase="Speed")
+        self.assertEqual(self.math["Speed2"].column("timecodes").to_pylist(), [0, 200])
+
+    def test_dependencies_and_cache(self):
+        """Derived channels can depend on each other and are evaluated once."""
+        calls = []
+
+        def combined(a, b):
+            calls.append(1)
+            return np.hypot(a, b)
+
+        self.math.define("Combined G", ["InlineAcc", "LateralAcc"], combined)
+        self.math.define("Combined G x2", ["Combined G"], lambda g: g * 2)
+
+        self.assertEqual(self.math.dependencies("Combined G x2"), ["Combined G"])
+        np.testing.assert_allclose(
+            self.math["Combined G x2"].column(1).to_numpy(), [0.8, 1.0, 2.0, 3.0]
+        )
+        self.math["Combined G"]
+        self.math["Combined G x2"]
+        self.assertEqual(len(calls), 1)
+
+        # Redefining an input invalidates dependents
+        self.math.define("Combined G", ["InlineAcc", "LateralAcc"], lambda a, b: a + b)
+        np.testing.assert_allclose(
+            self.math["Combined G x2"].column(1).to_numpy(), [0.8, 1.4, 2.8, 4.2]
+        )
+
+    def test_circular_dependency(self):
+        """Cycles between derived channels are reported."""
+        self.math.define("A", ["B"], lambda b: b)
+        self.math.define("B", ["A"], lambda a: a)
+        with self.assertRaises(ValueError):
+            self.math["A"]
+
+    def test_unknown_input(self):
+        """Missing inputs raise KeyError on access."""
+        self.math.define("A", ["Missing"], lambda m: m)
+        with self.assertRaises(KeyError):
+            self.math["A"]
+
+    def test_native_name_rejected(self):
+        """Derived channels cannot shadow native channels."""
+        with self.assertRaises(ValueError):
+            self.math.define("Speed", ["InlineAcc"], lambda a: a)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+"""Tests for decoding with a memory budget (spilling to temporary files)."""
+
+import importlib
+import mmap
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from libxrk import aim_xrk
+from .synthetic import xrk_session
+
+_aim_xrk = importlib.import_module("libxrk.aim_xrk")
+
+
+def _stream():
+    return b"".join(xrk_session())
+
+
+def _mapped(a):
+    # whether an array's memory is (ultimately) a mmap
+    obj = a
+    while obj is not None:
+        if isinstance(obj, mmap.mmap):
+            return True
+        obj = obj.obj if isinstance(obj, memoryview) else getattr(obj, "base", None)
+    return False
+
+
+class TestMemoryBudget(unittest.TestCase):
+    """Tests for aim_xrk(..., memory_budget=)."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "synthetic.xrk")
+        with open(self.path, "wb") as f:
+            f.write(_stream())
+        self.expected = aim_xrk(self.path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_synthetic_stream(self):
+        """The unbudgeted decode of the synthetic stream is what it was built from."""
+        log = self.expected
+        self.assertEqual(
+            sorted(log.channels),
+            sorted(
+                [
+                    "Speed",
+                    "RPM",
+                    "AccX",
+                    "Gear",
+                    "Battery",
+                    "Steer",
+                    "GPS Speed",
+                    "GPS Latitude",
+                    "GPS Longitude",
+                    "GPS Altitude",
+                ]
+            ),
+        )
+        rpm = log.channels["RPM"]
+        self.assertEqual(rpm.column("timecodes").to_pylist()[:3], [0, 100, 200])
+        self.assertEqual(rpm.column("RPM").to_pylist()[:3], [1000, 1001, 1002])
+        self.assertEqual(log.channels["Gear"].column("Gear").to_pylist()[:5], [0, 1, 2, 3, 0])
+        self.assertEqual(log.channels["Battery"].column("Battery").to_pylist()[:2], [12.0, 12.01])
+        steer = log.channels["Steer"]
+        self.assertEqual(steer.column("timecodes").to_pylist()[:6], [0, 20, 40, 60, 80, 100])
+        self.assertEqual(steer.column("Steer").to_pylist()[:6], [0, 1, 2, 3, 4, 1])
+        self.assertEqual(log.laps.column("end_time").to_pylist(), [10000, 19000])
+
+    def test_budget_matches_unbudgeted(self):
+        """Spilling doesn't change what is decoded, whatever the budget."""
+        for budget in (0, 100, 5000, 10**9):
+            log = aim_xrk(self.path, memory_budget=budget)
+            self.assertEqual(sorted(log.channels), sorted(self.expected.channels))
+            for name, table in log.channels.items():
+                self.assertTrue(table.equals(self.expected.channels[name]), (budget, name))
+            self.assertTrue(log.laps.equals(self.expected.laps))
+
+    def test_spilled_arrays_are_mapped(self):
+        """Over budget, decoded channels are backed by temporary files."""
+        with tempfile.TemporaryDirectory() as spill_dir:
+            data = _aim_xrk._decode_sequence(_stream(), memory_budget=100, spill_dir=spill_dir)
+            for name in ("Speed", "RPM", "AccX", "Gear", "Battery", "Steer"):
+                ch = data.channels[name]
+                self.assertTrue(_mapped(np.asarray(ch.sampledata)), name)
+                self.assertTrue(_mapped(np.asarray(ch.timecodes)), name)
+            # the files are unlinked as they are made
+            self.assertEqual(os.listdir(spill_dir), [])
+
+        data = _aim_xrk._decode_sequence(_stream())
+        self.assertFalse(_mapped(np.asarray(data.channels["Speed"].sampledata)))
+
+    def test_spill_files_open(self):
+        """Spilling keeps one file open, not one per channel."""
+        opened = []
+        most = 0
+        temporary_file = tempfile.TemporaryFile
+
+        def counting(*args, **kwargs):
+            nonlocal most
+            opened.append(temporary_file(*args, **kwargs))
+            most = max(most, sum(not f.closed for f in opened))
+            return opened[-1]
+
+        with mock.patch.object(tempfile, "TemporaryFile", counting):
+            _aim_xrk._decode_sequence(_stream(), memory_budget=0)
+        self.assertGreater(len(opened), 1)
+        self.assertEqual(most, 1)
+
+    def test_spill_error(self):
+        """A failure to spill is raised, not taken for bad data."""
+        with mock.patch.object(tempfile, "TemporaryFile", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                _aim_xrk._decode_sequence(_stream(), memory_budget=0)
+
+
+if __name__ == "__main__":
+    unittest.main()
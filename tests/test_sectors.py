@@ -0,0 +1,59 @@
+"""Unit tests for sector times from split line crossings."""
+
+import unittest
+import numpy as np
+from libxrk.sectors import sector_times, split_crossings
+from libxrk.tracks import Track, TrackDatabase
+from .synthetic import circuit_log, enu_to_lla, sf_marker
+
+
+def _marker(east, north):
+    lla = enu_to_lla(np.array([east]), np.array([north]))
+    return (float(lla.lat[0]), float(lla.long[0]))
+
+
+class TestSectorTimes(unittest.TestCase):
+    """Tests for sector_times on a synthetic circuit."""
+
+    def setUp(self):
+        # counterclockwise from the east point: north is 1/4 lap, west is 1/2
+        self.log = circuit_log([40000, 30000, 36000, 45000])
+        self.splits = [_marker(0.0, 100.0), _marker(-100.0, 0.0)]
+
+    def test_split_crossings(self):
+        """Each split is crossed once per lap."""
+        north, west = split_crossings(self.log, self.splits)
+        np.testing.assert_allclose(north, [10000, 47500, 79000, 117250], atol=50)
+        np.testing.assert_allclose(west, [20000, 55000, 88000, 128500], atol=50)
+
+    def test_sector_times(self):
+        """Sectors follow the lap's constant speed."""
+        result = sector_times(self.log, self.splits, laps=[1, 2])
+        self.assertEqual(
+            result.column_names, ["num", "sector_1", "sector_2", "sector_3", "lap_time"]
+        )
+        self.assertEqual(result.column("num").to_pylist(), [1, 2])
+        np.testing.assert_allclose(result.column("sector_1").to_numpy(), [7500, 9000], atol=50)
+        np.testing.assert_allclose(result.column("sector_2").to_numpy(), [7500, 9000], atol=50)
+        np.testing.assert_allclose(result.column("sector_3").to_numpy(), [15000, 18000], atol=50)
+        np.testing.assert_allclose(result.column("lap_time").to_numpy(), [30000, 36000])
+
+    def test_track_sectors(self):
+        """A database track's sectors are its split lines."""
+        db = TrackDatabase()
+        db.add(Track("Circle", sf_marker(), sectors=self.splits))
+        track = db.get("Circle")
+        assert track is not None
+        result = sector_times(self.log, track, laps=[1, 2])
+        self.assertTrue(result.equals(sector_times(self.log, self.splits, laps=[1, 2])))
+
+    def test_missed_split(self):
+        """A split that is never crossed gives null sectors around it."""
+        result = sector_times(self.log, [_marker(0.0, 100.0), _marker(5000.0, 5000.0)])
+        self.assertEqual(result.column("sector_1").null_count, 0)
+        self.assertEqual(result.column("sector_2").null_count, 4)
+        self.assertEqual(result.column("sector_3").null_count, 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -283,6 +283,42 @@ class TestSFJXRK(unittest.TestCase):
                 f"Channel '{channel_name}' interpolate mismatch",
             )
 
+    def test_sfj_xrk_gps_enu_channels(self):
+        """Test the optional planar GPS X/Y channels."""
+        log = aim_xrk(str(SFJ_XRK_FILE), progress=None, gps_channels=["GPS X", "GPS Y"])
+
+        lat = log.channels["GPS Latitude"]
+        for name in ["GPS X", "GPS Y"]:
+            self.assertIn(name, log.channels, f"Channel '{name}' not found")
+            table = log.channels[name]
+            self.assertEqual(table.num_rows, lat.num_rows)
+            self.assertEqual(table.schema.field(name).metadata[b"units"], b"m")
+
+        # Fuji GP short fits in a few km around the start/finish line
+        x = log.channels["GPS X"].column("GPS X").to_numpy()
+        y = log.channels["GPS Y"].column("GPS Y").to_numpy()
+        self.assertLess(float(max(abs(x).max(), abs(y).max())), 5000)
+
+        with self.assertRaises(ValueError):
+            aim_xrk(str(SFJ_XRK_FILE), progress=None, gps_channels=["GPS Q"])
+
+    def test_sfj_xrk_gps_record_channels(self):
+        """Test the optional channels taken from the GPS records."""
+        names = ["GPS Position Accuracy", "GPS Satellites", "GPS UTC Time", "GPS Week"]
+        log = aim_xrk(str(SFJ_XRK_FILE), progress=None, gps_channels=names)
+        lat = log.channels["GPS Latitude"]
+        for name in names:
+            self.assertIn(name, log.channels, f"Channel '{name}' not found")
+            self.assertEqual(log.channels[name].num_rows, lat.num_rows)
+
+        nsat = log.channels["GPS Satellites"].column("GPS Satellites").to_numpy()
+        self.assertGreater(int(nsat.max()), 3)
+        utc = log.channels["GPS UTC Time"].column("GPS UTC Time")
+        self.assertEqual(utc.type, pa.timestamp("ms"))
+        # Log Date metadata is 11/04/2025
+        self.assertEqual(str(utc[0].as_py().date())[:7], "2025-11")
+        self.assertNotIn("GPS Satellites", aim_xrk(str(SFJ_XRK_FILE), progress=None).channels)
+
 
 if __name__ == "__main__":
     unittest.main()
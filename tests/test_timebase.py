@@ -0,0 +1,158 @@
+"""Tests for Timebase, the run representation of fixed rate timecodes."""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+import pyarrow as pa
+from libxrk import aim_xrk
+from libxrk.base import LogFile, resample_channel
+from libxrk.timebase import Timebase
+from .synthetic import channel_table, xrk_session
+
+
+def _timecodes(rng):
+    # runs of assorted periods and lengths, with gaps between them
+    parts = []
+    t = int(rng.integers(-100, 100))
+    for _ in range(int(rng.integers(1, 5))):
+        period = int(rng.choice([1, 5, 20, 40, 100]))
+        parts.append(t + period * np.arange(int(rng.integers(1, 60))))
+        t = int(parts[-1][-1]) + int(rng.integers(1, 500))
+    return np.concatenate(parts)
+
+
+class TestTimebase(unittest.TestCase):
+    """Tests for Timebase against numpy on the materialized timecodes."""
+
+    def test_from_timecodes(self):
+        """Runs are found, and materialize back to the timecodes."""
+        tb = Timebase.from_timecodes(np.concatenate([np.arange(0, 2000, 20), [2500, 2510]]))
+        assert tb is not None
+        self.assertEqual(tb.start.tolist(), [0, 2500])
+        self.assertEqual(tb.period.tolist(), [20, 10])
+        self.assertEqual(tb.count.tolist(), [100, 2])
+        self.assertEqual(len(tb), 102)
+
+        rng = np.random.default_rng(3)
+        for _ in range(50):
+            tc = _timecodes(rng)
+            tb = Timebase.from_timecodes(tc, min_run_length=1)
+            assert tb is not None
+            np.testing.assert_array_equal(tb.materialize(), tc)
+            np.testing.assert_array_equal(tb.at(np.arange(len(tc))), tc)
+
+    def test_irregular(self):
+        """Timecodes without (enough) fixed period runs have no Timebase."""
+        rng = np.random.default_rng(5)
+        self.assertIsNone(Timebase.from_timecodes(np.cumsum(rng.integers(1, 30, 1000))))
+        self.assertIsNone(Timebase.from_timecodes(np.array([0, 10, 10, 20])))
+        self.assertIsNone(Timebase.from_timecodes(np.array([0, 10, 5, 20])))
+        for tc in ([], [7]):
+            tb = Timebase.from_timecodes(np.array(tc, dtype=np.int64))
+            assert tb is not None
+            self.assertEqual(tb.materialize().tolist(), tc)
+
+    def test_from_runs(self):
+        """Blocks that continue the previous one join its run."""
+        tb = Timebase.from_runs(np.array([0, 100, 200, 1000, 1060]), np.array([5, 5, 5, 3, 2]), 20)
+        self.assertEqual(tb.start.tolist(), [0, 1000])
+        self.assertEqual(tb.count.tolist(), [15, 5])
+        np.testing.assert_array_equal(
+            tb.materialize(), np.concatenate([np.arange(0, 300, 20), np.arange(1000, 1100, 20)])
+        )
+
+    def test_searchsorted_interp(self):
+        """searchsorted() and interp() match numpy's, at and between samples."""
+        rng = np.random.default_rng(11)
+        for _ in range(50):
+            tc = _timecodes(rng)
+            tb = Timebase.from_timecodes(tc, min_run_length=1)
+            assert tb is not None
+            t = np.concatenate(
+                [tc, tc + 0.5, tc - 1, [tc[0] - 1000, tc[-1] + 1000], rng.uniform(-500, 5000, 50)]
+            )
+            for side in ("left", "right"):
+                np.testing.assert_array_equal(
+                    tb.searchsorted(t, side), np.searchsorted(tc, t, side)
+                )
+            values = rng.normal(size=len(tc))
+            np.testing.assert_allclose(tb.interp(t, values), np.interp(t, tc, values))
+            np.testing.assert_array_equal(tb.interp(tc, values), values)
+
+
+class TestLogFileTimebase(unittest.TestCase):
+    """Tests for LogFile.timebase() and its users."""
+
+    def setUp(self):
+        tc = np.concatenate([np.arange(0, 5000, 10), np.arange(6000, 9000, 10)])
+        self.tc = tc
+        self.log = LogFile(
+            channels={
+                "Fast": channel_table("Fast", tc, np.sin(tc / 300)),
+                "Gear": channel_table("Gear", tc, (tc // 1000) % 6, interpolate=False),
+            },
+            laps=pa.table(
+                {
+                    "num": pa.array([0, 1], type=pa.int32()),
+                    "start_time": pa.array([0, 4000], type=pa.int64()),
+                    "end_time": pa.array([4000, 9000], type=pa.int64()),
+                }
+            ),
+            metadata={},
+            file_name="test.xrk",
+        )
+
+    def test_timebase(self):
+        """Found once per timecodes array."""
+        tb = self.log.timebase("Fast")
+        assert tb is not None
+        self.assertEqual(tb.runs, 2)
+        self.assertIs(self.log.timebase("Fast"), tb)
+        self.assertEqual(len(self.log._timebases), 1)
+
+    def test_replaced_chunked_table(self):
+        """A replaced table (multi-chunk timecodes, keyed by id) isn't given a stale timebase."""
+        for i in range(20):
+            tc = np.arange(0, 1000, 10 + i)
+            table = channel_table("Chunked", tc, np.zeros(len(tc)))
+            self.log.channels["Chunked"] = pa.concat_tables([table.slice(0, 5), table.slice(5)])
+            tb = self.log.timebase("Chunked")
+            assert tb is not None
+            self.assertEqual(tb.period.tolist(), [10 + i])
+
+    def test_resample(self):
+        """Resampling with a timebase is the same as without."""
+        t = np.linspace(-100, 9500, 2000)
+        for name in ("Fast", "Gear"):
+            table = self.log.channels[name]
+            np.testing.assert_allclose(
+                resample_channel(table, t, self.log.timebase(name)), resample_channel(table, t)
+            )
+
+    def test_lap_stats(self):
+        """Lap boundaries are found through the timebase."""
+        stats = self.log.lap_stats(["Fast"])
+        self.assertEqual(stats.column("count").to_pylist(), [400, 400])
+
+    def test_decoded_multi_samples(self):
+        """An M message channel decodes to one run at its period."""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "session.xrk")
+            with open(path, "wb") as f:
+                f.write(b"".join(xrk_session()))
+            log = aim_xrk(path)
+        with mock.patch.object(Timebase, "from_timecodes") as from_timecodes:
+            tb = log.timebase("Steer")
+        # the decoder's runs, not found again
+        from_timecodes.assert_not_called()
+        assert tb is not None
+        self.assertEqual((tb.runs, tb.period.tolist()), (1, [20]))
+        np.testing.assert_array_equal(
+            tb.materialize(), log.channels["Steer"].column("timecodes").to_numpy()
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+"""Unit tests for the track database and track lookup from GPS fixes."""
+
+import importlib
+import os
+import struct
+import tempfile
+import unittest
+import numpy as np
+from libxrk.tracks import Track, TrackDatabase
+from .synthetic import LAT0, LON0, circuit, enu_to_ecef, enu_to_lla, sf_marker
+
+aim_xrk = importlib.import_module("libxrk.aim_xrk")
+
+
+def _marker(east, north):
+    lla = enu_to_lla(np.array([east]), np.array([north]))
+    return (float(lla.lat[0]), float(lla.long[0]))
+
+
+class TestTrackDatabase(unittest.TestCase):
+    """Tests for TrackDatabase lookup and persistence."""
+
+    def setUp(self):
+        self.db = TrackDatabase()
+        self.db.add(
+            Track("Circle", sf_marker(), sectors=[_marker(0.0, 100.0), _marker(-100.0, 0.0)])
+        )
+        # another layout of the same venue, 2km east
+        self.db.add(Track("Circle East", _marker(2100.0, 0.0)))
+        self.db.add(Track("Far Away", (LAT0 + 1.0, LON0 - 1.0)))
+        _, east, north, _, _ = circuit([60000])
+        self.fixes = enu_to_lla(east, north)
+
+    def test_match(self):
+        """Fixes on the circuit find its track, not the neighbouring layout."""
+        self.assertIs(self.db.match(self.fixes.lat, self.fixes.long), self.db.tracks["Circle"])
+        east = enu_to_lla(np.array([2050.0]), np.array([30.0]))
+        self.assertIs(self.db.match(east.lat, east.long), self.db.tracks["Circle East"])
+
+    def test_match_ignores_invalid_fixes(self):
+        """Fixes before GPS lock (0, 0 or nan) don't move the lookup."""
+        lat = np.concatenate(([0.0, np.nan, 0.0], self.fixes.lat))
+        long = np.concatenate(([0.0, np.nan, 0.0], self.fixes.long))
+        self.assertIs(self.db.match(lat, long), self.db.tracks["Circle"])
+        self.assertIsNone(self.db.match(np.zeros(10), np.zeros(10)))
+
+    def test_no_match(self):
+        """Fixes away from every track match nothing."""
+        far = enu_to_lla(np.array([0.0]), np.array([5000.0]))
+        self.assertIsNone(self.db.match(far.lat, far.long))
+        self.assertEqual(self.db.candidates(*_marker(0.0, 5000.0)), [])
+
+    def test_resolve(self):
+        """The TRK name is used when the fixes agree with it."""
+        lat, long = self.fixes.lat, self.fixes.long
+        circle = self.db.tracks["Circle"]
+        self.assertIs(self.db.resolve("Circle", lat, long), circle)
+        self.assertIs(self.db.resolve("Far Away", lat, long), circle)
+        self.assertIs(self.db.resolve("Unknown", lat, long), circle)
+        self.assertIs(self.db.resolve(None, lat, long), circle)
+        no_fix = np.array([])
+        self.assertIs(self.db.resolve("Far Away", no_fix, no_fix), self.db.tracks["Far Away"])
+
+    def test_save_load(self):
+        """Tracks round trip through the JSON file."""
+        self.db.tracks["Circle"].outline = np.column_stack((self.fixes.lat, self.fixes.long))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "tracks.json")
+            self.db.save(path)
+            loaded = TrackDatabase.load(path)
+        self.assertEqual(len(loaded), 3)
+        self.assertIn("Circle East", loaded)
+        track, orig = loaded.tracks["Circle"], self.db.tracks["Circle"]
+        self.assertEqual(track.start_finish, orig.start_finish)
+        self.assertEqual(track.sectors, orig.sectors)
+        np.testing.assert_array_equal(track.outline, orig.outline)
+        self.assertIsNone(loaded.tracks["Far Away"].outline)
+
+
+class TestTrackLaps(unittest.TestCase):
+    """Tests for GPS lap insert with and without a TRK message."""
+
+    def setUp(self):
+        timecodes, east, north, _, _ = circuit([60000, 58000, 61000])
+        XYZ = np.round(enu_to_ecef(east, north) * 100).astype(int)
+        self.gpsmsg = b"".join(
+            struct.pack("<iIIHxxiiiiiiiixxxB4x", t, 0, 0, 0, x, y, z, 100, 0, 0, 0, 100, 9)
+            for t, (x, y, z) in zip(timecodes.tolist(), XYZ.tolist())
+        )
+        self.last_time = int(timecodes[-1])
+        self.db = TrackDatabase()
+        self.db.add(Track("Circle", sf_marker()))
+
+    def _trk(self, name, sf):
+        tok = aim_xrk._tokdec("TRK")
+        content = {"name": name, "sf_lat": sf[0], "sf_long": sf[1]}
+        return {tok: [aim_xrk.Message(tok, 0, content)]}
+
+    def _laps(self, msg_by_type, tracks=None):
+        _, laps, track = aim_xrk._bg_gps_laps(
+            self.gpsmsg, msg_by_type, 0, self.last_time, (), tracks
+        )
+        return laps.column("start_time").to_pylist(), track
+
+    def test_missing_trk(self):
+        """Without TRK there are no GPS laps, unless the database has the track."""
+        self.assertEqual(self._laps({}), ([], None))
+        starts, track = self._laps({}, self.db)
+        self.assertEqual(starts, [0, 60000, 118000])
+        self.assertEqual(track.name, "Circle")
+
+    def test_wrong_trk(self):
+        """A TRK message for another venue is overridden by the database."""
+        starts, _ = self._laps(self._trk("Far Away", (LAT0 + 1.0, LON0)))
+        self.assertEqual(starts, [0])
+        starts, track = self._laps(self._trk("Far Away", (LAT0 + 1.0, LON0)), self.db)
+        self.assertEqual(starts, [0, 60000, 118000])
+        self.assertEqual(track.name, "Circle")
+
+
+if __name__ == "__main__":
+    unittest.main()